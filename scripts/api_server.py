@@ -0,0 +1,238 @@
+# scripts/api_server.py
+"""
+HTTP JSON service exposing LazyCook's search, generation, image and shopping-list steps.
+
+Requests are handled on a thread per connection. Query embeddings and CLIP scoring go
+through micro-batchers, so concurrent requests share forward passes of each model.
+
+Run with:
+    python -m scripts.api_server --port 8000
+
+Add `--fake-services` (and e.g. `--llm-latency lognormal:0.8,0.3`) to serve against local
+stand-ins for the LLM, txt2img, index and Gemini, e.g. for `scripts.load_test`.
+
+Endpoints:
+    GET  /health
+    GET  /metrics         Prometheus text (spans and counters; set LAZYCOOK_TRACING=1)
+    POST /search          {"question", "ingredients", "top_k"?}
+    POST /generate        {"question", "ingredients", "recipes"?}
+    POST /image           {"recipe": str or {"title", "ingredients", ...}, "count"?}
+                          -> "image_base64" encoded as config.IMAGE_DISPLAY_FORMAT (WebP by default)
+    GET  /shopping-list
+    POST /shopping-list   {"ingredients": [...], "message"?}
+"""
+
+import argparse
+import base64
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import config
+from src import rag
+from src.batching import MicroBatcher
+from src.context_builder import get_context_builder
+from src.deduplication import load_alias_map
+from src.fake_services import FakeBackends, add_fake_arguments
+from src.feedback_store import open_feedback_store
+from src.image_evaluation import load_clip_model, compute_image_text_similarities
+from src.image_generation import get_image_prompt_from_llm, render_image
+from src.metadata_store import open_metadata_store
+from src.popularity import open_popularity_prior
+from src.shopping_agent import create_shopping_agent
+from src.telemetry import configure_logging, telemetry
+from src.vector_index import open_vector_index
+from src.online_index import open_online_index
+from .pipelines import generate_validated_recipe
+
+
+class LazyCookService:
+    """Models and stores shared by all requests, loaded once at startup."""
+
+    def __init__(self, index=None, metadata_store=None):
+        """
+        Args:
+            index (optional): Vector index; defaults to `open_vector_index()`.
+            metadata_store (RecipeMetadataStore, optional): Defaults to the store at
+                config.RECIPE_METADATA_PATH (used only when `index` is not given either).
+        """
+        self.index = index if index is not None else open_vector_index()
+        self.metadata_store = metadata_store if index is not None else open_metadata_store(config.RECIPE_METADATA_PATH)
+        self.feedback_store = open_feedback_store(config.FEEDBACK_DB_PATH, config.FEEDBACK_JSON_PATH)
+        self.prior = open_popularity_prior(config.POPULARITY_PRIOR_PATH, self.feedback_store, self.metadata_store,
+                                           aliases=load_alias_map(config.RECIPE_ALIAS_PATH))
+        self.query_batcher = rag.enable_query_batching()
+        self.online = open_online_index(self.index, self.metadata_store, rag.encode_queries,
+                                        self.feedback_store, rag.get_ingredient_index())
+
+        self.clip_model, self.clip_processor = load_clip_model(config.CLIP_MODEL, config.DEVICE)
+        self.clip_batcher = MicroBatcher(
+            self._score_pairs,
+            max_batch_size=config.BATCH_MAX_SIZE,
+            max_wait_ms=config.BATCH_MAX_WAIT_MS,
+            name="clip-batcher",
+        )
+        self.image_pool = ThreadPoolExecutor(max_workers=config.IMAGE_GENERATION_COUNT, thread_name_prefix="txt2img")
+
+        self.shopping_agent = create_shopping_agent()
+        self.shopping_lock = threading.Lock()
+
+    def _score_pairs(self, pairs):
+        images, texts = zip(*pairs)
+        return compute_image_text_similarities(images, texts, self.clip_model, self.clip_processor)
+
+    def search(self, body: dict) -> dict:
+        recipes = rag.search_recipes(
+            body["question"], body["ingredients"], index=self.online.index,
+            top_k=int(body.get("top_k", config.TOP_K_RECIPES)),
+            prior=self.prior, metadata_store=self.online.metadata_store,
+        )
+        return {"recipes": recipes}
+
+    def generate(self, body: dict) -> dict:
+        recipes = body.get("recipes")
+        if recipes is None:
+            recipes = self.search(body)["recipes"]
+        recipe, ingredients_to_buy = generate_validated_recipe(body["question"], body["ingredients"], recipes, config,
+                                                               on_approved=self.online.add_recipe)
+        return {"recipe": recipe.model_dump(), "ingredients_to_buy": ingredients_to_buy, "retrieved": recipes}
+
+    def image(self, body: dict) -> dict:
+        description = get_context_builder().build_dish_description(body["recipe"])
+        count = int(body.get("count", config.IMAGE_GENERATION_COUNT))
+        prompt = get_image_prompt_from_llm(description, config.LLM_API_URL)
+        images = list(self.image_pool.map(lambda _: render_image(prompt, config.IMAGE_API_URL), range(count)))
+        scores = self.clip_batcher.map([(image.for_clip(config.CLIP_IMAGE_SIZE), description) for image in images])
+        best = max(range(len(images)), key=scores.__getitem__)
+
+        encoded = images[best].to_bytes(config.IMAGE_DISPLAY_FORMAT, config.IMAGE_DISPLAY_QUALITY)
+        return {
+            "prompt": prompt,
+            "scores": scores,
+            "best_index": best,
+            "image_format": config.IMAGE_DISPLAY_FORMAT.lower(),
+            "image_base64": base64.b64encode(encoded).decode("ascii"),
+        }
+
+    def shopping_list(self, body: dict = None) -> dict:
+        with self.shopping_lock:
+            if body is not None:
+                ingredients = body["ingredients"]
+                message, _ = self.shopping_agent.process_ingredients(ingredients, body.get("message"))
+                return {"message": message, "items": self.shopping_agent.get_current_list()}
+            return {"items": self.shopping_agent.get_current_list()}
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "query_batches": self.query_batcher.batches,
+            "query_mean_batch_size": self.query_batcher.mean_batch_size,
+            "clip_batches": self.clip_batcher.batches,
+            "clip_mean_batch_size": self.clip_batcher.mean_batch_size,
+            "online_recipes_added": self.online.added,
+            "online_delta_rows": len(self.online.metadata_store.delta),
+            "telemetry": telemetry.snapshot() if telemetry.enabled else None,
+        }
+
+
+def make_handler(service: LazyCookService):
+    """Build a request handler class bound to the shared service."""
+    post_routes = {
+        "/search": service.search,
+        "/generate": service.generate,
+        "/image": service.image,
+        "/shopping-list": service.shopping_list,
+    }
+    get_routes = {
+        "/health": service.health,
+        "/shopping-list": service.shopping_list,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: dict):
+            data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_text(self, status: int, text: str, content_type: str):
+            data = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, handler, *args):
+            try:
+                self._send(200, handler(*args))
+            except KeyError as e:
+                self._send(400, {"error": f"missing field {e}"})
+            except Exception as e:
+                traceback.print_exc()
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/metrics":
+                self._send_text(200, telemetry.prometheus_text(), "text/plain; version=0.0.4")
+                return
+            handler = get_routes.get(self.path.split("?")[0])
+            if handler is None:
+                self._send(404, {"error": "not found"})
+                return
+            self._dispatch(handler)
+
+        def do_POST(self):
+            handler = post_routes.get(self.path.split("?")[0])
+            if handler is None:
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                self._send(400, {"error": "invalid JSON body"})
+                return
+            self._dispatch(handler, body)
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve LazyCook over HTTP.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--fake-services", action="store_true",
+                        help="Use local stand-ins for the LLM, txt2img, vector index and Gemini")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    configure_logging()
+    fakes = FakeBackends.from_args(args).start() if args.fake_services else None
+    print("Loading models...")
+    service = LazyCookService(*((fakes.index, fakes.metadata_store) if fakes else ()))
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"LazyCook API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.online.close()
+        service.feedback_store.close()
+        if fakes is not None:
+            fakes.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# scripts/benchmark_pipeline.py
+"""
+Per-stage benchmark of the LazyCook pipeline against local stand-ins for LM Studio, the
+SD WebUI, Pinecone and Gemini (see src.fake_services), so it runs on a plain machine.
+
+Run with:
+    python -m scripts.benchmark_pipeline --repeat 10 --output benchmark.json
+    python -m scripts.benchmark_pipeline --compare benchmark.json   # exit code 1 on regression
+
+The embedding and CLIP models are the real local models; only remote services are faked.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+from src import config
+from src.fake_services import FakeReviewer, FakeServices, FakeVectorIndex, add_fake_arguments, fake_gemini
+from src.telemetry import summarize, telemetry
+
+SAMPLE_QUERIES = [
+    ("something cozy for a rainy evening", "potatoes, onions, cheddar"),
+    ("a quick vegetarian lunch, no nuts", "chickpeas, spinach, lemon"),
+    ("an easy chicken dinner", "chicken breast, rice, garlic"),
+    ("a sweet breakfast", "eggs, milk, flour, bananas"),
+]
+
+
+def time_stage(fn: Callable[[int], object], repeat: int, warmup: int = 1) -> List[float]:
+    """Call `fn(i)` `warmup` times untimed, then `repeat` times timed; return the latencies."""
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=config.ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Stages whose p50 latency grew by more than `tolerance` (a fraction) over the baseline."""
+    regressions = []
+    for stage, stats in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get("p50_ms") or "p50_ms" not in stats:
+            continue
+        change = stats["p50_ms"] / old["p50_ms"] - 1.0
+        if change > tolerance:
+            regressions.append(f"{stage}: p50 {old['p50_ms']:.1f}ms -> {stats['p50_ms']:.1f}ms (+{change:.0%})")
+    return regressions
+
+
+def benchmark_pipeline():
+    """
+    Time every pipeline stage with the external services faked:
+
+    1. `load_and_preprocess_data` on the sample CSV
+    2. `get_keywords_from_llm` and `search_recipes` (fake index, real embedding model)
+    3. `generate_validated_recipe` (fake LLM and reviewer)
+    4. CLIP scoring and `image_pipeline` (fake txt2img, real CLIP model)
+    5. `ShoppingListAgent.process_ingredients` (fake Gemini)
+
+    Results are printed as a table and written as JSON for regression checks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages against local fake services.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per stage")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls per stage")
+    parser.add_argument("--stages", default="all", help="Comma-separated stage names, or 'all'")
+    parser.add_argument("--data", default=os.path.join(config.ROOT_DIR, "data", "100recipes.csv"))
+    parser.add_argument("--output", default=None, help="Write the JSON results here")
+    parser.add_argument("--compare", default=None, help="Baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown vs. the baseline")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    # Spans and counters (e.g. LLM tokens/s) go into the report
+    telemetry.configure(enabled=True)
+    width, height = (int(v) for v in args.image_size.split("x"))
+    services = FakeServices(args.llm_latency, args.image_latency, image_size=(width, height))
+    config.LLM_API_URL, config.IMAGE_API_URL = services.llm_url, services.image_url
+    config.LLM_BACKENDS, config.IMAGE_BACKENDS = [services.llm_url], [services.image_url]
+    reviewer = FakeReviewer(args.approve_rate, args.reviewer_latency)
+
+    # Imported after the endpoints are redirected; rag also loads the embedding model here
+    from src.data_processing import load_and_preprocess_data
+    from src.image_evaluation import compute_image_text_similarity, load_clip_model
+    from src.image_generation import create_image_from_prompt
+    from src.llm_interaction import get_keywords_from_llm
+    from src.rag import search_recipes
+    from src.shopping_agent import ShoppingListAgent
+    from scripts.pipelines import generate_validated_recipe, image_pipeline
+
+    df = load_and_preprocess_data(args.data)
+    index = FakeVectorIndex(
+        [{"id": int(r.id), "title": r.title, "ingredients": r.ingredients, "directions": r.directions}
+         for r in df.itertuples()],
+        latency=args.index_latency,
+    )
+    query = lambda i: SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]
+    retrieved = search_recipes(*query(0), index=index, top_k=config.TOP_K_RECIPES)
+    description = "Cheddar Potato Bake with potatoes, onions, cheddar"
+    clip = {}
+    tmp = tempfile.TemporaryDirectory()
+
+    def clip_model():
+        if not clip:
+            clip["model"], clip["processor"] = load_clip_model(config.CLIP_MODEL, config.DEVICE)
+            clip["image"] = create_image_from_prompt("a watercolor painting of a potato bake", config.IMAGE_API_URL)
+        return clip["model"], clip["processor"]
+
+    def shopping(i):
+        agent = ShoppingListAgent(os.path.join(tmp.name, f"shopping_{i}.txt"), api_key="fake")
+        agent.process_ingredients(["olive oil", "pepper", f"item {i}"])
+
+    stages = {
+        "load_and_preprocess_data": lambda i: load_and_preprocess_data(args.data),
+        "get_keywords_from_llm": lambda i: get_keywords_from_llm(query(i)[0], config.LLM_API_URL, config.LLM_MODEL),
+        "search_recipes": lambda i: search_recipes(*query(i), index=index, top_k=config.TOP_K_RECIPES),
+        "generate_validated_recipe": lambda i: generate_validated_recipe(*query(i), retrieved, config),
+        "clip_scoring": lambda i: compute_image_text_similarity(clip["image"], description, *clip_model()),
+        "image_pipeline": lambda i: image_pipeline(description, config, *clip_model(),
+                                                   num_iterations=config.IMAGE_GENERATION_COUNT),
+        "shopping_agent": shopping,
+    }
+    selected = list(stages) if args.stages == "all" else args.stages.split(",")
+
+    results = {}
+    with fake_gemini(reviewer, args.agent_latency):
+        for name in selected:
+            if name.startswith("clip") or name == "image_pipeline":
+                clip_model()
+            results[name] = summarize(time_stage(stages[name], args.repeat, args.warmup))
+    services.close()
+    tmp.cleanup()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count(), "device": config.DEVICE},
+        "settings": {k: v for k, v in vars(args).items() if k not in {"output", "compare"}},
+        "fake_calls": {**services.calls, "review": reviewer.calls},
+        "stages": results,
+        "telemetry": telemetry.snapshot(),
+    }
+
+    print(f"\n{'stage':<28}{'n':>4}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}   (ms)")
+    for name, stats in results.items():
+        print(f"{name:<28}{stats['n']:>4}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_results(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo stage slower than the baseline by more than {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    benchmark_pipeline()
@@ -0,0 +1,283 @@
+# scripts/benchmark_retrieval.py
+"""
+Retrieval quality-vs-latency benchmark. Ground truth is exact inner-product search with
+the reference configuration (first model, first expansion, blended 0.7/0.3 query as in
+`search_recipes`); every other configuration is scored against it.
+
+Run with:
+    python -m scripts.benchmark_retrieval --synthetic 20000 --backends exact,float16,int8,ivf:4,ivf:16,sharded:2
+    python -m scripts.benchmark_retrieval --expansions local,none --models avsolatorio/GIST-Embedding-v0,all-MiniLM-L6-v2
+
+Backends:
+    exact       LocalVectorIndex (float32 memmap), the production local backend
+    sharded:N   ShardedVectorIndex over N worker processes
+    ivf:P       IVFIndex probing P lists
+    float16     exact search over float16 vectors
+    int8        exact search over int8 vectors with a per-row scale
+
+Expansions are "local", "llm" (needs LM Studio, or --fake-llm) and "none" (no enriched
+query). Ingredient filters are not applied, so all configurations score the same rows.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src import config
+from src.ann_index import IVFIndex
+from src.data_processing import load_and_preprocess_data, make_full_text, parse_list_field
+from src.telemetry import summarize
+from src.vector_index import LocalVectorIndex
+from .load_test import load_seed_queries
+
+
+class QuantizedIndex:
+    """Exact search over vectors stored as float16, or int8 with one scale per row."""
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, dtype: str, chunk_rows: int = 65536):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.chunk_rows = chunk_rows
+        if dtype == "float16":
+            self.vectors, self.scales = vectors.astype(np.float16), None
+        else:
+            self.scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12).astype(np.float32) / 127.0
+            self.vectors = np.round(vectors / self.scales[:, None]).astype(np.int8)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.ids.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.vectors.shape[1])
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), self.chunk_rows):
+            chunk = self.vectors[start:start + self.chunk_rows].astype(np.float32) @ queries.T
+            if self.scales is not None:
+                chunk *= self.scales[start:start + self.chunk_rows, None]
+            scores[:, start:start + len(chunk)] = chunk.T
+        return top_k(scores, self.ids, k)
+
+
+def top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(ids, scores) of the k best columns of `scores` (shape (q, n)), best first."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return ids[np.take_along_axis(top, order, axis=1)], np.take_along_axis(top_scores, order, axis=1)
+
+
+def synthetic_corpus(df, n: int, seed: int = 0) -> Tuple[np.ndarray, List[str]]:
+    """
+    `n` recipe texts recombined from the dataset: the title of one recipe, the ingredients
+    of two others and the directions of a fourth, so the texts keep realistic wording.
+    """
+    rng = random.Random(seed)
+    titles = df["title"].tolist()
+    ner = [parse_list_field(v) for v in df["NER"]]
+    directions = [parse_list_field(v) for v in df["directions"]]
+    texts = []
+    for _ in range(n):
+        a, b = rng.sample(ner, 2)
+        ingredients = rng.sample(a, len(a) // 2 + 1) + rng.sample(b, len(b) // 2 + 1)
+        texts.append(make_full_text(rng.choice(titles), ingredients, rng.choice(directions)))
+    ids = np.arange(n, dtype=np.int64) + int(df["id"].max()) + 1
+    return ids, texts
+
+
+def load_corpora(args) -> Dict[str, Tuple[np.ndarray, List[str]]]:
+    """The sample dataset and, if requested, a sampled or synthetic larger corpus."""
+    df = load_and_preprocess_data(args.data)
+    corpora = {os.path.basename(args.data): (df["id"].to_numpy(np.int64), df["full_text"].tolist())}
+    if args.corpus:
+        large = load_and_preprocess_data(args.corpus)
+        if args.sample and args.sample < len(large):
+            large = large.sample(args.sample, random_state=args.seed)
+        corpora[f"{os.path.basename(args.corpus)}[{len(large)}]"] = \
+            (large["id"].to_numpy(np.int64), large["full_text"].tolist())
+    elif args.synthetic:
+        corpora[f"synthetic[{args.synthetic}]"] = synthetic_corpus(df, args.synthetic, args.seed)
+    return corpora
+
+
+def build_backend(spec: str, ids: np.ndarray, vectors: np.ndarray, workdir: str):
+    """Build the index named by `spec`; returns (index, build seconds, memory in bytes)."""
+    start = time.perf_counter()
+    name, _, param = spec.partition(":")
+    if name in ("exact", "sharded"):
+        path = os.path.join(workdir, f"{spec.replace(':', '_')}_{len(ids)}")
+        index = LocalVectorIndex.build(path, ids, vectors)
+        if name == "sharded":
+            from src.sharded_index import ShardedVectorIndex
+
+            index = ShardedVectorIndex(path, int(param or 2))
+            index.search(vectors[:1], 1)   # start the workers
+        memory = vectors.nbytes + ids.nbytes
+    elif name == "ivf":
+        index = IVFIndex(vectors.shape[1], nprobe=int(param or 8), train_threshold=min(4096, len(ids)))
+        index.add(ids, vectors)
+        memory = vectors.nbytes + ids.nbytes + (index.centroids.nbytes if index.is_trained else 0)
+    elif name in ("float16", "int8"):
+        index = QuantizedIndex(ids, vectors, name)
+        memory = index.nbytes
+    else:
+        raise ValueError(f"Unknown backend {spec!r}")
+    return index, time.perf_counter() - start, memory
+
+
+def search_one(index, vector: np.ndarray, k: int) -> np.ndarray:
+    """Ids of the top-k results for one query, as `search_recipes` issues them."""
+    if isinstance(index, IVFIndex):
+        return index.search(vector, k)[0]
+    return index.search(vector[None, :], k)[0][0]
+
+
+def recall_at_k(result: np.ndarray, truth: np.ndarray) -> float:
+    return len(set(result.tolist()) & set(truth.tolist())) / max(len(truth), 1)
+
+
+def kendall_tau(result: np.ndarray, truth: np.ndarray) -> float:
+    """Kendall rank correlation of the order of the results shared with the ground truth."""
+    rank = {i: r for r, i in enumerate(result.tolist())}
+    shared = [rank[i] for i in truth.tolist() if i in rank]
+    n = len(shared)
+    if n < 2:
+        return 1.0
+    concordant = sum(1 if shared[a] < shared[b] else -1 for a in range(n) for b in range(a + 1, n))
+    return concordant / (n * (n - 1) / 2)
+
+
+def query_vectors(model, queries: List[Tuple[str, str]], expansions: List[str]) -> Tuple[np.ndarray, float]:
+    """Blended query vectors as in `search_recipes`, and the mean embedding time per query."""
+    from src.rag import blend_query_vectors
+
+    start = time.perf_counter()
+    vectors = []
+    for (question, ingredients), expansion in zip(queries, expansions):
+        if expansion is None:
+            vectors.append(model.encode([question + " " + ingredients], show_progress_bar=False)[0])
+        else:
+            vector1, vector2 = model.encode([question + " " + ingredients, expansion], show_progress_bar=False)
+            vectors.append(blend_query_vectors(vector1, vector2))
+    return np.asarray(vectors, dtype=np.float32), (time.perf_counter() - start) / max(len(queries), 1)
+
+
+def expand_all(queries: List[Tuple[str, str]], expansion: str) -> Tuple[List[str], float]:
+    """Enriched query text per query ("none": no enrichment), and the mean time per query."""
+    if expansion == "none":
+        return [None] * len(queries), 0.0
+    from src.rag import expand_query
+
+    start = time.perf_counter()
+    texts = [expand_query(question, ingredients, expansion) for question, ingredients in queries]
+    return texts, (time.perf_counter() - start) / max(len(queries), 1)
+
+
+def benchmark_retrieval():
+    """
+    Build ground truth per corpus with exact search over the reference configuration,
+    then report recall@k, Kendall tau, search QPS, end-to-end latency per query
+    (expansion + embedding + search), build time and memory for every
+    (model, expansion, backend) combination in one table.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality against latency.")
+    parser.add_argument("--data", default=os.path.join(config.ROOT_DIR, "data", "100recipes.csv"))
+    parser.add_argument("--corpus", default=None, help="Larger dataset (CSV/Arrow/Parquet) to sample from")
+    parser.add_argument("--sample", type=int, default=20000, help="Rows sampled from --corpus")
+    parser.add_argument("--synthetic", type=int, default=0, help="Size of a synthetic corpus recombined from --data")
+    parser.add_argument("--models", default=config.EMBEDDING_MODEL, help="Comma-separated embedding models")
+    parser.add_argument("--expansions", default=config.QUERY_EXPANSION + ",none",
+                        help="Comma-separated query expansions: local, llm, none")
+    parser.add_argument("--backends", default="exact,float16,int8,ivf:4,ivf:16")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-llm", default=None, metavar="LATENCY",
+                        help="Serve LLM expansion from the local fake LLM with this latency (see src.fake_services)")
+    parser.add_argument("--output", default=None, help="Write the JSON results here")
+    args = parser.parse_args()
+
+    services = None
+    if args.fake_llm is not None:
+        from src.fake_services import FakeServices
+
+        services = FakeServices(llm_latency=args.fake_llm, image_latency="0")
+        config.LLM_API_URL = services.llm_url
+        config.LLM_BACKENDS = [services.llm_url]
+
+    from src.embedding_utils import load_embedding_model
+    from src.profiling import model_memory_report
+
+    corpora = load_corpora(args)
+    queries = load_seed_queries(config.FEEDBACK_JSON_PATH, args.data, args.queries, args.seed)
+    models = args.models.split(",")
+    expansions = args.expansions.split(",")
+    backends = args.backends.split(",")
+    expanded = {}
+    for expansion in expansions:
+        expanded[expansion] = expand_all(queries, expansion)
+        print(f"Expansion {expansion}: {expanded[expansion][1] * 1000:.1f} ms/query")
+
+    rows = []
+    workdir = tempfile.TemporaryDirectory()
+    truth = {}
+    for model_name in models:
+        model = load_embedding_model(model_name, config.DEVICE)
+        model_bytes = sum(m["parameter_bytes"] + m["buffer_bytes"] for m in model_memory_report()
+                          if m["model"] == f"embedding:{model_name}")
+        for corpus_name, (ids, texts) in corpora.items():
+            start = time.perf_counter()
+            vectors = np.asarray(model.encode(texts, batch_size=128, show_progress_bar=False), dtype=np.float32)
+            print(f"{model_name} on {corpus_name}: embedded {len(texts)} recipes in {time.perf_counter() - start:.1f}s")
+            indexes = [(spec, *build_backend(spec, ids, vectors, workdir.name)) for spec in backends]
+            for expansion in expansions:
+                texts_expanded, expand_seconds = expanded[expansion]
+                q_vectors, embed_seconds = query_vectors(model, queries, texts_expanded)
+                exact_ids = top_k(q_vectors @ vectors.T, ids, args.top_k)[0]
+                # The first (model, expansion) pair is the reference for this corpus
+                reference = truth.setdefault(corpus_name, exact_ids)
+                for spec, index, build_seconds, memory in indexes:
+                    latencies, results = [], []
+                    for vector in q_vectors:
+                        t = time.perf_counter()
+                        results.append(search_one(index, vector, args.top_k))
+                        latencies.append(time.perf_counter() - t)
+                    stats = summarize(latencies)
+                    rows.append({
+                        "corpus": corpus_name, "model": model_name, "expansion": expansion, "backend": spec,
+                        "recall": float(np.mean([recall_at_k(r, t) for r, t in zip(results, reference)])),
+                        "kendall_tau": float(np.mean([kendall_tau(r, t) for r, t in zip(results, reference)])),
+                        "qps": len(latencies) / sum(latencies),
+                        "search_p50_ms": stats["p50_ms"],
+                        "end_to_end_ms": (expand_seconds + embed_seconds) * 1000 + stats["mean_ms"],
+                        "build_s": build_seconds,
+                        "index_mb": memory / 2 ** 20,
+                        "model_mb": model_bytes / 2 ** 20,
+                    })
+            for _, index, _, _ in indexes:
+                if hasattr(index, "close"):
+                    index.close()
+    workdir.cleanup()
+    if services is not None:
+        services.close()
+
+    print(f"\n{'corpus':<22}{'model':<30}{'expansion':<10}{'backend':<10}{f'recall@{args.top_k}':>10}"
+          f"{'tau':>7}{'qps':>10}{'p50 ms':>9}{'e2e ms':>9}{'build s':>9}{'index MB':>10}{'model MB':>10}")
+    for r in rows:
+        print(f"{r['corpus'][:21]:<22}{r['model'][-29:]:<30}{r['expansion']:<10}{r['backend']:<10}"
+              f"{r['recall']:>10.3f}{r['kendall_tau']:>7.2f}{r['qps']:>10.0f}{r['search_p50_ms']:>9.2f}"
+              f"{r['end_to_end_ms']:>9.1f}{r['build_s']:>9.2f}{r['index_mb']:>10.1f}{r['model_mb']:>10.0f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "queries": len(queries), "results": rows}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    benchmark_retrieval()
@@ -0,0 +1,71 @@
+# scripts/benchmark_sharded_search.py
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.sharded_index import ShardedVectorIndex
+from src.vector_index import LocalVectorIndex
+
+
+def benchmark_sharded_search():
+    """
+    Measure batched search throughput (queries/s) of the local index for each shard count
+    and batch size, and check that every sharded configuration returns the same top-k ids
+    as the single-process index.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark sharded scatter-gather search.")
+    parser.add_argument("--index", default=None,
+                        help="Path prefix of a built local index (default: config.RECIPE_VECTOR_INDEX_PATH)")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Benchmark a random index with this many rows instead")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of the synthetic index")
+    parser.add_argument("--shards", default=f"1,2,4,{os.cpu_count() or 1}")
+    parser.add_argument("--batch-sizes", default="1,16,64")
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tmp = None
+    if args.synthetic:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "synthetic")
+        vectors = rng.standard_normal((args.synthetic, args.dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        LocalVectorIndex.build(path, np.arange(args.synthetic), vectors)
+    else:
+        from src import config
+        path = args.index or config.RECIPE_VECTOR_INDEX_PATH
+
+    local = LocalVectorIndex(path)
+    queries = rng.standard_normal((args.queries, local.dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    expected, _ = local.search(queries, args.top_k)
+    print(f"{len(local)} rows, dim {local.dim}, {args.queries} queries, top-{args.top_k}")
+
+    baseline = {}   # single-process q/s per batch size
+    for n_shards in sorted({int(s) for s in args.shards.split(",")}):
+        index = local if n_shards == 1 else ShardedVectorIndex(path, n_shards)
+        index.search(queries[:1], args.top_k)   # start workers and map the file
+        for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+            start = time.perf_counter()
+            found = np.concatenate([index.search(queries[i:i + batch_size], args.top_k)[0]
+                                    for i in range(0, len(queries), batch_size)])
+            qps = len(queries) / (time.perf_counter() - start)
+            baseline.setdefault(batch_size, qps)
+            same = np.mean([set(a) == set(b) for a, b in zip(found, expected)])
+            print(f"shards={n_shards:<3} batch={batch_size:<4} {qps:9.1f} q/s "
+                  f"speedup={qps / baseline[batch_size]:5.2f}x identical={same:.0%}")
+        if n_shards > 1:
+            index.close()
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    benchmark_sharded_search()
@@ -0,0 +1,46 @@
+# scripts/build_ingredient_index.py
+
+import argparse
+import os
+import time
+
+from src import config
+from src.data_processing import load_and_preprocess_data, load_recipe_table
+from src.ingredient_filter import IngredientIndex, extract_constraints
+
+
+def build_ingredient_index():
+    """
+    Build the per-ingredient recipe bitmaps without re-embedding the dataset.
+    Steps:
+    1. Loads the id and NER columns, from the columnar table if present, else the CSV.
+    2. Builds one roaring bitmap of recipe ids per normalized ingredient name and saves them.
+    3. Reports size, build time and a sample filter.
+    """
+    parser = argparse.ArgumentParser(description="Build per-ingredient recipe id bitmaps from NER.")
+    parser.add_argument("--data", default=None, help="Recipe .arrow/.parquet table or CSV (default: table if present, else CSV)")
+    parser.add_argument("--out", default=config.INGREDIENT_INDEX_PATH, help="Output .npz file")
+    args = parser.parse_args()
+
+    path = args.data or (config.RECIPE_TABLE_PATH if os.path.exists(config.RECIPE_TABLE_PATH) else config.RECIPE_DATASET_PATH)
+    print(f"Loading ids and NER from {path}...")
+    if path.endswith(".csv"):
+        # Same ids as scripts/recipe_embedding_P.py; near-duplicate ids are not in the vector index anyway
+        df = load_and_preprocess_data(path)
+    else:
+        df = load_recipe_table(path, columns=["id", "NER"])
+
+    start = time.perf_counter()
+    index = IngredientIndex.build(df["id"], df["NER"])
+    index.save(args.out)
+    print(f"Indexed {len(index.terms)} ingredients over {len(df)} recipes in {time.perf_counter() - start:.1f}s "
+          f"({index.nbytes / 1e6:.1f} MB), saved to {args.out}")
+
+    sample = "something with chicken, no nuts, I'm allergic to shellfish"
+    start = time.perf_counter()
+    recipe_filter = index.build_filter(extract_constraints(sample))
+    print(f"'{sample}' -> {recipe_filter} ({(time.perf_counter() - start) * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    build_ingredient_index()
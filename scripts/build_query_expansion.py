@@ -0,0 +1,53 @@
+# scripts/build_query_expansion.py
+
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from src import config
+from src.data_processing import load_recipe_table
+from src.query_expansion import QueryExpander
+
+
+def build_query_expansion():
+    """
+    Offline mining of the local query expander.
+    Steps:
+    1. Loads only the title and NER columns, from the columnar table if present, else the CSV.
+    2. Counts ingredient/title-word co-occurrence per recipe and keeps the top PMI neighbours per term.
+    3. Saves the expander and reports build time and the latency of a sample expansion.
+    """
+    parser = argparse.ArgumentParser(description="Build the PMI co-occurrence query expander.")
+    parser.add_argument("--data", default=None, help="Recipe .arrow/.parquet table or CSV (default: table if present, else CSV)")
+    parser.add_argument("--out", default=config.QUERY_EXPANSION_PATH, help="Output .npz file")
+    parser.add_argument("--min-count", type=int, default=5, help="Minimum recipes a term must appear in")
+    parser.add_argument("--min-pair-count", type=int, default=3, help="Minimum co-occurrences for a neighbour")
+    parser.add_argument("--neighbors", type=int, default=20, help="Neighbours kept per term")
+    args = parser.parse_args()
+
+    path = args.data or (config.RECIPE_TABLE_PATH if os.path.exists(config.RECIPE_TABLE_PATH) else config.RECIPE_DATASET_PATH)
+    print(f"Loading titles and NER from {path}...")
+    if path.endswith(".csv"):
+        df = pd.read_csv(path, usecols=["title", "NER"])
+    else:
+        df = load_recipe_table(path, columns=["title", "NER"])
+
+    start = time.perf_counter()
+    expander = QueryExpander.build(
+        df["title"].fillna("").tolist(), df["NER"].tolist(),
+        min_count=args.min_count, min_pair_count=args.min_pair_count, n_neighbors=args.neighbors,
+    )
+    print(f"Mined {len(expander.vocab)} terms from {len(df)} recipes in {time.perf_counter() - start:.1f}s.")
+    expander.save(args.out)
+    print(f"Saved query expander to {args.out}")
+
+    sample = "something warm with chicken"
+    start = time.perf_counter()
+    keywords = expander.expand(sample, "rice, onion")
+    print(f"'{sample}' -> {', '.join(keywords)} ({(time.perf_counter() - start) * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    build_query_expansion()
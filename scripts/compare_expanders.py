@@ -0,0 +1,72 @@
+# scripts/compare_expanders.py
+
+import argparse
+import json
+import time
+
+from src import config
+from src.rag import expand_query, search_recipes
+from src.vector_index import open_vector_index
+
+
+def load_queries(path: str) -> list:
+    """Read (question, ingredients) pairs from a text file ("question | ingredients" per line) or the feedback JSON."""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [(e["user_query"], e.get("user_ingredients", "")) for e in json.load(f) if e.get("user_query")]
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                question, _, ingredients = line.partition("|")
+                queries.append((question.strip(), ingredients.strip()))
+    return queries
+
+
+def compare_expanders():
+    """
+    Compare the local PMI expander with the LLM expander on the same queries.
+    Reports, per query and on average, expansion latency and the overlap of the
+    top-k retrieved recipe ids (overlap@k and Jaccard) between the two expanders.
+    """
+    parser = argparse.ArgumentParser(description="Compare local and LLM query expansion.")
+    parser.add_argument("--queries", default=config.FEEDBACK_JSON_PATH,
+                        help="Text file with 'question | ingredients' lines, or the feedback JSON")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    index = open_vector_index()
+    queries = load_queries(args.queries)
+    totals = {"local_ms": 0.0, "llm_ms": 0.0, "overlap": 0.0, "jaccard": 0.0}
+
+    for question, ingredients in queries:
+        row = {}
+        for name in ("local", "llm"):
+            start = time.perf_counter()
+            keywords = expand_query(question, ingredients, expansion=name)
+            row[f"{name}_ms"] = (time.perf_counter() - start) * 1000
+            row[name] = keywords
+        # Retrieval with each expander (search_recipes re-expands; the local one is sub-millisecond)
+        ids = {
+            name: {r["id"] for r in search_recipes(question, ingredients, index, top_k=args.top_k, expansion=name)}
+            for name in ("local", "llm")
+        }
+        shared = len(ids["local"] & ids["llm"])
+        union = len(ids["local"] | ids["llm"]) or 1
+        row["overlap"] = shared / args.top_k
+        row["jaccard"] = shared / union
+        for key in totals:
+            totals[key] += row[key]
+        print(f"{question!r}: overlap@{args.top_k}={row['overlap']:.2f} jaccard={row['jaccard']:.2f} "
+              f"local={row['local_ms']:.2f}ms llm={row['llm_ms']:.0f}ms")
+        print(f"    local: {row['local']}")
+        print(f"    llm:   {row['llm']}")
+
+    n = max(len(queries), 1)
+    print(f"\n{len(queries)} queries: mean overlap@{args.top_k}={totals['overlap'] / n:.2f}, "
+          f"mean jaccard={totals['jaccard'] / n:.2f}, "
+          f"mean latency local={totals['local_ms'] / n:.2f}ms llm={totals['llm_ms'] / n:.0f}ms")
+
+
+if __name__ == "__main__":
+    compare_expanders()
@@ -0,0 +1,33 @@
+# scripts/convert_dataset.py
+
+import argparse
+import time
+from src import config
+from src.data_processing import convert_csv_to_columnar, load_recipe_table
+
+
+def convert_dataset():
+    """
+    One-time conversion of the recipe CSV into a columnar Arrow/Parquet file.
+    Steps:
+    1. Streams the CSV in chunks, parsing the JSON-string list columns once.
+    2. Writes native list columns, a precomputed 'full_text' column and stable integer ids.
+    3. Reloads the id and title columns to report the projected read time.
+    """
+    parser = argparse.ArgumentParser(description="Convert the recipe CSV to a columnar file.")
+    parser.add_argument("--csv", default=config.RECIPE_DATASET_PATH, help="Source CSV file")
+    parser.add_argument("--out", default=config.RECIPE_TABLE_PATH, help="Output .arrow or .parquet file")
+    args = parser.parse_args()
+
+    print(f"Converting {args.csv} -> {args.out}...")
+    start = time.perf_counter()
+    rows = convert_csv_to_columnar(args.csv, args.out)
+    print(f"Wrote {rows} recipes in {time.perf_counter() - start:.1f}s.")
+
+    start = time.perf_counter()
+    titles = load_recipe_table(args.out, columns=["id", "title"])
+    print(f"Loaded {len(titles)} ids and titles in {time.perf_counter() - start:.3f}s.")
+
+
+if __name__ == "__main__":
+    convert_dataset()
@@ -0,0 +1,339 @@
+# scripts/load_test.py
+"""
+Load generator for sizing a LazyCook deployment.
+
+Replays question/ingredient pairs seeded from the feedback log against either the
+in-process pipeline (the background job manager used by the Streamlit app) or the HTTP
+API, at a target request rate (open loop, Poisson arrivals) or a fixed number of
+concurrent users (closed loop). By default the external services are local fakes with
+configurable latency distributions (see src.fake_services).
+
+Run with:
+    python -m scripts.load_test --rate 0.5,1,2,4 --duration 60 --workers 2 --llm-latency lognormal:0.8,0.3
+    python -m scripts.load_test --concurrency 1,2,4,8 --target http --url http://localhost:8000
+
+Reports throughput, queueing delay and p50/p95/p99 latency per stage for every load
+level, and the saturation point: the highest level the configuration still keeps up with.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import requests
+
+from src import config
+from src.data_processing import parse_list_field
+from src.fake_services import FakeBackends, add_fake_arguments
+from src.telemetry import summarize, telemetry
+from .benchmark_pipeline import SAMPLE_QUERIES
+
+
+def load_seed_queries(feedback_path: str, data_path: str, count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Build `count` realistic (question, ingredients) pairs.
+
+    Questions come from the feedback log (plus a few built-in samples); ingredients are
+    either the user's own or 3-5 ingredients of a random dataset recipe, so the requests
+    share the wording of real users without all being identical.
+    """
+    rng = random.Random(seed)
+    pairs = list(SAMPLE_QUERIES)
+    if os.path.exists(feedback_path):
+        with open(feedback_path, "r", encoding="utf-8") as f:
+            pairs += [(e["user_query"], e.get("user_ingredients", "")) for e in json.load(f) if e.get("user_query")]
+    pantries = []
+    if os.path.exists(data_path):
+        import pandas as pd
+
+        pantries = [parse_list_field(ner) for ner in pd.read_csv(data_path, usecols=["NER"])["NER"]]
+        pantries = [p for p in pantries if len(p) >= 3]
+
+    queries = []
+    for _ in range(count):
+        question, ingredients = rng.choice(pairs)
+        if pantries and rng.random() < 0.5:
+            pantry = rng.choice(pantries)
+            ingredients = ", ".join(rng.sample(pantry, min(len(pantry), rng.randint(3, 5))))
+        queries.append((question, ingredients))
+    return queries
+
+
+class PipelineTarget:
+    """Runs `recipe_job` on a JobManager, like the Streamlit app; stages come from the job."""
+
+    def __init__(self, workers: int, fakes: FakeBackends = None, image: bool = True):
+        from scripts.pipelines import RECIPE_JOB_STAGES, recipe_job
+        from src.image_evaluation import load_clip_model
+        from src.jobs import JobManager
+        from src.metadata_store import open_metadata_store
+        from src.online_index import open_online_index
+        from src.rag import encode_queries, get_ingredient_index
+        from src.vector_index import open_vector_index
+
+        index = fakes.index if fakes else open_vector_index()
+        metadata_store = fakes.metadata_store if fakes else open_metadata_store(config.RECIPE_METADATA_PATH)
+        self.online = open_online_index(index, metadata_store, encode_queries, None, get_ingredient_index())
+        self.clip_model, self.clip_processor = load_clip_model(config.CLIP_MODEL, config.DEVICE) if image else (None, None)
+        self.jobs = JobManager(max_workers=workers)
+        self.recipe_job = recipe_job
+        self.stages = RECIPE_JOB_STAGES if image else RECIPE_JOB_STAGES[:-1]
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _job(self, job, question, ingredients):
+        if "image" in self.stages:
+            return self.recipe_job(job, question, ingredients, self.online.index, config, self.clip_model,
+                                   self.clip_processor, metadata_store=self.online.metadata_store,
+                                   on_approved=self.online.add_recipe)
+        # Retrieval and generation only: stop before the image stage
+        from scripts.pipelines import generate_validated_recipe
+        from src.rag import search_recipes
+
+        job.start_stage("retrieved")
+        similar = search_recipes(question, ingredients, index=self.online.index, top_k=config.TOP_K_RECIPES,
+                                 metadata_store=self.online.metadata_store)
+        job.report("retrieved", similar)
+        job.start_stage("recipe")
+        job.report("recipe", generate_validated_recipe(question, ingredients, similar, config,
+                                                       on_approved=self.online.add_recipe))
+
+    def run(self, question: str, ingredients: str) -> dict:
+        with self._lock:
+            self._counter += 1
+            key = (self._counter, question, ingredients)   # unique key: no request sharing
+        job = self.jobs.get(self.jobs.submit(key, self._job, question, ingredients, stages=self.stages))
+        while job.finished is None:
+            time.sleep(0.005)
+        if job.error:
+            raise RuntimeError(job.error)
+        return {"queue": job.started - job.created, "stages": dict(job.stage_seconds)}
+
+    def close(self):
+        self.jobs.shutdown()
+        self.online.close()
+
+
+class HttpTarget:
+    """Calls /search, /generate and optionally /image of the HTTP API for each request."""
+
+    def __init__(self, url: str, image: bool = True, timeout: float = 600.0):
+        self.url = url.rstrip("/")
+        self.image = image
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _post(self, path: str, body: dict) -> Tuple[dict, float]:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.post(self.url + path, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json(), time.perf_counter() - start
+
+    def run(self, question: str, ingredients: str) -> dict:
+        stages = {}
+        body = {"question": question, "ingredients": ingredients}
+        result, stages["search"] = self._post("/search", body)
+        result, stages["generate"] = self._post("/generate", {**body, "recipes": result["recipes"]})
+        if self.image:
+            _, stages["image"] = self._post("/image", {"recipe": result["recipe"], "count": config.IMAGE_GENERATION_COUNT})
+        return {"queue": 0.0, "stages": stages}
+
+    def close(self):
+        pass
+
+
+def run_level(target, queries: List[Tuple[str, str]], duration: float, rate: float = None,
+              concurrency: int = None, max_clients: int = 256, seed: int = 0) -> dict:
+    """
+    Drive one load level: Poisson arrivals at `rate` requests/s (open loop), or
+    `concurrency` users sending their next request as soon as the last one finished.
+
+    Queueing delay is the time from a request's arrival to the start of its processing:
+    client backlog plus job queue for the pipeline target, client backlog only for the
+    HTTP target (server-side queueing shows up in the stage latencies).
+    """
+    rng = random.Random(seed)
+    records: List[dict] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    next_query = itertools.count()
+
+    def one(arrival: float):
+        question, ingredients = queries[next(next_query) % len(queries)]
+        dispatched = time.perf_counter()
+        try:
+            result = target.run(question, ingredients)
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        done = time.perf_counter()
+        with lock:
+            records.append({"queue": (dispatched - arrival) + result["queue"], "total": done - arrival,
+                            "stages": result["stages"]})
+
+    start = time.perf_counter()
+    end = start + duration
+    sent = 0
+    if rate:
+        with ThreadPoolExecutor(max_workers=max_clients, thread_name_prefix="load-client") as clients:
+            arrival = start
+            while True:
+                arrival += rng.expovariate(rate)
+                if arrival >= end:
+                    break
+                time.sleep(max(0.0, arrival - time.perf_counter()))
+                clients.submit(one, arrival)
+                sent += 1
+    else:
+        def user():
+            nonlocal sent
+            while time.perf_counter() < end:
+                with lock:
+                    sent += 1
+                one(time.perf_counter())
+
+        threads = [threading.Thread(target=user, name=f"load-user-{i}") for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    stage_names = []   # in pipeline order
+    for record in records:
+        stage_names += [s for s in record["stages"] if s not in stage_names]
+    return {
+        "offered_rps": rate,
+        "concurrency": concurrency,
+        "sent": sent,
+        "completed": len(records),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(records) / elapsed if elapsed else 0.0,
+        "queue": summarize([r["queue"] for r in records]),
+        "total": summarize([r["total"] for r in records]),
+        "stages": {s: summarize([r["stages"][s] for r in records if s in r["stages"]]) for s in stage_names},
+    }
+
+
+def find_saturation(levels: List[dict], keep_up: float = 0.9, latency_growth: float = 2.0) -> dict:
+    """
+    The last load level the system keeps up with, and the first one it does not.
+
+    A level is saturated when throughput falls below `keep_up` x the offered rate (open
+    loop) or stops growing by at least 10% per step while p95 latency grows by more than
+    `latency_growth` x (closed loop), or when requests fail.
+    """
+    saturated_at = None
+    for previous, level in zip([None] + levels[:-1], levels):
+        if level["errors"] > 0:
+            saturated_at = level
+        elif level["offered_rps"]:
+            if level["throughput_rps"] < keep_up * level["offered_rps"]:
+                saturated_at = level
+        elif previous is not None and previous["total"].get("p95_ms"):
+            gain = level["throughput_rps"] / max(previous["throughput_rps"], 1e-9)
+            growth = level["total"].get("p95_ms", 0) / previous["total"]["p95_ms"]
+            if gain < 1.1 and growth > latency_growth:
+                saturated_at = level
+        if saturated_at is not None:
+            break
+    last_ok = None
+    for level in levels:
+        if level is saturated_at:
+            break
+        last_ok = level
+
+    def describe(level):
+        if level is None:
+            return None
+        return {"offered_rps": level["offered_rps"]} if level["offered_rps"] else {"concurrency": level["concurrency"]}
+
+    return {
+        "max_sustained": describe(last_ok),
+        "max_sustained_throughput_rps": last_ok["throughput_rps"] if last_ok else None,
+        "saturated_at": describe(saturated_at),
+    }
+
+
+def print_level(level: dict):
+    load = f"rate={level['offered_rps']}/s" if level["offered_rps"] else f"users={level['concurrency']}"
+    print(f"\n{load}: {level['completed']}/{level['sent']} completed, {level['errors']} errors, "
+          f"{level['throughput_rps']:.2f} req/s")
+    rows = [("queue", level["queue"]), ("total", level["total"])] + list(level["stages"].items())
+    print(f"  {'':<12}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)")
+    for name, stats in rows:
+        if stats.get("n"):
+            print(f"  {name:<12}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    if level["first_error"]:
+        print(f"  first error: {level['first_error']}")
+
+
+def load_test():
+    """
+    Run the load levels given by --rate or --concurrency and report per-stage latency
+    percentiles, queueing delay, throughput and the saturation point.
+    """
+    parser = argparse.ArgumentParser(description="Load-test the LazyCook pipeline or HTTP API.")
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument("--rate", help="Comma-separated request rates (req/s), open loop")
+    load.add_argument("--concurrency", help="Comma-separated numbers of concurrent users, closed loop")
+    parser.add_argument("--target", choices=["pipeline", "http"], default="pipeline")
+    parser.add_argument("--url", default=f"http://localhost:{config.API_PORT}", help="API base URL for --target http")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per load level")
+    parser.add_argument("--workers", type=int, default=config.JOB_WORKERS, help="Job workers (pipeline target)")
+    parser.add_argument("--no-image", action="store_true", help="Skip the image stage")
+    parser.add_argument("--real-services", action="store_true",
+                        help="Use the configured LLM, txt2img, index and Gemini instead of fakes (pipeline target)")
+    parser.add_argument("--queries", default=config.FEEDBACK_JSON_PATH, help="Feedback JSON used to seed questions")
+    parser.add_argument("--data", default=os.path.join(config.ROOT_DIR, "data", "100recipes.csv"))
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    telemetry.configure(enabled=True)
+    queries = load_seed_queries(args.queries, args.data, count=1000)
+    fakes = None
+    if args.target == "pipeline":
+        fakes = None if args.real_services else FakeBackends.from_args(args, args.data).start()
+        target = PipelineTarget(args.workers, fakes, image=not args.no_image)
+    else:
+        target = HttpTarget(args.url, image=not args.no_image)
+
+    levels = []
+    values = [float(v) for v in (args.rate or args.concurrency).split(",")]
+    try:
+        for i, value in enumerate(values):
+            level = run_level(target, queries, args.duration, rate=value if args.rate else None,
+                              concurrency=int(value) if args.concurrency else None, seed=i)
+            print_level(level)
+            levels.append(level)
+    finally:
+        target.close()
+        if fakes is not None:
+            fakes.close()
+
+    saturation = find_saturation(levels)
+    print(f"\nSaturation: max sustained {saturation['max_sustained']} "
+          f"({saturation['max_sustained_throughput_rps'] or 0:.2f} req/s), saturated at {saturation['saturated_at']}")
+    if args.output:
+        report = {"settings": vars(args), "levels": levels, "saturation": saturation,
+                  "fake_calls": fakes.services.calls if fakes else None, "telemetry": telemetry.snapshot()}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    load_test()
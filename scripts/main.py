@@ -1,37 +1,224 @@
 # scripts/main.py
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 from src.rag import search_recipes
 from src import config
 from src.llm_interaction import generate_recipe_from_llm, review_generated_recipe
 from src.image_generation import get_image_prompt_from_llm, create_image_from_prompt
 from .pipelines import image_pipeline, generate_validated_recipe
 from src.image_evaluation import load_clip_model
-from pinecone import Pinecone
+from src.metadata_store import open_metadata_store
+from src.feedback_store import open_feedback_store, build_feedback
+from src.popularity import open_popularity_prior
+from src.deduplication import load_alias_map
+from src.vector_index import open_vector_index
+from src.online_index import open_online_index
+from src.rag import encode_queries, get_ingredient_index
 # In your main.py file, you can now import and use the shopping agent like this:
 
 from src.shopping_agent import create_shopping_agent
+from src.telemetry import configure_logging, summarize
+
+
+def _request_key(request: dict) -> str:
+    """Resume key of a batch request: its "id", or its normalized question and ingredients."""
+    if request.get("id") is not None:
+        return str(request["id"])
+    return " ".join(request["question"].lower().split()) + " | " + " ".join(request.get("ingredients", "").lower().split())
+
+
+def _read_jsonl(path: str) -> list:
+    """Records of a JSONL file; a truncated last line (e.g. after a crash) is skipped."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    return records
+
+
+def merge_shopping_lists(records: list) -> list:
+    """
+    Merge the `ingredients_to_buy` of every successful record into one list, deduplicated
+    case- and whitespace-insensitively; the first spelling is kept.
+
+    Returns:
+        list: [{"item": str, "recipes": int}, ...] most needed first.
+    """
+    merged = {}
+    for record in records:
+        if record.get("status") != "ok":
+            continue
+        for item in set(" ".join(i.split()) for i in record.get("ingredients_to_buy", []) if i.strip()):
+            entry = merged.setdefault(item.lower(), {"item": item, "recipes": 0})
+            entry["recipes"] += 1
+    return sorted(merged.values(), key=lambda e: (-e["recipes"], e["item"].lower()))
+
+
+def batch_main(args):
+    """
+    Batch mode: generate recipes for every {"question", "ingredients", "id"?} line of
+    `args.batch` on a bounded pool of `args.workers` threads sharing one embedding model
+    (and one CLIP model with --images). Results are appended to `args.output` as they
+    finish; on restart, requests that already have an "ok" result there are skipped.
+    At the end all `ingredients_to_buy` are merged into one shopping list and a
+    throughput summary is printed.
+    """
+    requests_ = _read_jsonl(args.batch)
+    done = {r["key"] for r in _read_jsonl(args.output) if r.get("status") == "ok"}
+    pending, seen = [], set(done)
+    for request in requests_:
+        key = _request_key(request)
+        if key not in seen:
+            seen.add(key)
+            pending.append((key, request))
+    print(f"{len(requests_)} requests, {len(done)} already done, {len(pending)} to run with {args.workers} workers")
+
+    # Models and stores are loaded once and shared by all workers
+    index = open_vector_index()
+    metadata_store = open_metadata_store(config.RECIPE_METADATA_PATH)
+    feedback_store = open_feedback_store(config.FEEDBACK_DB_PATH, config.FEEDBACK_JSON_PATH)
+    prior = open_popularity_prior(config.POPULARITY_PRIOR_PATH, feedback_store, metadata_store,
+                                  aliases=load_alias_map(config.RECIPE_ALIAS_PATH))
+    online = open_online_index(index, metadata_store, encode_queries, feedback_store, get_ingredient_index())
+    model = processor = None
+    if args.images:
+        model, processor = load_clip_model(config.CLIP_MODEL, config.DEVICE)
+        os.makedirs(args.image_dir, exist_ok=True)
+
+    write_lock = threading.Lock()
+    stage_latencies = {"retrieval": [], "generation": [], "image": [], "total": []}
+
+    def run(key: str, request: dict) -> dict:
+        question, ingredients = request["question"], request.get("ingredients", "")
+        record = {"key": key, "question": question, "ingredients": ingredients}
+        timings = {}
+        start = time.perf_counter()
+        try:
+            recipes = search_recipes(question, ingredients, index=online.index, top_k=config.TOP_K_RECIPES,
+                                     prior=prior, metadata_store=online.metadata_store)
+            timings["retrieval"] = time.perf_counter() - start
+            t = time.perf_counter()
+            recipe, ingredients_to_buy = generate_validated_recipe(question, ingredients, recipes, config,
+                                                                   on_approved=online.add_recipe)
+            timings["generation"] = time.perf_counter() - t
+            record.update(status="ok", recipe=recipe.model_dump(), ingredients_to_buy=list(ingredients_to_buy),
+                          retrieved=[r.get("id") for r in recipes])
+            if model is not None:
+                t = time.perf_counter()
+                image = image_pipeline(f"{recipe.title} with {', '.join(recipe.ingredients)}", config, model, processor)
+                extension = config.IMAGE_DISPLAY_FORMAT.lower()
+                path = os.path.join(args.image_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + "." + extension)
+                with open(path, "wb") as f:
+                    f.write(image.to_bytes(config.IMAGE_DISPLAY_FORMAT, config.IMAGE_DISPLAY_QUALITY))
+                record["image"] = path
+                timings["image"] = time.perf_counter() - t
+        except Exception as e:
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        timings["total"] = time.perf_counter() - start
+        record["seconds"] = timings
+        with write_lock:
+            for stage, seconds in timings.items():
+                stage_latencies[stage].append(seconds)
+            with open(args.output, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    start = time.perf_counter()
+    failed = 0
+    # At most 2x workers requests are queued at once, so huge inputs are not all submitted up front
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as pool:
+        in_flight = set()
+        for i, (key, request) in enumerate(pending):
+            if len(in_flight) >= 2 * args.workers:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                failed += sum(f.result()["status"] != "ok" for f in finished)
+            in_flight.add(pool.submit(run, key, request))
+        failed += sum(f.result()["status"] != "ok" for f in in_flight)
+    elapsed = time.perf_counter() - start
+    online.close()
+    feedback_store.close()
+
+    shopping_list = merge_shopping_lists(_read_jsonl(args.output))
+    shopping_path = args.shopping_list or os.path.splitext(args.output)[0] + ".shopping.txt"
+    with open(shopping_path, "w", encoding="utf-8") as f:
+        for entry in shopping_list:
+            f.write(entry["item"] + "\n")
+    if args.agent and shopping_list:
+        agent_response, _ = create_shopping_agent().process_ingredients([e["item"] for e in shopping_list])
+        print(f"Shopping agent: {agent_response}")
+
+    print(f"\nProcessed {len(pending)} requests in {elapsed:.1f}s with {args.workers} workers "
+          f"({len(pending) / elapsed * 60 if elapsed else 0.0:.1f} recipes/min), {failed} failed")
+    for stage, latencies in stage_latencies.items():
+        if latencies:
+            stats = summarize(latencies)
+            print(f"  {stage:<11} mean {stats['mean_ms'] / 1000:.2f}s  p50 {stats['p50_ms'] / 1000:.2f}s  "
+                  f"p95 {stats['p95_ms'] / 1000:.2f}s")
+    print(f"Shopping list: {len(shopping_list)} items -> {shopping_path}")
+    print(f"Results: {args.output}")
+
 
 def main():
     """
     Command-line entry point for generating and reviewing recipes with LazyCook.
+
+    With `--batch requests.jsonl` it runs the batch mode instead (see `batch_main`).
     
     Steps:
     1. Prompts the user for a cooking question and available ingredients.
-    2. Searches for similar recipes using Pinecone and embeddings.
+    2. Searches for similar recipes using the vector index and embeddings.
     3. Generates a new recipe using an LLM, with review and improvement loop.
     4. Prints the final recipe and shopping list.
     5. Loads the CLIP model and generates an image for the recipe, displaying the best match.
     6. Intelligently manages shopping list with ingredients to buy.
+    7. Optionally records a rating, which updates the popularity prior used for re-ranking.
+       Approved and highly rated recipes are added to the search index right away.
     """
 
+    parser = argparse.ArgumentParser(description="Generate recipes interactively, or in batch from JSONL.")
+    parser.add_argument("--batch", default=None, help='JSONL of {"question", "ingredients", "id"?} requests')
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL results, appended to and resumed from")
+    parser.add_argument("--workers", type=int, default=config.JOB_WORKERS, help="Requests processed at once")
+    parser.add_argument("--images", action="store_true", help="Also generate an image per recipe")
+    parser.add_argument("--image-dir", default="batch_images")
+    parser.add_argument("--shopping-list", default=None, help="Merged shopping list (default: <output>.shopping.txt)")
+    parser.add_argument("--agent", action="store_true", help="Also add the merged list with the shopping agent")
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.batch:
+        batch_main(args)
+        return
+
     question = input("Enter your question: ")
     ingredients = input("Enter ingredients: ")
 
-    # Initialize Pinecone
-    pc = Pinecone(api_key=config.PINECONE_API_KEY)
-    index = pc.Index("lazycook")
+    # Open the vector index (Pinecone or the local memory-mapped index, see config.VECTOR_BACKEND)
+    index = open_vector_index()
 
-    recipes = search_recipes(question, ingredients, index=index, top_k=3)
-    recipe, ingredients_to_buy = generate_validated_recipe(question, ingredients, recipes, config)
+    metadata_store = open_metadata_store(config.RECIPE_METADATA_PATH)
+    feedback_store = open_feedback_store(config.FEEDBACK_DB_PATH, config.FEEDBACK_JSON_PATH)
+    prior = open_popularity_prior(config.POPULARITY_PRIOR_PATH, feedback_store, metadata_store,
+                                  aliases=load_alias_map(config.RECIPE_ALIAS_PATH))
+
+    online = open_online_index(index, metadata_store, encode_queries, feedback_store, get_ingredient_index())
+
+    recipes = search_recipes(question, ingredients, index=online.index, top_k=3, prior=prior,
+                             metadata_store=online.metadata_store)
+    recipe, ingredients_to_buy = generate_validated_recipe(question, ingredients, recipes, config,
+                                                           on_approved=online.add_recipe)
 
     print("\nFinal Recipe:")
     print(recipe.title)
@@ -62,5 +249,14 @@ def main():
     # Run image generation pipeline
     best_image = image_pipeline(f"{recipe.title} with {', '.join(recipe.ingredients)}", config, model, processor)
 
+    rating = input("\nRate this recipe 1-5 (leave empty to skip): ").strip()
+    if rating in {"1", "2", "3", "4", "5"}:
+        liked = input("Would you cook it? (y/n): ").strip().lower() in {"y", "yes"}
+        comment = input("Comments (optional): ").strip()
+        feedback_store.add(build_feedback(recipe, question, ingredients, recipes, int(rating), liked, comment))
+        print("Thanks, feedback saved!")
+    online.close()
+    feedback_store.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
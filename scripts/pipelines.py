@@ -1,9 +1,19 @@
-from src.image_generation import create_image_from_prompt, get_image_prompt_from_llm
+from src.image_generation import get_image_prompt_from_llm, render_image
 from src.image_evaluation import compute_image_text_similarity
 from IPython.display import display
 from src.llm_interaction import generate_recipe_from_llm, review_generated_recipe
+from src.rag import search_recipes
+from src.profiling import profiled
+from src.telemetry import increment, span
+import logging
 
-def generate_validated_recipe(question, ingredients, recipes, config, max_attempts=3):
+logger = logging.getLogger(__name__)
+
+# Stages reported by recipe_job, in order
+RECIPE_JOB_STAGES = ("retrieved", "recipe", "image")
+
+@profiled("generate_validated_recipe")
+def generate_validated_recipe(question, ingredients, recipes, config, max_attempts=3, on_approved=None):
     """
     Generate and validate a recipe using an LLM and a review loop.
     Attempts to generate a recipe that fits the user's question and available ingredients.
@@ -15,6 +25,8 @@ def generate_validated_recipe(question, ingredients, recipes, config, max_attemp
         recipes (list): List of top similar recipes for context.
         config: Configuration object with model/API details.
         max_attempts (int): Maximum number of review/generation attempts.
+        on_approved (callable, optional): Called with the approved recipe, e.g.
+            `OnlineRecipeIndex.add_recipe` to make it searchable.
     
     Returns:
         tuple: (Recipe object, list of ingredients to buy)
@@ -24,35 +36,47 @@ def generate_validated_recipe(question, ingredients, recipes, config, max_attemp
 
     while attempt < max_attempts:
         try:
-            # Pass the previous explanation (if any) as feedback to improve the recipe
-            recipe = generate_recipe_from_llm(
-                question, ingredients, recipes, config.LLM_API_URL, model = config.LLM_MODEL, model_big= config.LLM_MODEL_BIG,
-                feedback=last_explanation
-            )
-            
-            review_result = review_generated_recipe(
-                question, ingredients, recipe, config.LLM_MODEL_Goog
-            )
+            with span("generation_attempt", attempt=attempt + 1):
+                # Pass the previous explanation (if any) as feedback to improve the recipe
+                recipe = generate_recipe_from_llm(
+                    question, ingredients, recipes, config.LLM_API_URL, model = config.LLM_MODEL, model_big= config.LLM_MODEL_BIG,
+                    feedback=last_explanation
+                )
+
+                increment("review_attempts_total")
+                review_result = review_generated_recipe(
+                    question, ingredients, recipe, config.LLM_MODEL_Goog
+                )
             
             if review_result.approved:
-                print("Recipe approved!")
+                increment("approvals_total")
+                logger.info("Recipe approved after %d attempt(s)", attempt + 1)
+                if on_approved is not None:
+                    try:
+                        on_approved(recipe)
+                    except Exception as e:
+                        logger.warning("Could not index the approved recipe: %s", e)
                 return recipe, review_result.ingredients_to_buy
             else:
-                print(f" Recipe not approved (ingredients to buy: {review_result.ingredients_to_buy})")
-                print(f" Explanation: {review_result.explanation}")
+                logger.info("Recipe not approved (ingredients to buy: %s)", review_result.ingredients_to_buy)
+                logger.debug("Reviewer explanation: %s", review_result.explanation)
                 last_explanation = review_result.explanation
                 attempt += 1
         except Exception as e:
-            print(f" Error generating recipe: {e}")
+            increment("generation_errors_total")
+            logger.warning("Error generating recipe: %s", e)
             attempt += 1
 
-    print("Reached max attempts. Proceeding with the last generated recipe.")
+    logger.warning("Reached max attempts. Proceeding with the last generated recipe.")
     return recipe, review_result.ingredients_to_buy
 
 
-def image_pipeline(recipe: str, config, model, processor, num_iterations=3):
+@profiled("image_pipeline")
+def image_pipeline(recipe: str, config, model, processor, num_iterations=3, on_preview=None):
     """
     Generate images for a recipe and pick the best one based on CLIP similarity.
+
+    Images stay encoded; each one is decoded once, at CLIP input resolution, for scoring.
     
     Args:
         recipe (str): Recipe description to generate image for
@@ -60,23 +84,63 @@ def image_pipeline(recipe: str, config, model, processor, num_iterations=3):
         model: CLIP model for similarity scoring
         processor: CLIP processor for image/text processing
         num_iterations (int): Number of images to generate and compare
+        on_preview (callable, optional): Called with (overall progress 0-1, EncodedImage or
+            None) while the images render
     
     Returns:
-        PIL.Image: The best matching image
+        EncodedImage: The best matching image (`to_bytes()` gives a WebP/JPEG for display)
     """
     prompt = get_image_prompt_from_llm(recipe, config.LLM_API_URL)
     similarity_scores = []
     images = []
     
     for i in range(num_iterations):
-        image = create_image_from_prompt(prompt, config.IMAGE_API_URL)
-        similarity_score = compute_image_text_similarity(image, recipe, model, processor)
-        print(f"Iteration {i+1} - Similarity: {similarity_score:.4f}")
+        image_preview = None
+        if on_preview is not None:
+            image_preview = lambda progress, preview, i=i: on_preview((i + progress) / num_iterations, preview)
+        image = render_image(prompt, config.IMAGE_API_URL, on_preview=image_preview)
+        similarity_score = compute_image_text_similarity(image.for_clip(config.CLIP_IMAGE_SIZE), recipe, model, processor)
+        logger.debug("Iteration %d - Similarity: %.4f", i + 1, similarity_score)
         similarity_scores.append(similarity_score)
         images.append(image)
 
     best_image = images[similarity_scores.index(max(similarity_scores))]
-    print("Best image based on similarity score:")
     display(best_image)
     
     return best_image
+
+
+def recipe_job(job, question, ingredients, index, config, model, processor, prior=None, metadata_store=None,
+               on_approved=None):
+    """
+    Full retrieval, generation and image pipeline as a background job (see src.jobs).
+
+    Each stage's result is reported as soon as it is ready, so the UI can show the
+    retrieved recipes, then the recipe, then the image. Cancellation takes effect
+    between stages.
+
+    Args:
+        job (Job): The job to report progress to.
+        question (str): User's cooking request.
+        ingredients (str): Ingredients the user has at home.
+        index: Vector index (Pinecone or LocalVectorIndex).
+        config: Configuration object with model/API details.
+        model: CLIP model for similarity scoring.
+        processor: CLIP processor for image/text processing.
+        prior (PopularityPrior, optional): Popularity prior for re-ranking.
+        metadata_store (RecipeMetadataStore, optional): Local id-to-recipe store.
+        on_approved (callable, optional): Called with the recipe if the reviewer approves it.
+    """
+    job.start_stage("retrieved")
+    similar = search_recipes(question, ingredients, index=index, top_k=config.TOP_K_RECIPES,
+                             prior=prior, metadata_store=metadata_store)
+    job.report("retrieved", similar)
+
+    job.start_stage("recipe")
+    recipe, missing = generate_validated_recipe(question, ingredients, similar, config, on_approved=on_approved)
+    job.report("recipe", (recipe, missing))
+
+    job.start_stage("image")
+    image = image_pipeline(f"{recipe.title} with {', '.join(recipe.ingredients)}", config, model, processor,
+                           on_preview=job.update_preview)
+    job.report("image", image)
@@ -1,9 +1,16 @@
 # scripts/recipe_embedding.py
 
+import os
+
+import numpy as np
 import torch
 from src.data_processing import load_and_preprocess_data
 from src import config
-from src.embedding_utils import load_embedding_model, generate_embeddings, batch_upsert
+from src.embedding_utils import load_embedding_model, generate_embeddings, batch_upsert, batch_delete
+from src.deduplication import load_alias_map
+from src.metadata_store import RecipeMetadataStore
+from src.ingredient_filter import IngredientIndex
+from src.vector_index import LocalVectorIndex
 from pinecone import Pinecone
 
 
@@ -11,21 +18,33 @@ def recipe_embedding():
     """
     Loads recipe data, generates embeddings for each recipe, and upserts them into a Pinecone vector database.
     Steps:
-    1. Loads and preprocesses the recipe dataset.
+    1. Loads and preprocesses the recipe dataset, collapsing near-duplicate recipes.
     2. Loads the embedding model and generates embeddings for all recipes.
-    3. Connects to Pinecone and prepares metadata for each recipe.
-    4. Upserts the embeddings and metadata as vectors into the Pinecone index.
-    5. Cleans up resources and empties CUDA cache if needed.
+    3. Writes each recipe's metadata to the local metadata store, and the embeddings and
+       per-ingredient bitmaps to the local vector index used for filtered search.
+    4. Upserts the embeddings as id-only vectors into the Pinecone index.
+    5. Removes near-duplicate (alias) ids left over from earlier runs from the index and the store.
+    6. Cleans up resources and empties CUDA cache if needed.
     """
 
     print("Running embedding and upsert...")
 
-    # Load and preprocess data
-    df = load_and_preprocess_data(config.RECIPE_DATASET_PATH)
+    # Load and preprocess data, preferring the columnar table written by scripts/convert_dataset.py
+    dataset_path = config.RECIPE_TABLE_PATH if os.path.exists(config.RECIPE_TABLE_PATH) else config.RECIPE_DATASET_PATH
+    print(f"Loading recipes from {dataset_path}")
+    df = load_and_preprocess_data(
+        dataset_path,
+        deduplicate=True,
+        alias_path=config.RECIPE_ALIAS_PATH,
+        dedup_threshold=config.DEDUP_THRESHOLD,
+    )
 
     # Load model and generate embeddings
     model = load_embedding_model(config.EMBEDDING_MODEL, config.DEVICE)
-    embeddings = generate_embeddings(model, df.full_text.tolist(), device=config.DEVICE)
+    embeddings = generate_embeddings(
+        model, df.full_text.tolist(), device=config.DEVICE,
+        num_workers=config.EMBEDDING_WORKERS, model_name=config.EMBEDDING_MODEL
+    )
 
     print(f"Generated embeddings for {len(df)} recipes.")
 
@@ -34,22 +53,24 @@ def recipe_embedding():
     index = pc.Index("lazycook")
 
     # Convert IDs and embeddings
-    ids = df["Unnamed: 0"].astype(str).tolist()
+    ids = df["id"].astype(str).tolist()
     embeddings_list = embeddings.tolist()
 
-    # Prepare metadata per row
-    metadata_list = []
-    for _, row in df.iterrows():
-        metadata_list.append({
-            "title": row["title"],
-            "ingredients": row["ingredients"],
-            "directions": row["directions"]
-        })
+    # Store metadata locally, keyed by recipe id
+    store = RecipeMetadataStore(config.RECIPE_METADATA_PATH)
+    stored = store.put_dataframe(df)
+    store.close()
+    print(f"Stored metadata for {stored} recipes in {config.RECIPE_METADATA_PATH}.")
+
+    # Local memory-mapped vector index and per-ingredient bitmaps for filtered search
+    LocalVectorIndex.build(config.RECIPE_VECTOR_INDEX_PATH, df["id"].to_numpy(), np.asarray(embeddings))
+    IngredientIndex.build(df["id"], df["NER"]).save(config.INGREDIENT_INDEX_PATH)
+    print(f"Wrote the local vector index and ingredient bitmaps for {len(df)} recipes.")
 
-    # Prepare Pinecone vector payload
+    # Prepare Pinecone vector payload (ids only, metadata is hydrated locally at query time)
     vectors = [
-        {"id": id_, "values": vec, "metadata": meta}
-        for id_, vec, meta in zip(ids, embeddings_list, metadata_list)
+        {"id": id_, "values": vec}
+        for id_, vec in zip(ids, embeddings_list)
     ]
 
     # Then call it:
@@ -57,6 +78,15 @@ def recipe_embedding():
 
     print(f"Upserted {len(vectors)} vectors to Pinecone.")
 
+    # Drop near-duplicates collapsed into a canonical recipe from the index and the store
+    alias_ids = list(load_alias_map(config.RECIPE_ALIAS_PATH))
+    if alias_ids:
+        batch_delete(index, [str(i) for i in alias_ids], namespace="recipes-namespace")
+        store = RecipeMetadataStore(config.RECIPE_METADATA_PATH)
+        removed = store.delete_many(alias_ids)
+        store.close()
+        print(f"Deleted {len(alias_ids)} near-duplicate ids from Pinecone and {removed} from the metadata store.")
+
     # Cleanup
     del model, embeddings, df
     if config.DEVICE == 'cuda':
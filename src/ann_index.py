@@ -0,0 +1,193 @@
+"""This module provides a small inverted-file (IVF) approximate nearest neighbour index
+over normalized embedding vectors, implemented with numpy. Vectors are assigned to the
+nearest of a set of k-means centroids, and a query only scores the vectors in the few
+lists whose centroids are closest to it."""
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means over normalized vectors.
+
+    Args:
+        vectors (np.ndarray): float32 array of shape (n, dim), rows L2-normalized.
+        n_clusters (int): Number of centroids.
+        iterations (int, optional): Number of Lloyd iterations. Defaults to 10.
+        seed (int, optional): Random seed for the initial centroids. Defaults to 0.
+
+    Returns:
+        np.ndarray: float32 centroids of shape (n_clusters, dim), L2-normalized.
+    """
+    rng = np.random.RandomState(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=n_clusters) == 0
+        # Re-seed empty clusters with random points so every list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index for maximum inner product search over normalized vectors.
+
+    Until `train_threshold` vectors have been added the index is searched exactly.
+    After that it is trained once with k-means (about 4·sqrt(n) lists) and every later
+    vector is appended to the list of its nearest centroid in O(n_lists · dim).
+    """
+
+    def __init__(self, dim: int, nprobe: int = 8, train_threshold: int = 4096):
+        """
+        Args:
+            dim (int): Vector dimension.
+            nprobe (int, optional): Number of lists scored per query. Defaults to 8.
+            train_threshold (int, optional): Number of vectors before switching from exact search. Defaults to 4096.
+        """
+        self.dim = dim
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.centroids: Optional[np.ndarray] = None
+        self._flat_vectors = np.zeros((0, dim), dtype=np.float32)
+        self._flat_ids = np.zeros(0, dtype=np.int64)
+        self._list_vectors = []
+        self._list_ids = []
+        self._list_sizes = np.zeros(0, dtype=np.int64)
+        self.count = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """
+        Add vectors to the index.
+
+        Args:
+            ids (np.ndarray): int64 ids, one per vector.
+            vectors (np.ndarray): float32 array of shape (n, dim), rows L2-normalized.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(ids) == 0:
+            return
+        self.count += len(ids)
+        if not self.is_trained:
+            self._flat_vectors = np.concatenate([self._flat_vectors, vectors])
+            self._flat_ids = np.concatenate([self._flat_ids, ids])
+            if len(self._flat_ids) >= self.train_threshold:
+                self._train()
+            return
+        self._add_to_lists(ids, vectors, np.argmax(vectors @ self.centroids.T, axis=1))
+
+    def _train(self):
+        vectors, ids = self._flat_vectors, self._flat_ids
+        n_lists = int(min(4 * np.sqrt(len(vectors)), len(vectors) // 16))
+        sample = vectors
+        if len(vectors) > 256 * n_lists:
+            sample = vectors[np.random.RandomState(0).choice(len(vectors), 256 * n_lists, replace=False)]
+        self.centroids = kmeans(sample, n_lists)
+        self._list_vectors = [np.zeros((16, self.dim), dtype=np.float32) for _ in range(n_lists)]
+        self._list_ids = [np.zeros(16, dtype=np.int64) for _ in range(n_lists)]
+        self._list_sizes = np.zeros(n_lists, dtype=np.int64)
+        self._flat_vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._flat_ids = np.zeros(0, dtype=np.int64)
+        self._add_to_lists(ids, vectors, np.argmax(vectors @ self.centroids.T, axis=1))
+
+    def _add_to_lists(self, ids: np.ndarray, vectors: np.ndarray, assignments: np.ndarray):
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.flatnonzero(np.diff(assignments[order])) + 1
+        for group in np.split(order, bounds):
+            list_no = int(assignments[group[0]])
+            size = self._list_sizes[list_no]
+            needed = size + len(group)
+            if needed > len(self._list_ids[list_no]):
+                capacity = max(needed, 2 * len(self._list_ids[list_no]))
+                grown_vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+                grown_vectors[:size] = self._list_vectors[list_no][:size]
+                grown_ids = np.zeros(capacity, dtype=np.int64)
+                grown_ids[:size] = self._list_ids[list_no][:size]
+                self._list_vectors[list_no] = grown_vectors
+                self._list_ids[list_no] = grown_ids
+            self._list_vectors[list_no][size:needed] = vectors[group]
+            self._list_ids[list_no][size:needed] = ids[group]
+            self._list_sizes[list_no] = needed
+
+    def search(self, vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the vectors with the highest inner product with `vector`.
+
+        Args:
+            vector (np.ndarray): Normalized query vector of shape (dim,).
+            k (int): Number of results.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (ids, scores), best first.
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        if not self.is_trained:
+            vectors, ids = self._flat_vectors, self._flat_ids
+            scores = vectors @ vector
+        else:
+            probes = np.argsort(-(self.centroids @ vector))[:self.nprobe]
+            scores = np.concatenate([
+                self._list_vectors[p][:self._list_sizes[p]] @ vector for p in probes
+            ])
+            ids = np.concatenate([self._list_ids[p][:self._list_sizes[p]] for p in probes])
+
+        k = min(k, len(scores))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def save(self, path: str):
+        """Save centroids and list assignments (not the vectors themselves) to a `.npz` file."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if self.is_trained:
+            ids = np.concatenate([self._list_ids[p][:self._list_sizes[p]] for p in range(len(self._list_sizes))])
+            lists = np.repeat(np.arange(len(self._list_sizes)), self._list_sizes)
+        else:
+            ids, lists = self._flat_ids, np.full(len(self._flat_ids), -1)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids if self.is_trained else np.zeros((0, self.dim), np.float32),
+                 ids=ids, lists=lists)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, vectors_by_id, **kwargs) -> "IVFIndex":
+        """
+        Rebuild an index saved with `save`, without re-running k-means or re-assigning vectors.
+
+        Args:
+            path (str): Path written by `save`.
+            vectors_by_id (Callable[[np.ndarray], np.ndarray]): Returns the vectors for an array of ids.
+            **kwargs: Passed to the constructor.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        with np.load(path) as data:
+            centroids, ids, lists = data["centroids"], data["ids"], data["lists"]
+        index = cls(centroids.shape[1], **kwargs)
+        vectors = vectors_by_id(ids)
+        if len(centroids) == 0:
+            index.add(ids, vectors)
+            return index
+        index.centroids = centroids
+        n_lists = len(centroids)
+        index._list_vectors = [np.zeros((16, index.dim), dtype=np.float32) for _ in range(n_lists)]
+        index._list_ids = [np.zeros(16, dtype=np.int64) for _ in range(n_lists)]
+        index._list_sizes = np.zeros(n_lists, dtype=np.int64)
+        index._add_to_lists(ids, vectors, lists)
+        index.count = len(ids)
+        return index
@@ -0,0 +1,82 @@
+"""This module provides a dynamic micro-batcher that merges concurrent requests to a model
+into single batched calls. Callers on different threads submit single items; a worker
+thread waits at most a short window for more items to arrive, runs one batched call and
+hands each caller its own result."""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and processes them in batches.
+
+    A batch is dispatched as soon as `max_batch_size` items are waiting, or `max_wait_ms`
+    after its first item arrived, whichever comes first, so a lone request waits at most
+    `max_wait_ms` while concurrent requests share one forward pass.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], Sequence], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, name: str = "micro-batcher"):
+        """
+        Args:
+            batch_fn (Callable): Function mapping a list of items to a sequence of results of the same length.
+            max_batch_size (int, optional): Maximum items per call. Defaults to 32.
+            max_wait_ms (float, optional): Maximum time a batch waits for more items. Defaults to 5 ms.
+            name (str, optional): Name of the worker thread.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Queue one item. Returns a Future resolved with its result."""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Process one item, blocking until its batch has run."""
+        return self.submit(item).result()
+
+    def map(self, items: Sequence) -> list:
+        """Process several items (possibly across batches) and return their results in order."""
+        futures = [self.submit(item) for item in items]
+        return [f.result() for f in futures]
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _worker(self):
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in pending]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(pending, results):
+                future.set_result(result)
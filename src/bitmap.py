@@ -0,0 +1,187 @@
+"""This module provides a roaring-style compressed bitmap over non-negative integer ids,
+implemented with numpy. Ids are split by their high 16 bits into containers; a sparse
+container stores its low 16 bits as a sorted uint16 array and a dense one as a 65536-bit
+bitset, so both rare and very common ingredients stay compact and fast to combine."""
+
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+# Containers with more values than this are stored as bitsets (same rule as Roaring)
+ARRAY_MAX = 4096
+_BITSET_WORDS = 1024   # 65536 bits as uint64 words
+_BIT = np.uint64(1)
+
+
+def _array_to_bitset(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(_BITSET_WORDS, dtype=np.uint64)
+    values = values.astype(np.uint64)
+    np.bitwise_or.at(bits, (values >> np.uint64(6)).astype(np.int64), _BIT << (values & np.uint64(63)))
+    return bits
+
+
+def _bitset_to_array(bits: np.ndarray) -> np.ndarray:
+    unpacked = np.unpackbits(bits.view(np.uint8), bitorder="little")
+    return np.flatnonzero(unpacked).astype(np.uint16)
+
+
+def _normalize(bits: np.ndarray):
+    """Return a container for a bitset: the bitset, an array if it is sparse, or None if empty."""
+    count = int(np.unpackbits(bits.view(np.uint8)).sum())
+    if count == 0:
+        return None
+    return _bitset_to_array(bits) if count <= ARRAY_MAX else bits
+
+
+def _is_bitset(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+
+class RoaringBitmap:
+    """
+    Set of non-negative integer ids (below 2**48) in roaring-style containers.
+
+    Supports union (`|`), intersection (`&`) and difference (`-`), vectorized membership
+    tests with `contains_many`, and compact (de)serialization into flat numpy arrays.
+    """
+
+    def __init__(self, containers: Dict[int, np.ndarray] = None):
+        self.containers: Dict[int, np.ndarray] = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "RoaringBitmap":
+        """Build a bitmap from ids in any order, duplicates allowed."""
+        ids = np.unique(np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=np.int64))
+        containers = {}
+        if len(ids):
+            highs = ids >> 16
+            bounds = np.flatnonzero(np.diff(highs)) + 1
+            for group in np.split(ids, bounds):
+                low = (group & 0xFFFF).astype(np.uint16)
+                containers[int(group[0] >> 16)] = low if len(low) <= ARRAY_MAX else _array_to_bitset(low)
+        return cls(containers)
+
+    def __len__(self) -> int:
+        return sum(
+            int(np.unpackbits(c.view(np.uint8)).sum()) if _is_bitset(c) else len(c)
+            for c in self.containers.values()
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.containers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.containers.values())
+
+    def to_array(self) -> np.ndarray:
+        """All ids as a sorted int64 array."""
+        parts = []
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            low = _bitset_to_array(container) if _is_bitset(container) else container
+            parts.append((np.int64(high) << 16) | low.astype(np.int64))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def contains_many(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Vectorized membership test.
+
+        Args:
+            ids (np.ndarray): Integer ids.
+
+        Returns:
+            np.ndarray: Boolean mask, True where the id is in the bitmap.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        mask = np.zeros(len(ids), dtype=bool)
+        highs = ids >> 16
+        for high in np.unique(highs):
+            container = self.containers.get(int(high))
+            if container is None:
+                continue
+            positions = np.flatnonzero(highs == high)
+            low = ids[positions] & 0xFFFF
+            if _is_bitset(container):
+                words = container[low >> 6]
+                mask[positions] = ((words >> (low & 63).astype(np.uint64)) & _BIT).astype(bool)
+            else:
+                found = np.searchsorted(container, low)
+                found[found == len(container)] = 0
+                mask[positions] = container[found] == low
+        return mask
+
+    def __contains__(self, recipe_id: int) -> bool:
+        return bool(self.contains_many(np.array([recipe_id]))[0])
+
+    def _combine(self, other: "RoaringBitmap", keys: Iterable[int], array_op, bitset_op) -> "RoaringBitmap":
+        containers = {}
+        for high in keys:
+            a, b = self.containers.get(high), other.containers.get(high)
+            if a is None or b is None:
+                # Only reached for union and difference: keep the side that is present
+                result = a if b is None else b
+            elif not _is_bitset(a) and not _is_bitset(b):
+                result = array_op(a, b).astype(np.uint16)
+                if len(result) > ARRAY_MAX:
+                    result = _array_to_bitset(result)
+                elif len(result) == 0:
+                    result = None
+            else:
+                a_bits = a if _is_bitset(a) else _array_to_bitset(a)
+                b_bits = b if _is_bitset(b) else _array_to_bitset(b)
+                result = _normalize(bitset_op(a_bits, b_bits))
+            if result is not None:
+                containers[high] = result
+        return RoaringBitmap(containers)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, self.containers.keys() | other.containers.keys(), np.union1d, np.bitwise_or)
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, self.containers.keys() & other.containers.keys(), np.intersect1d, np.bitwise_and)
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(
+            other, self.containers.keys(), np.setdiff1d,
+            lambda a, b: np.bitwise_and(a, np.bitwise_not(b)),
+        )
+
+    @classmethod
+    def union_all(cls, bitmaps: Iterable["RoaringBitmap"]) -> "RoaringBitmap":
+        result = cls()
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Flatten into (keys, sizes, data) arrays for storage.
+
+        `data` holds the containers back to back as uint16; a bitset container takes
+        4096 uint16 slots and is marked by a negative size.
+        """
+        keys = np.array(sorted(self.containers), dtype=np.int64)
+        sizes, data = [], []
+        for high in keys:
+            container = self.containers[int(high)]
+            if _is_bitset(container):
+                sizes.append(-len(container) * 4)
+                data.append(container.view(np.uint16))
+            else:
+                sizes.append(len(container))
+                data.append(container)
+        return (keys, np.array(sizes, dtype=np.int64),
+                np.concatenate(data) if data else np.zeros(0, dtype=np.uint16))
+
+    @classmethod
+    def from_arrays(cls, keys: np.ndarray, sizes: np.ndarray, data: np.ndarray) -> "RoaringBitmap":
+        """Inverse of `to_arrays`."""
+        containers = {}
+        offset = 0
+        for high, size in zip(keys.tolist(), sizes.tolist()):
+            length = abs(size)
+            chunk = data[offset:offset + length]
+            containers[high] = chunk.copy().view(np.uint64) if size < 0 else chunk
+            offset += length
+        return cls(containers)
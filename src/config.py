@@ -8,17 +8,57 @@ DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 # --- Model Configurations ---
 EMBEDDING_MODEL = "avsolatorio/GIST-Embedding-v0"
+EMBEDDING_WORKERS = 1 if DEVICE == "cuda" else max(1, (os.cpu_count() or 1) // 2)  # processes for bulk CPU embedding
 EMBEDDING_MODEL_UNUSED = "avsolatorio/GIST-large-Embedding-v0"
 EMBEDDING_MODEL_UNUSED= "Qwen/Qwen3-Embedding-0.6B"
 LLM_MODEL = "qwen3-0.6b"
 LLM_MODEL_BIG = "qwen3-4b"
 LLM_MODEL_Goog = "gemini-1.5-flash"
 CLIP_MODEL = "openai/clip-vit-base-patch32"
+CONTEXT_TOKENIZER = "Qwen/Qwen3-0.6B"   # local tokenizer used to measure prompt budgets
 
 # --- API Endpoints ---
 LLM_API_URL = "http://localhost:1234/v1/chat/completions"
 IMAGE_API_URL = "http://localhost:7860/sdapi/v1/txt2img"
 
+# --- Model Routing ---
+LLM_TIMEOUT_SECONDS = 120      # per-request timeout for LLM and image API calls
+ROUTER_WINDOW = 100            # recent calls per backend used for latency/error statistics
+BREAKER_FAILURES = 3           # consecutive failures that open a backend's circuit breaker
+BREAKER_RESET_SECONDS = 30     # time an open breaker rejects calls before a trial call
+HEDGE_PERCENTILE = 95          # hedge to the next backend after this latency percentile
+HEDGE_MIN_SAMPLES = 20         # successful calls needed before hedging a backend
+DEFAULT_MODEL_CONCURRENCY = 2  # in-flight calls per backend before it counts as saturated
+MODEL_MAX_CONCURRENCY = {LLM_MODEL_BIG: 1}
+# Backends each route hedges and falls back to, most preferred first (comma-separated in the env)
+LLM_BACKENDS = [u for u in os.getenv("LAZYCOOK_LLM_URLS", LLM_API_URL).split(",") if u]       # chat endpoints
+LLM_FALLBACK_MODELS = [m for m in os.getenv("LAZYCOOK_LLM_FALLBACK_MODELS", "").split(",") if m]   # tried after a call's own models
+IMAGE_BACKENDS = [u for u in os.getenv("LAZYCOOK_IMAGE_URLS", IMAGE_API_URL).split(",") if u]   # txt2img endpoints
+REVIEW_MODELS = [m for m in os.getenv("LAZYCOOK_REVIEW_MODELS", LLM_MODEL_Goog).split(",") if m]  # Gemini reviewer models
+
+# --- HTTP Service ---
+API_HOST = "0.0.0.0"
+API_PORT = 8000
+BATCH_MAX_SIZE = 32       # max requests merged into one embedding/CLIP forward pass
+BATCH_MAX_WAIT_MS = 5.0   # max time a request waits for others to join its batch
+
+# --- Vector Search ---
+VECTOR_BACKEND = "pinecone"   # "pinecone" or "local" (memory-mapped index written by recipe_embedding_P.py)
+VECTOR_SHARDS = 1             # local index: >1 splits the memory map across this many search worker processes
+FILTER_OVERSAMPLE = 4         # extra candidates fetched from Pinecone when an ingredient filter is post-applied
+PREFER_BOOST = 0.05           # score added to candidates with an ingredient the query asks for ("with chicken")
+ONLINE_ID_BASE = 3_000_000    # ids of recipes added online start here (above every RecipeNLG row id)
+ONLINE_MIN_RATING = 4         # liked feedback with at least this rating adds the generated recipe to the index
+DELTA_MERGE_ROWS = 2000       # delta segment size that triggers a background merge into the main index
+
+# --- Observability ---
+TRACING_ENABLED = os.getenv("LAZYCOOK_TRACING", "0") == "1"   # timing spans and counters (no-ops when off)
+TRACE_JSONL_PATH = os.getenv("LAZYCOOK_TRACE_JSONL")          # also append every span as a JSON line here
+LOG_LEVEL = os.getenv("LAZYCOOK_LOG_LEVEL", "INFO")            # DEBUG also logs raw model outputs
+PROFILE_SAMPLE_RATE = float(os.getenv("LAZYCOOK_PROFILE_RATE", "0"))   # fraction of requests profiled (0 = off)
+PROFILE_INTERVAL_MS = 5.0                                      # stack sampling interval of the profiler
+REPLAY_MODE = os.getenv("LAZYCOOK_REPLAY", "passthrough")      # model calls: "passthrough", "record" or "replay"
+
 # --- API Keys ---
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -27,8 +67,53 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 # Convert relative paths to absolute paths
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 RECIPE_DATASET_PATH = os.path.join(ROOT_DIR, "data", "1000000recipes.csv")
+RECIPE_TABLE_PATH = os.path.join(ROOT_DIR, "data", "recipes.arrow")
+RECIPE_METADATA_PATH = os.path.join(ROOT_DIR, "data", "recipe_metadata.sqlite")
+RECIPE_ALIAS_PATH = os.path.join(ROOT_DIR, "data", "recipe_aliases.csv")
 RECIPE_EMBEDDING_PATH = os.path.join(ROOT_DIR, "data", "recipe_embedding.pt")
+FEEDBACK_JSON_PATH = os.path.join(ROOT_DIR, "data", "recipe_feedback.json")
+FEEDBACK_DB_PATH = os.path.join(ROOT_DIR, "data", "recipe_feedback.sqlite")
+POPULARITY_PRIOR_PATH = os.path.join(ROOT_DIR, "data", "popularity_prior.npz")
+QUERY_EXPANSION_PATH = os.path.join(ROOT_DIR, "data", "query_expansion.npz")
+INGREDIENT_INDEX_PATH = os.path.join(ROOT_DIR, "data", "ingredient_bitmaps.npz")
+RECIPE_VECTOR_INDEX_PATH = os.path.join(ROOT_DIR, "data", "recipe_vectors")   # prefix of the local .f32/.ids.npy files
+RECIPE_DELTA_DB_PATH = os.path.join(ROOT_DIR, "data", "recipe_metadata_delta.sqlite")   # recipes added online, before merging
+REPLAY_DB_PATH = os.getenv("LAZYCOOK_REPLAY_PATH", os.path.join(ROOT_DIR, "data", "replay_cache.sqlite"))   # recorded model responses
+PROFILE_DIR = os.getenv("LAZYCOOK_PROFILE_DIR", os.path.join(ROOT_DIR, "data", "profiles"))   # profiler output
+HISTORY_CACHE_DIR = os.path.join(ROOT_DIR, "data", ".history_cache")   # per-session recipe image/entry spill files
+
+# --- UI Session Limits ---
+HISTORY_MEMORY_CAP_MB = 8     # in-memory recipe history per Streamlit session; older entries spill to disk
+HISTORY_MAX_ENTRIES = 100     # recipes kept per session (memory and disk)
+JOB_WORKERS = 2               # background generation jobs run at once (shared by all sessions)
+JOB_POLL_SECONDS = 1.0        # how often the UI re-renders while a job is running
 
 # --- Retrieval and Generation Parameters ---
 TOP_K_RECIPES = 3
 IMAGE_GENERATION_COUNT = 3
+PRIOR_OVERSAMPLE = 5     # candidates retrieved per result when re-ranking with the popularity prior
+PRIOR_WEIGHT = 0.15      # weight of the popularity prior vs. vector similarity
+HYDRATION_MARGIN = 5     # extra candidates retrieved so ids missing from the metadata store can be dropped
+QUERY_EXPANSION = "local"       # "local" (PMI co-occurrence, no LLM call) or "llm"
+QUERY_EXPANSION_LLM_FALLBACK = True  # use the LLM when the local expander is missing or matches nothing
+QUERY_EXPANSION_KEYWORDS = 8    # co-occurrence keywords added by the local expander
+DEDUP_THRESHOLD = 0.8    # MinHash Jaccard similarity above which recipes are collapsed at ingest
+CONTEXT_TOKEN_BUDGET = 1024          # retrieved-recipe context in the generation prompt
+REVIEW_RECIPE_TOKEN_BUDGET = 1024    # generated recipe shown to the reviewer
+IMAGE_PROMPT_TOKEN_BUDGET = 64       # dish description sent to the image prompt model
+
+# --- Image Prompts ---
+IMAGE_PROMPT_MODE = os.getenv("LAZYCOOK_IMAGE_PROMPT_MODE", "template")   # "template" (no LLM call) or "llm"
+IMAGE_PROMPT_TEMPLATE = os.getenv(
+    "LAZYCOOK_IMAGE_PROMPT_TEMPLATE",
+    "a {style} of {dish}, with {ingredients}, on a single plate, on a simple {background} background, warm and inviting",
+)
+IMAGE_PROMPT_STYLES = ("watercolor painting", "gouache painting", "colored pencil drawing", "digital painting")
+IMAGE_PROMPT_BACKGROUNDS = ("soft beige", "pale blue", "light gray", "warm cream")
+IMAGE_PROMPT_INGREDIENTS = 4         # main ingredients named in template prompts
+IMAGE_PROMPT_MAX_TOKENS = 1024       # LLM mode; qwen3 spends most of it in its <think> block
+IMAGE_PROMPT_CACHE_SIZE = 512        # LLM-written prompts kept per process, keyed by title and ingredients
+IMAGE_DISPLAY_FORMAT = "WEBP"        # encoding handed to the UI and the HTTP API ("WEBP" or "JPEG")
+IMAGE_DISPLAY_QUALITY = 90
+CLIP_IMAGE_SIZE = 224                # shorter edge images are decoded at for CLIP scoring
+IMAGE_PREVIEW_POLL_SECONDS = 0.5     # polling interval of the WebUI progress endpoint during a render
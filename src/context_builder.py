@@ -0,0 +1,253 @@
+"""This module builds compact, token-budgeted prompt context from retrieved recipes.
+Retrieved recipes are deduplicated, their JSON-string fields parsed and normalized, and
+the result truncated to a token budget measured with a local tokenizer, so prompt length
+stays bounded no matter what the retriever returns."""
+
+import json
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from src import config
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=4)
+def load_token_counter(tokenizer_name: str) -> Callable[[str], int]:
+    """
+    Load a function that counts tokens with a local Hugging Face tokenizer.
+
+    Falls back to an approximate word/punctuation count if the tokenizer cannot be
+    loaded (e.g. offline without a cached copy).
+
+    Args:
+        tokenizer_name (str): Hugging Face tokenizer identifier.
+
+    Returns:
+        Callable[[str], int]: Function returning the token count of a string.
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    except Exception as e:
+        print(f"Tokenizer {tokenizer_name} unavailable ({e}), using approximate token counts")
+        return approximate_token_count
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def approximate_token_count(text: str) -> int:
+    """Approximate token count: one token per word or punctuation mark, plus a margin for long words."""
+    tokens = _WORD_RE.findall(text)
+    return sum(1 + len(t) // 8 for t in tokens)
+
+
+def parse_list_field(value) -> List[str]:
+    """
+    Parse a recipe field that may be a list, a JSON-encoded list string or plain text.
+
+    Args:
+        value: The raw field value.
+
+    Returns:
+        List[str]: The field as a list of stripped, non-empty strings.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("["):
+            try:
+                value = json.loads(text)
+            except json.JSONDecodeError:
+                value = [text]
+        else:
+            value = [text] if text else []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def normalize_recipe(recipe) -> dict:
+    """
+    Normalize a retrieved recipe dict or Recipe object into title and list fields.
+
+    Args:
+        recipe (dict or Recipe): The recipe to normalize.
+
+    Returns:
+        dict: {"title": str, "ingredients": List[str], "directions": List[str]}
+    """
+    if not isinstance(recipe, dict):
+        recipe = recipe.model_dump()
+    return {
+        "title": " ".join(str(recipe.get("title", "")).split()),
+        "ingredients": parse_list_field(recipe.get("ingredients")),
+        "directions": parse_list_field(recipe.get("directions")),
+    }
+
+
+def _title_key(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", title.lower()).strip()
+
+
+def format_recipe(recipe: dict, max_ingredients: Optional[int] = None, max_directions: Optional[int] = None) -> str:
+    """
+    Format a normalized recipe as compact plain text.
+
+    Args:
+        recipe (dict): A recipe as returned by `normalize_recipe`.
+        max_ingredients (int, optional): Keep only the first N ingredients.
+        max_directions (int, optional): Keep only the first N direction steps.
+
+    Returns:
+        str: The formatted recipe.
+    """
+    ingredients = recipe["ingredients"][:max_ingredients]
+    directions = recipe["directions"][:max_directions]
+    lines = [f"Title: {recipe['title']}"]
+    if ingredients:
+        lines.append("Ingredients: " + "; ".join(ingredients))
+    if directions:
+        lines.append("Directions: " + " ".join(f"{i + 1}. {step}" for i, step in enumerate(directions)))
+    return "\n".join(lines)
+
+
+class ContextBuilder:
+    """
+    Builds prompt context under a token budget.
+
+    Used for the retrieved-recipe context of the generator, the recipe shown to the
+    reviewer and the dish description sent to the image prompt model, so all three
+    prompts share one formatting and counting scheme.
+    """
+
+    def __init__(self, token_budget: int = None, count_tokens: Callable[[str], int] = None):
+        """
+        Args:
+            token_budget (int, optional): Default budget for recipe context. Defaults to config.CONTEXT_TOKEN_BUDGET.
+            count_tokens (Callable, optional): Token counter. Defaults to the configured local tokenizer.
+        """
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.count_tokens = count_tokens or load_token_counter(config.CONTEXT_TOKENIZER)
+
+    def _fit_recipe(self, recipe: dict, budget: int) -> Optional[Tuple[str, int]]:
+        """Return the longest formatting of `recipe` that fits in `budget` tokens, dropping steps first,
+        with its token count. Returns None if not even the title and first ingredient fit."""
+        text = format_recipe(recipe)
+        tokens = self.count_tokens(text)
+        if tokens <= budget:
+            return text, tokens
+
+        # Truncation k drops the last k direction steps, then ingredients down to one.
+        # Length shrinks monotonically with k, so binary-search the smallest k that fits.
+        n_dir, n_ing = len(recipe["directions"]), len(recipe["ingredients"])
+
+        def truncated(k: int) -> str:
+            dropped_ing = max(0, k - n_dir)
+            return format_recipe(recipe, n_ing - dropped_ing, max(0, n_dir - k))
+
+        low, high = 1, n_dir + max(0, n_ing - 1)
+        best = None
+        while low <= high:
+            mid = (low + high) // 2
+            text = truncated(mid)
+            tokens = self.count_tokens(text)
+            if tokens <= budget:
+                best = (text, tokens)
+                high = mid - 1
+            else:
+                low = mid + 1
+        return best
+
+    def build_recipes_context(self, recipes: List[dict], token_budget: int = None) -> str:
+        """
+        Build the retrieved-recipe context for the generation prompt.
+
+        Recipes are deduplicated by title, normalized and added in rank order.
+        A recipe that does not fit in the remaining budget is truncated step by step.
+
+        Args:
+            recipes (List[dict]): Retrieved recipes, best first.
+            token_budget (int, optional): Overrides the builder's default budget.
+
+        Returns:
+            str: The formatted context, separated by blank lines.
+        """
+        budget = token_budget or self.token_budget
+        seen = set()
+        blocks = []
+        used = 0  # tokens of the blocks so far, plus 2 per blank-line separator
+        for recipe in recipes:
+            normalized = normalize_recipe(recipe)
+            key = _title_key(normalized["title"])
+            if not key or key in seen:
+                continue
+            seen.add(key)
+
+            remaining = budget - used - (2 if blocks else 0)
+            if remaining <= 0:
+                break
+            fitted = self._fit_recipe(normalized, remaining)
+            if fitted is None:
+                break
+            text, tokens = fitted
+            used += tokens + (2 if blocks else 0)
+            blocks.append(text)
+        return "\n\n".join(blocks)
+
+    def build_recipe_text(self, recipe, token_budget: int = None) -> str:
+        """
+        Format a single recipe (e.g. a generated Recipe for the reviewer) under a budget.
+
+        Args:
+            recipe (dict or Recipe): The recipe to format.
+            token_budget (int, optional): Overrides the builder's default budget.
+
+        Returns:
+            str: The formatted recipe.
+        """
+        normalized = normalize_recipe(recipe)
+        fitted = self._fit_recipe(normalized, token_budget or self.token_budget)
+        return fitted[0] if fitted else f"Title: {normalized['title']}"
+
+    def build_dish_description(self, recipe, token_budget: int = None) -> str:
+        """
+        Build a short "title with ingredients" description for image prompts and CLIP scoring.
+
+        Args:
+            recipe (dict, Recipe or str): The recipe, or an already formatted description.
+            token_budget (int, optional): Defaults to config.IMAGE_PROMPT_TOKEN_BUDGET.
+
+        Returns:
+            str: The description, truncated to whole ingredients within the budget.
+        """
+        budget = token_budget or config.IMAGE_PROMPT_TOKEN_BUDGET
+        if isinstance(recipe, str):
+            return self.truncate(recipe, budget)
+
+        normalized = normalize_recipe(recipe)
+        ingredients = normalized["ingredients"]
+        for n in range(len(ingredients), 0, -1):
+            text = f"{normalized['title']} with {', '.join(ingredients[:n])}"
+            if self.count_tokens(text) <= budget:
+                return text
+        return self.truncate(normalized["title"], budget)
+
+    def truncate(self, text: str, token_budget: int) -> str:
+        """Truncate free text to at most `token_budget` tokens, cutting at word boundaries."""
+        if self.count_tokens(text) <= token_budget:
+            return text
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(" ".join(words[:mid])) <= token_budget:
+                low = mid
+            else:
+                high = mid - 1
+        return " ".join(words[:low])
+
+
+@lru_cache(maxsize=1)
+def get_context_builder() -> ContextBuilder:
+    """Return the shared context builder configured from `config`."""
+    return ContextBuilder()
@@ -1,25 +1,187 @@
-"""This module provides a utility function to load and preprocess a recipe dataset
-for use in downstream tasks such as embedding generation."""
+"""This module provides utilities to load and preprocess a recipe dataset
+for use in downstream tasks such as embedding generation, and to convert it once into a
+columnar Arrow/Parquet file with pre-parsed list columns for fast, projected reads."""
+
+import ast
+import json
+import os
+from typing import List, Optional
 
 import pandas as pd
 
-def load_and_preprocess_data(file_path: str) -> pd.DataFrame:
+LIST_COLUMNS = ("ingredients", "directions", "NER")
+# Columns needed for embedding, deduplication and the metadata store (not "link"/"source")
+PIPELINE_COLUMNS = ["id", "title", "ingredients", "directions", "NER", "full_text"]
+
+
+def parse_list_field(value) -> list:
+    """
+    Parse a JSON-encoded list string from the CSV dataset.
+
+    Args:
+        value: The raw cell value (JSON string, list or missing value).
+
+    Returns:
+        list: The parsed list, or an empty list for missing values.
+    """
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str):
+        return []
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return ast.literal_eval(value)
+
+
+def make_full_text(title: str, ner: list, directions: list) -> str:
+    """Concatenate title, ingredient names and directions into the text used for embeddings."""
+    return f"{title} {' '.join(ner)} {' '.join(directions)}"
+
+
+def _add_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """Add a stable integer "id" column from the dataset's original row index."""
+    if "id" not in df.columns:
+        if "Unnamed: 0" in df.columns:
+            df["id"] = df["Unnamed: 0"].astype("int64")
+        else:
+            df["id"] = pd.RangeIndex(len(df), dtype="int64")
+    return df
+
+
+def load_and_preprocess_data(file_path: str, deduplicate: bool = False, alias_path: str = None,
+                             dedup_threshold: float = 0.8) -> pd.DataFrame:
     """
     This function reads a CSV file containing recipe data and constructs a 'full_text'
     column by concatenating the title, ingredients (from the 'NER' column), and directions.
+    Columnar files written by `convert_csv_to_columnar` are loaded directly, since they
+    already contain parsed list columns and 'full_text', and only the columns in
+    `PIPELINE_COLUMNS` are read.
 
     Args:
-        file_path (str): Path to the CSV file.
+        file_path (str): Path to the CSV, Arrow or Parquet file.
+        deduplicate (bool, optional): Collapse near-duplicate recipes (MinHash/LSH) to one
+            canonical recipe each. Defaults to False.
+        alias_path (str, optional): Where to write the alias table (removed id -> canonical id)
+            as CSV when deduplicating.
+        dedup_threshold (float, optional): Jaccard similarity above which recipes are
+            considered near-duplicates. Defaults to 0.8.
 
     Returns:
-        pd.DataFrame: A DataFrame with the original data and an additional 'full_text' column.
+        pd.DataFrame: A DataFrame with the original data, an 'id' column and a 'full_text' column.
     """
-    df = pd.read_csv(file_path)
+    if file_path.endswith((".arrow", ".feather", ".parquet")):
+        df = load_recipe_table(file_path, columns=PIPELINE_COLUMNS)
+    else:
+        df = _add_ids(pd.read_csv(file_path))
+        df["full_text"] = [
+            make_full_text(title, parse_list_field(ner), parse_list_field(directions))
+            for title, ner, directions in zip(df["title"], df["NER"], df["directions"])
+        ]
 
-    def make_full_text(row):
-        ingredients = " ".join(eval(row["NER"])) if isinstance(row["NER"], str) else ""
-        directions = " ".join(eval(row["directions"])) if isinstance(row["directions"], str) else ""
-        return f"{row['title']} {ingredients} {directions}"
+    if deduplicate:
+        from src.deduplication import deduplicate_recipes
 
-    df["full_text"] = df.apply(make_full_text, axis=1)
+        total = len(df)
+        df, aliases = deduplicate_recipes(df, threshold=dedup_threshold)
+        print(f"Deduplication kept {len(df)} of {total} recipes ({len(aliases)} near-duplicates).")
+        if alias_path:
+            os.makedirs(os.path.dirname(os.path.abspath(alias_path)), exist_ok=True)
+            aliases.to_csv(alias_path, index=False)
     return df
+
+
+def convert_csv_to_columnar(csv_path: str, output_path: str, chunksize: int = 100_000) -> int:
+    """
+    Convert the CSV dataset into an Arrow IPC (.arrow/.feather) or Parquet file.
+
+    List columns are stored as native list<string> columns, 'full_text' is precomputed
+    and every row gets a stable integer 'id'. Arrow IPC files are written uncompressed so
+    they can be memory-mapped; Parquet files are zstd-compressed for storage.
+
+    Args:
+        csv_path (str): Path to the source CSV file.
+        output_path (str): Destination path; the format is chosen from the extension.
+        chunksize (int, optional): Number of CSV rows converted at a time. Defaults to 100000.
+
+    Returns:
+        int: Number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    is_parquet = output_path.endswith(".parquet")
+    writer = None
+    sink = None
+    rows = 0
+    offset = 0
+
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            if "Unnamed: 0" in chunk.columns:
+                chunk["id"] = chunk["Unnamed: 0"].astype("int64")
+            else:
+                chunk["id"] = pd.RangeIndex(offset, offset + len(chunk), dtype="int64")
+            offset += len(chunk)
+
+            for column in LIST_COLUMNS:
+                chunk[column] = [parse_list_field(v) for v in chunk[column]]
+            chunk["full_text"] = [
+                make_full_text(title, ner, directions)
+                for title, ner, directions in zip(chunk["title"], chunk["NER"], chunk["directions"])
+            ]
+            chunk = chunk.drop(columns=[c for c in chunk.columns if c.startswith("Unnamed:")])
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                for column in LIST_COLUMNS:
+                    schema = schema.set(schema.get_field_index(column), pa.field(column, pa.list_(pa.string())))
+                if is_parquet:
+                    writer = pq.ParquetWriter(output_path, schema, compression="zstd")
+                else:
+                    sink = pa.OSFile(output_path, "wb")
+                    writer = pa.ipc.new_file(sink, schema)
+            writer.write_table(table.cast(schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+
+    return rows
+
+
+def load_recipe_table(file_path: str, columns: Optional[List[str]] = None, memory_map: bool = True) -> pd.DataFrame:
+    """
+    Load a columnar recipe file written by `convert_csv_to_columnar`.
+
+    Only the requested columns are read. Arrow IPC files are memory-mapped, so loading
+    e.g. just 'id' and 'title' touches only those column buffers.
+
+    Args:
+        file_path (str): Path to the .arrow/.feather or .parquet file.
+        columns (List[str], optional): Columns to load. Defaults to all columns.
+        memory_map (bool, optional): Memory-map the file instead of reading it into RAM. Defaults to True.
+
+    Returns:
+        pd.DataFrame: The requested columns, with list columns as Python lists.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_path.endswith(".parquet"):
+        table = pq.read_table(file_path, columns=columns, memory_map=memory_map)
+    else:
+        source = pa.memory_map(file_path, "r") if memory_map else pa.OSFile(file_path, "rb")
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+
+    df = table.drop_columns([c for c in LIST_COLUMNS if c in table.column_names]).to_pandas()
+    for column in LIST_COLUMNS:
+        if column in table.column_names:
+            df[column] = table.column(column).to_pylist()
+    return df[table.column_names]
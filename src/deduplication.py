@@ -0,0 +1,227 @@
+"""This module detects near-duplicate recipes with MinHash signatures and LSH banding.
+Signatures are computed over each recipe's normalized NER ingredient set and title words,
+candidate pairs sharing an LSH bucket are verified by estimated Jaccard similarity, and
+each cluster of near-duplicates is collapsed to one canonical recipe id."""
+
+import os
+import re
+import zlib
+from multiprocessing import Pool
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import parse_list_field
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def recipe_tokens(title: str, ner: Sequence[str]) -> List[str]:
+    """
+    Build the token set used for near-duplicate detection.
+
+    Args:
+        title (str): Recipe title.
+        ner (Sequence[str]): Ingredient names from the NER column.
+
+    Returns:
+        List[str]: Sorted unique tokens: normalized ingredient names and title words.
+    """
+    tokens = {"i:" + " ".join(_TOKEN_RE.findall(str(item).lower())) for item in ner}
+    tokens.update("t:" + word for word in _TOKEN_RE.findall(str(title).lower()))
+    tokens.discard("i:")
+    return sorted(tokens) or ["<empty>"]
+
+
+def _permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+    b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def minhash_signatures(token_lists: List[List[str]], num_perm: int = 128, seed: int = 1) -> np.ndarray:
+    """
+    Compute MinHash signatures for a batch of token sets.
+
+    All tokens of the batch are hashed into one flat array, permuted for every hash
+    function at once, and reduced per recipe with `np.minimum.reduceat`.
+
+    Args:
+        token_lists (List[List[str]]): Token set per recipe; each must be non-empty.
+        num_perm (int, optional): Number of hash functions. Defaults to 128.
+        seed (int, optional): Seed for the hash functions. Defaults to 1.
+
+    Returns:
+        np.ndarray: uint32 array of shape (len(token_lists), num_perm).
+    """
+    a, b = _permutations(num_perm, seed)
+    lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(token_lists))
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    hashes = np.fromiter(
+        (zlib.crc32(token.encode()) for tokens in token_lists for token in tokens),
+        dtype=np.uint64,
+        count=int(lengths.sum()),
+    )
+    # (num_perm, total_tokens) universal hashes, truncated to 32 bits
+    permuted = ((hashes[None, :] * a[:, None] + b[:, None]) % _MERSENNE_PRIME) & _MAX_HASH
+    return np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+
+
+def _signature_worker(args):
+    token_lists, num_perm, seed = args
+    return minhash_signatures(token_lists, num_perm, seed)
+
+
+def compute_signatures(titles: Sequence[str], ner_lists: Sequence[Sequence[str]], num_perm: int = 128,
+                       seed: int = 1, workers: int = None, chunk_size: int = 5000) -> np.ndarray:
+    """
+    Compute MinHash signatures for a whole dataset, in parallel across processes.
+
+    Args:
+        titles (Sequence[str]): Recipe titles.
+        ner_lists (Sequence[Sequence[str]]): Parsed NER ingredient lists.
+        num_perm (int, optional): Number of hash functions. Defaults to 128.
+        seed (int, optional): Seed for the hash functions. Defaults to 1.
+        workers (int, optional): Worker processes. Defaults to the number of CPUs; 1 disables the pool.
+        chunk_size (int, optional): Recipes per task. Defaults to 5000.
+
+    Returns:
+        np.ndarray: uint32 array of shape (n_recipes, num_perm).
+    """
+    token_lists = [recipe_tokens(title, ner) for title, ner in zip(titles, ner_lists)]
+    tasks = [(token_lists[i:i + chunk_size], num_perm, seed) for i in range(0, len(token_lists), chunk_size)]
+    if not tasks:
+        return np.zeros((0, num_perm), dtype=np.uint32)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        parts = [_signature_worker(task) for task in tasks]
+    else:
+        with Pool(min(workers, len(tasks))) as pool:
+            parts = pool.map(_signature_worker, tasks)
+    return np.vstack(parts)
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Pick the LSH band count and rows per band whose S-curve threshold is closest to `threshold`.
+
+    Args:
+        num_perm (int): Signature length.
+        threshold (float): Target Jaccard similarity.
+
+    Returns:
+        Tuple[int, int]: (bands, rows per band) with bands * rows <= num_perm.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands == 0:
+            break
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_duplicate_clusters(signatures: np.ndarray, threshold: float = 0.8) -> np.ndarray:
+    """
+    Group near-duplicate recipes using LSH banding and union-find.
+
+    Args:
+        signatures (np.ndarray): MinHash signatures of shape (n_recipes, num_perm).
+        threshold (float, optional): Minimum estimated Jaccard similarity. Defaults to 0.8.
+
+    Returns:
+        np.ndarray: Cluster label per recipe: the row position of the cluster's first member.
+    """
+    n, num_perm = signatures.shape
+    bands, rows = choose_bands(num_perm, threshold)
+    rng = np.random.RandomState(0)
+    multipliers = rng.randint(1, 1 << 62, size=rows, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+
+    # Candidate edges: each recipe paired with the first member of every bucket it shares
+    sources, targets = [], []
+    for band in range(bands):
+        chunk = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (chunk * multipliers).sum(axis=1)  # wraps modulo 2**64
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+        group_first = order[np.maximum.accumulate(np.where(starts, np.arange(n), 0))]
+        duplicate = ~starts
+        sources.append(group_first[duplicate])
+        targets.append(order[duplicate])
+
+    parent = np.arange(n)
+    if sources:
+        src = np.concatenate(sources)
+        dst = np.concatenate(targets)
+        if len(src):
+            pairs = np.unique(np.stack([src, dst], axis=1), axis=0)
+            # Verify candidates with the full signature to drop LSH false positives
+            similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+            for a, b in pairs[similarity >= threshold]:
+                root_a, root_b = _find(parent, a), _find(parent, b)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return np.array([_find(parent, i) for i in range(n)], dtype=np.int64)
+
+
+def deduplicate_recipes(df: pd.DataFrame, threshold: float = 0.8, num_perm: int = 128,
+                        workers: int = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Collapse near-duplicate recipes to one canonical recipe per cluster.
+
+    The canonical recipe of a cluster is the one with the smallest id.
+
+    Args:
+        df (pd.DataFrame): Preprocessed dataset with "id", "title" and "NER" columns.
+        threshold (float, optional): Minimum estimated Jaccard similarity. Defaults to 0.8.
+        num_perm (int, optional): Number of MinHash functions. Defaults to 128.
+        workers (int, optional): Worker processes for signature computation.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The deduplicated dataset, and an alias table
+        with "alias_id" and "canonical_id" columns for every removed recipe.
+    """
+    df = df.sort_values("id", kind="stable").reset_index(drop=True)
+    ner_lists = [parse_list_field(v) for v in df["NER"]]
+    signatures = compute_signatures(df["title"].tolist(), ner_lists, num_perm=num_perm, workers=workers)
+    labels = find_duplicate_clusters(signatures, threshold)
+
+    ids = df["id"].to_numpy()
+    is_canonical = labels == np.arange(len(df))
+    aliases = pd.DataFrame({
+        "alias_id": ids[~is_canonical],
+        "canonical_id": ids[labels[~is_canonical]],
+    })
+    return df[is_canonical].reset_index(drop=True), aliases
+
+
+def load_alias_map(alias_path: str) -> Dict[int, int]:
+    """
+    Load the alias table written by `load_and_preprocess_data(deduplicate=True)`.
+
+    Args:
+        alias_path (str): Path to the CSV with "alias_id" and "canonical_id" columns.
+
+    Returns:
+        Dict[int, int]: Removed recipe id -> canonical recipe id; empty if the file does not exist.
+    """
+    if not os.path.exists(alias_path):
+        return {}
+    aliases = pd.read_csv(alias_path, dtype="int64")
+    return dict(zip(aliases["alias_id"].tolist(), aliases["canonical_id"].tolist()))
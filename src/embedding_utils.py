@@ -1,8 +1,17 @@
 """This module provides utilities for loading a sentence transformer model,
 generating text embeddings, and uploading (upserting) them in batches
 to a vector database index"""
+import multiprocessing as mp
+import os
+import time
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from src.profiling import register_model
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
 def load_embedding_model(model_name: str, device: 'cuda'):
     """
     Load a sentence transformer model for generating embeddings.
@@ -14,22 +23,95 @@ def load_embedding_model(model_name: str, device: 'cuda'):
     Returns:
         SentenceTransformer: The loaded sentence transformer model.
     """
-    return SentenceTransformer(model_name, device=device)
+    model = SentenceTransformer(model_name, device=device)
+    register_model(f"embedding:{model_name}", model)
+    return model
 
-def generate_embeddings(model, texts, batch_size=128, device='cuda'):
+def generate_embeddings(model, texts, batch_size=128, device='cuda', num_workers=1, model_name=None):
     """
     Generate embeddings for one or more text inputs using a sentence transformer model.
 
+    With num_workers > 1 the texts are sorted by token length, cut into chunks of similar
+    length and spread over a pool of worker processes, each holding its own copy of the
+    model. Batches inside a chunk then need almost no padding, and the output keeps the
+    original order of `texts`.
+
     Args:
         model (SentenceTransformer): Preloaded sentence transformer model.
         texts (str or List[str]): A single string or a list of strings to encode.
         batch_size (int, optional): Batch size for processing. Defaults to 128.
         device (str, optional): Device to use for encoding. Defaults to 'cuda'.
+        num_workers (int, optional): Number of worker processes. Defaults to 1 (encode in this process).
+        model_name (str, optional): Model name or path loaded by each worker. Required when num_workers > 1.
 
     Returns:
         np.ndarray: An array of vector embeddings.
     """
-    return model.encode(texts, show_progress_bar=True, batch_size=batch_size, device=device)
+    if isinstance(texts, str) or num_workers <= 1:
+        return model.encode(texts, show_progress_bar=True, batch_size=batch_size, device=device)
+    if model_name is None:
+        raise ValueError("model_name is required to load the model in worker processes")
+    return _generate_embeddings_parallel(model, texts, batch_size, device, num_workers, model_name)
+
+
+def _text_lengths(model, texts, chunk_size=10_000):
+    """Token length of each text, or character length if the model's tokenizer is unavailable.
+    Texts are tokenized in chunks so the token ids of the whole corpus are never held at once."""
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    lengths = np.zeros(len(texts), dtype=np.int64)
+    max_length = getattr(model, "max_seq_length", 512)
+    for i in range(0, len(texts), chunk_size):
+        encoded = tokenizer(texts[i:i + chunk_size], add_special_tokens=False, truncation=True,
+                            max_length=max_length, return_length=True)
+        lengths[i:i + chunk_size] = encoded["length"]
+    return lengths
+
+
+def _init_worker(model_name, device, num_threads):
+    global _worker_model
+    import torch
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name, device=device)
+
+
+def _encode_chunk(args):
+    positions, texts, batch_size = args
+    return positions, _worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+
+def _generate_embeddings_parallel(model, texts, batch_size, device, num_workers, model_name):
+    start = time.perf_counter()
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    order = np.argsort(-_text_lengths(model, texts), kind="stable")
+
+    # Several batches per task keeps the workers busy while bounding result size
+    chunk_size = batch_size * 8
+    tasks = [
+        (order[i:i + chunk_size], [texts[j] for j in order[i:i + chunk_size]], batch_size)
+        for i in range(0, len(texts), chunk_size)
+    ]
+
+    num_threads = max(1, (os.cpu_count() or num_workers) // num_workers)
+    ctx = mp.get_context("spawn")
+    embeddings = None
+    done = 0
+    with ctx.Pool(num_workers, initializer=_init_worker, initargs=(model_name, device, num_threads)) as pool:
+        for positions, chunk_embeddings in pool.imap_unordered(_encode_chunk, tasks):
+            if embeddings is None:
+                embeddings = np.zeros((len(texts), chunk_embeddings.shape[1]), dtype=chunk_embeddings.dtype)
+            embeddings[positions] = chunk_embeddings
+            done += len(positions)
+            elapsed = time.perf_counter() - start
+            print(f"Embedded {done}/{len(texts)} texts ({done / elapsed:.1f} texts/s)", end="\r")
+
+    elapsed = time.perf_counter() - start
+    print(f"\nEmbedded {len(texts)} texts in {elapsed:.1f}s with {num_workers} workers "
+          f"({len(texts) / elapsed:.1f} texts/s).")
+    return embeddings
 
 def batch_upsert(index, vectors, namespace, batch_size=100):
     """
@@ -47,3 +129,20 @@ def batch_upsert(index, vectors, namespace, batch_size=100):
     for i in range(0, len(vectors), batch_size):
         batch = vectors[i:i+batch_size]
         index.upsert(vectors=batch, namespace=namespace)
+
+
+def batch_delete(index, ids, namespace, batch_size=1000):
+    """
+    Delete vectors from a vector index in batches.
+
+    Args:
+        index: The target Pinecone index.
+        ids (list): List of vector ids (strings).
+        namespace (str): The namespace the vectors are stored under.
+        batch_size (int, optional): Number of ids to delete per request. Defaults to 1000.
+
+    Returns:
+        None
+    """
+    for i in range(0, len(ids), batch_size):
+        index.delete(ids=ids[i:i+batch_size], namespace=namespace)
@@ -0,0 +1,119 @@
+"""This module provides a generated image kept in its encoded form. The txt2img server
+returns a PNG of the full render; instead of passing decoded full-size PIL images through
+scoring, job results and the UI, callers keep the encoded bytes and ask for what they
+need: a single decode at CLIP input resolution, or a compressed WebP/JPEG for display."""
+
+import threading
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+
+class EncodedImage:
+    """
+    Encoded image bytes with lazily computed, cached derived forms.
+
+    `for_clip(size)` decodes once and downscales so the shorter edge is `size`;
+    `to_bytes(format, quality)` re-encodes for display; `image` decodes at full size
+    (only for callers that need a PIL image, e.g. `create_image_from_prompt`).
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._derived: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_image(cls, image: Image.Image, format: str = "PNG") -> "EncodedImage":
+        buffer = BytesIO()
+        image.save(buffer, format=format)
+        return cls(buffer.getvalue())
+
+    @property
+    def format(self) -> str:
+        """Format of the encoded bytes as reported by PIL, e.g. "PNG"."""
+        return self._header()[0]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), read from the header without decoding the pixels."""
+        return self._header()[1]
+
+    def _header(self) -> tuple:
+        return self._cached(("header",), lambda: _read_header(self.data))
+
+    def _cached(self, key: tuple, make):
+        with self._lock:
+            value = self._derived.get(key)
+        if value is None:
+            value = make()
+            with self._lock:
+                self._derived[key] = value
+        return value
+
+    @property
+    def image(self) -> Image.Image:
+        """The full-size decoded image (not cached, to avoid holding it)."""
+        image = Image.open(BytesIO(self.data))
+        image.load()
+        return image
+
+    def for_clip(self, size: int = 224) -> Image.Image:
+        """RGB image with its shorter edge at `size` pixels, decoded once and cached."""
+        return self._cached(("clip", size), lambda: _decode_scaled(self.data, size))
+
+    def to_bytes(self, format: str = "WEBP", quality: int = 85) -> bytes:
+        """The image re-encoded as `format` (cached); the original bytes if already in that format."""
+        format = format.upper()
+        if format == self.format:
+            return self.data
+        return self._cached(("encoded", format, quality), lambda: _encode(self.data, format, quality))
+
+    def thumbnail(self, size=(256, 128), quality: int = 70) -> bytes:
+        """A small JPEG fitting in `size`, decoded at reduced scale where the format allows it."""
+        def make():
+            with Image.open(BytesIO(self.data)) as image:
+                image.draft("RGB", size)
+                image = image.convert("RGB")
+                image.thumbnail(size)
+                buffer = BytesIO()
+                image.save(buffer, format="JPEG", quality=quality, optimize=True)
+                return buffer.getvalue()
+
+        return self._cached(("thumbnail", tuple(size), quality), make)
+
+    def _repr_png_(self) -> Optional[bytes]:
+        # Shown inline by IPython.display without decoding in Python
+        return self.data if self.format == "PNG" else None
+
+    def _repr_jpeg_(self) -> Optional[bytes]:
+        return self.data if self.format == "JPEG" else None
+
+    def __repr__(self) -> str:
+        width, height = self.size
+        return f"EncodedImage({self.format}, {width}x{height}, {len(self.data)} bytes)"
+
+
+def _read_header(data: bytes) -> tuple:
+    with Image.open(BytesIO(data)) as image:
+        return image.format, image.size
+
+
+def _decode_scaled(data: bytes, size: int) -> Image.Image:
+    with Image.open(BytesIO(data)) as image:
+        width, height = image.size
+        scale = size / min(width, height)
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image.draft("RGB", target)   # JPEG: decode at a reduced scale directly
+        image = image.convert("RGB")
+        if image.size != target:
+            image = image.resize(target, Image.BICUBIC, reducing_gap=2.0)
+        return image
+
+
+def _encode(data: bytes, format: str, quality: int) -> bytes:
+    with Image.open(BytesIO(data)) as image:
+        buffer = BytesIO()
+        image.convert("RGB").save(buffer, format=format, quality=quality)
+        return buffer.getvalue()
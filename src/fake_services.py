@@ -0,0 +1,473 @@
+"""This module provides local stand-ins for LazyCook's external services, so the pipeline
+can be benchmarked and load-tested on a plain machine: an OpenAI-compatible chat endpoint
+(LM Studio), the SD WebUI txt2img endpoint, a Pinecone-like vector index, the Gemini
+reviewer and the Gemini model behind the shopping agent. Each fake answers in the same
+format as the real service after a latency drawn from a configurable distribution."""
+
+import base64
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+import numpy as np
+
+
+class LatencyModel:
+    """
+    Random service latency in seconds, parsed from a spec string:
+
+    - "0.5": fixed
+    - "uniform:0.2,0.8": uniform between two bounds
+    - "lognormal:0.5,0.4": log-normal with the given median and sigma (long right tail)
+    - "exp:0.5": exponential with the given mean
+    """
+
+    def __init__(self, spec: str = "0", seed: Optional[int] = None):
+        self.spec = str(spec)
+        kind, _, params = self.spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if kind not in {"fixed", "uniform", "lognormal", "exp"}:
+            raise ValueError(f"unknown latency distribution {kind!r} in {spec!r}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "uniform":
+                return self._rng.uniform(*self.params)
+            if self.kind == "lognormal":
+                median, sigma = self.params
+                return median * self._rng.lognormvariate(0.0, sigma) if median > 0 else 0.0
+            if self.kind == "exp":
+                return self._rng.expovariate(1.0 / self.params[0]) if self.params[0] > 0 else 0.0
+            return self.params[0]
+
+    def sleep(self):
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+    def __repr__(self) -> str:
+        return f"LatencyModel({self.spec!r})"
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z]+", text.lower())
+
+
+def fake_chat_content(messages: List[dict]) -> str:
+    """
+    Answer a chat request the way the local Qwen models do: a <think> block followed by
+    keywords, a JSON recipe or an image prompt, depending on the system prompt.
+    """
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+    think = "<think>\nThe user wants something tasty; I will answer in the requested format.\n</think>\n\n"
+    if "query enrichment" in system:
+        words = [w for w in _words(user) if len(w) > 3][:5]
+        return think + ", ".join(words + ["pasta", "tomato", "garlic", "olive oil"])
+    if "recipe assistant" in system:
+        question = re.search(r"question:\s*(.*)", user)
+        ingredients = re.search(r"ingredients:\s*(.*)", user)
+        title_words = _words(question.group(1))[:4] if question else ["house"]
+        have = [i.strip() for i in (ingredients.group(1) if ingredients else "").split(",") if i.strip()]
+        recipe = {
+            "title": " ".join(title_words).title() + " Skillet",
+            "ingredients": have + ["1 tbsp olive oil", "salt", "pepper"],
+            "directions": ["Prepare the ingredients.", "Cook everything in a skillet for 10 minutes.",
+                           "Season and serve."],
+        }
+        return think + json.dumps(recipe, indent=2)
+    if "Stable Diffusion" in system:
+        return think + (f"Positive prompt: a watercolor painting of {user}, on a single plate, "
+                        "on a simple background, warm light")
+    return think + user
+
+
+def _fake_png(width: int, height: int, seed: int = 0) -> bytes:
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    # Smooth gradient plus noise: compresses about as well as a generated image
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // max(width - 1, 1), y * 255 // max(height - 1, 1),
+                     np.full_like(x, 128)], axis=-1)
+    pixels = np.clip(base + rng.integers(-20, 20, base.shape), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeServices:
+    """
+    Threaded HTTP server with a fake `/v1/chat/completions`, `/sdapi/v1/txt2img` and
+    `/sdapi/v1/progress`.
+
+    Use `llm_url` and `image_url` in place of config.LLM_API_URL / config.IMAGE_API_URL.
+    `calls` counts requests per endpoint.
+    """
+
+    def __init__(self, llm_latency: str = "0", image_latency: str = "0", image_size=(1024, 512),
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.llm_latency = LatencyModel(llm_latency, seed)
+        self.image_latency = LatencyModel(image_latency, seed + 1)
+        self.image_base64 = base64.b64encode(_fake_png(*image_size, seed=seed)).decode("ascii")
+        self.preview_base64 = base64.b64encode(_fake_png(image_size[0] // 8, image_size[1] // 8, seed=seed)).decode("ascii")
+        self.calls: Dict[str, int] = {"chat": 0, "txt2img": 0, "progress": 0}
+        self._render = None   # (start, seconds) of the latest txt2img call, for the progress endpoint
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def llm_url(self) -> str:
+        return self.base_url + "/v1/chat/completions"
+
+    @property
+    def image_url(self) -> str:
+        return self.base_url + "/sdapi/v1/txt2img"
+
+    def _count(self, endpoint: str):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    def chat(self, body: dict) -> dict:
+        self._count("chat")
+        self.llm_latency.sleep()
+        content = fake_chat_content(body.get("messages", []))
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        completion_tokens = len(content.split())
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def txt2img(self, body: dict) -> dict:
+        self._count("txt2img")
+        seconds = self.image_latency.sample()
+        self._render = (time.monotonic(), seconds)
+        time.sleep(seconds)
+        return {"images": [self.image_base64], "parameters": body, "info": "{}"}
+
+    def progress(self, query: dict) -> dict:
+        """WebUI-style progress of the latest render, with a low-res preview after 30%."""
+        self._count("progress")
+        progress = 0.0
+        if self._render is not None:
+            start, seconds = self._render
+            progress = min(1.0, (time.monotonic() - start) / seconds) if seconds > 0 else 1.0
+        running = 0.0 < progress < 1.0
+        return {"progress": progress if running else 0.0, "eta_relative": 0.0,
+                "state": {"job_count": int(running)},
+                "current_image": self.preview_base64 if running and progress > 0.3 else None}
+
+    def _make_handler(self):
+        services = self
+        routes = {"/v1/chat/completions": services.chat, "/sdapi/v1/txt2img": services.txt2img}
+        get_routes = {"/sdapi/v1/progress": services.progress}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                handler = routes.get(self.path.split("?")[0])
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status, payload = (200, handler(body)) if handler else (404, {"error": "not found"})
+                self._send(status, payload)
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                handler = get_routes.get(path)
+                status, payload = (200, handler(dict(parse_qsl(query)))) if handler else (404, {"error": "not found"})
+                self._send(status, payload)
+
+            def _send(self, status: int, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeVectorIndex:
+    """
+    In-memory stand-in for the Pinecone index with `upsert` and `query`.
+
+    Recipes without an upserted vector get a random unit vector of the query's dimension
+    on first use, so the index can be filled from metadata alone (e.g. 100recipes.csv).
+    """
+
+    def __init__(self, recipes: List[dict] = (), latency: str = "0", seed: int = 0):
+        """
+        Args:
+            recipes (List[dict]): Metadata per recipe, with "id", "title", "ingredients", "directions".
+            latency (str, optional): LatencyModel spec of one query/upsert round-trip.
+        """
+        self.latency = LatencyModel(latency, seed)
+        self._rng = np.random.default_rng(seed)
+        self.ids = [str(r["id"]) for r in recipes]
+        self.metadata = {str(r["id"]): {k: v for k, v in r.items() if k != "id"} for r in recipes}
+        self.vectors = None
+        self._lock = threading.Lock()
+
+    def _ensure_vectors(self, dim: int):
+        if self.vectors is None or self.vectors.shape[1] != dim or len(self.vectors) < len(self.ids):
+            extra = self._rng.standard_normal((len(self.ids) - (0 if self.vectors is None else len(self.vectors)), dim))
+            extra = (extra / np.linalg.norm(extra, axis=1, keepdims=True)).astype(np.float32)
+            self.vectors = extra if self.vectors is None else np.concatenate([self.vectors, extra])
+
+    def upsert(self, vectors, namespace: str = None, **kwargs) -> dict:
+        """Insert or replace (id, values, metadata) tuples or {"id", "values", "metadata"} dicts."""
+        self.latency.sleep()
+        with self._lock:
+            for item in vectors:
+                if isinstance(item, dict):
+                    vid, values, metadata = item["id"], item["values"], item.get("metadata", {})
+                else:
+                    vid, values, metadata = (tuple(item) + ({},))[:3]
+                values = np.asarray(values, dtype=np.float32)
+                self._ensure_vectors(len(values))
+                vid = str(vid)
+                if vid in self.metadata:
+                    self.vectors[self.ids.index(vid)] = values
+                else:
+                    self.ids.append(vid)
+                    self.vectors = np.concatenate([self.vectors, values[None]])
+                self.metadata[vid] = metadata
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k: int, namespace: str = None, include_metadata: bool = False, **kwargs) -> dict:
+        """Pinecone-style query returning {"matches": [{"id", "score", "metadata"?}]}."""
+        self.latency.sleep()
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._ensure_vectors(len(vector))
+            scores = self.vectors @ vector
+        top = np.argsort(-scores)[:top_k]
+        matches = []
+        for row in top:
+            match = {"id": self.ids[row], "score": float(scores[row])}
+            if include_metadata:
+                match["metadata"] = self.metadata[self.ids[row]]
+            matches.append(match)
+        return {"matches": matches}
+
+
+class FakeReviewer:
+    """
+    Stand-in for the Gemini client used by `review_generated_recipe`.
+
+    Approves with probability `approve_rate`; a rejection asks to drop the last ingredient.
+    Installed with `fake_gemini`.
+    """
+
+    def __init__(self, approve_rate: float = 1.0, latency: str = "0", seed: int = 0):
+        self.approve_rate = approve_rate
+        self.latency = LatencyModel(latency, seed)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.models = self
+
+    def __call__(self, api_key: str = None, **kwargs) -> "FakeReviewer":
+        # Replaces genai.Client: every "client" is this reviewer
+        return self
+
+    def generate_content(self, model: str, contents: str, config: dict = None):
+        self.latency.sleep()
+        with self._lock:
+            self.calls += 1
+            approved = self._rng.random() < self.approve_rate
+        fields = {
+            "approved": approved,
+            "ingredients_to_buy": ["olive oil", "pepper"],
+            "explanation": "Looks good." if approved else "Remove the last ingredient and shorten the steps.",
+        }
+        schema = (config or {}).get("response_schema")
+        return SimpleNamespace(parsed=schema(**fields) if schema else SimpleNamespace(**fields),
+                               text=json.dumps(fields))
+
+
+class _FakeChat:
+    def __init__(self, model: "FakeGenerativeModel", history=None):
+        self.model = model
+        self.history = list(history or [])
+        self._items: List[str] = []
+        self._turn = 0
+
+    def _response(self, parts) -> SimpleNamespace:
+        text = " ".join(p.text for p in parts if getattr(p, "text", None))
+        self.history.append({"role": "model", "parts": [
+            {"text": p.text} if getattr(p, "text", None) else
+            {"function_call": {"name": p.function_call.name, "args": p.function_call.args}} for p in parts
+        ]})
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))], text=text)
+
+    def send_message(self, message):
+        self.model.latency.sleep()
+        self.history.append({"role": "user", "parts": [{"text": message if isinstance(message, str) else
+                                                                 "function responses"}]})
+        self._turn += 1
+        if self._turn == 1:
+            text = message if isinstance(message, str) else ""
+            found = re.search(r"need(?: to buy)?(?: these ingredients)?:?\s*(.+?)\.(?:\s|$)", text)
+            self._items = [i.strip() for i in found.group(1).split(",") if i.strip()] if found else []
+            call = SimpleNamespace(name="check_items_exist", args={"items": self._items})
+            return self._response([SimpleNamespace(function_call=call, text=None)])
+        if self._turn == 2 and self._items:
+            call = SimpleNamespace(name="add_items", args={"items": self._items})
+            return self._response([SimpleNamespace(function_call=call, text=None)])
+        return self._response([SimpleNamespace(function_call=None,
+                                               text=f"I added {', '.join(self._items) or 'nothing'} to your list.")])
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in for `google.generativeai.GenerativeModel` used by the ShoppingListAgent: each
+    request checks the items, adds them, then answers, i.e. three model round-trips.
+    """
+
+    latency = LatencyModel("0")
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start_chat(self, history=None) -> _FakeChat:
+        return _FakeChat(self, history)
+
+
+@contextmanager
+def fake_gemini(reviewer: FakeReviewer = None, agent_latency: str = "0"):
+    """
+    Replace the Gemini clients of the reviewer and the shopping agent for the duration of
+    the block.
+
+    Args:
+        reviewer (FakeReviewer, optional): Reviewer to install; defaults to always approving.
+        agent_latency (str, optional): LatencyModel spec of one shopping agent model round-trip.
+    """
+    from src import llm_interaction, shopping_agent
+
+    reviewer = reviewer or FakeReviewer()
+    model_cls = type("FakeGenerativeModel", (FakeGenerativeModel,), {"latency": LatencyModel(agent_latency)})
+    saved = (llm_interaction.genai, shopping_agent.genai.GenerativeModel)
+    llm_interaction.genai = SimpleNamespace(Client=reviewer)
+    shopping_agent.genai.GenerativeModel = model_cls
+    try:
+        yield reviewer
+    finally:
+        llm_interaction.genai, shopping_agent.genai.GenerativeModel = saved
+
+
+def add_fake_arguments(parser):
+    """Add the latency and behaviour options of `FakeBackends` to an argparse parser."""
+    group = parser.add_argument_group("fake services")
+    group.add_argument("--llm-latency", default="0", help="LatencyModel spec, e.g. 'lognormal:0.8,0.3'")
+    group.add_argument("--image-latency", default="0")
+    group.add_argument("--index-latency", default="0")
+    group.add_argument("--reviewer-latency", default="0")
+    group.add_argument("--agent-latency", default="0")
+    group.add_argument("--approve-rate", type=float, default=0.5, help="Fraction of reviews that approve")
+    group.add_argument("--image-size", default="1024x512")
+    return group
+
+
+class FakeBackends:
+    """
+    Every external service faked at once, as the API server and load generator use them:
+    the fake HTTP endpoints with config.LLM_API_URL / IMAGE_API_URL pointed at them, the
+    fake Gemini reviewer and agent, and a fake index with a metadata store built from a
+    recipe CSV. Recipes added online go to a temporary delta store, not the real one.
+    """
+
+    def __init__(self, llm_latency: str = "0", image_latency: str = "0", index_latency: str = "0",
+                 reviewer_latency: str = "0", agent_latency: str = "0", approve_rate: float = 0.5,
+                 image_size=(1024, 512), data_path: str = None):
+        self.settings = dict(llm_latency=llm_latency, image_latency=image_latency, index_latency=index_latency,
+                             reviewer_latency=reviewer_latency, agent_latency=agent_latency,
+                             approve_rate=approve_rate, image_size=image_size, data_path=data_path)
+        self.services = None
+        self.reviewer = None
+        self.index = None
+        self.metadata_store = None
+        self._stack = None
+        self._tmp = None
+
+    @classmethod
+    def from_args(cls, args, data_path: str = None) -> "FakeBackends":
+        width, height = (int(v) for v in args.image_size.split("x"))
+        return cls(args.llm_latency, args.image_latency, args.index_latency, args.reviewer_latency,
+                   args.agent_latency, args.approve_rate, (width, height), data_path)
+
+    def start(self) -> "FakeBackends":
+        import tempfile
+        from contextlib import ExitStack
+
+        from src import config
+        from src.data_processing import load_and_preprocess_data
+        from src.metadata_store import RecipeMetadataStore
+
+        s = self.settings
+        self._tmp = tempfile.TemporaryDirectory()
+        self.services = FakeServices(s["llm_latency"], s["image_latency"], image_size=s["image_size"])
+        self.reviewer = FakeReviewer(s["approve_rate"], s["reviewer_latency"])
+        self._saved_config = (config.LLM_API_URL, config.IMAGE_API_URL, config.LLM_BACKENDS,
+                              config.IMAGE_BACKENDS, config.RECIPE_DELTA_DB_PATH)
+        config.LLM_API_URL, config.IMAGE_API_URL = self.services.llm_url, self.services.image_url
+        config.LLM_BACKENDS, config.IMAGE_BACKENDS = [self.services.llm_url], [self.services.image_url]
+        config.RECIPE_DELTA_DB_PATH = os.path.join(self._tmp.name, "delta.sqlite")
+        self._stack = ExitStack()
+        self._stack.enter_context(fake_gemini(self.reviewer, s["agent_latency"]))
+
+        df = load_and_preprocess_data(s["data_path"] or os.path.join(config.ROOT_DIR, "data", "100recipes.csv"))
+        rows = [{"id": int(r.id), "title": r.title, "ingredients": r.ingredients, "directions": r.directions}
+                for r in df.itertuples()]
+        self.index = FakeVectorIndex(rows, latency=s["index_latency"])
+        self.metadata_store = RecipeMetadataStore(os.path.join(self._tmp.name, "metadata.sqlite"))
+        self.metadata_store.put_many(rows)
+        return self
+
+    def close(self):
+        from src import config
+
+        self._stack.close()
+        self.services.close()
+        self.metadata_store.close()
+        (config.LLM_API_URL, config.IMAGE_API_URL, config.LLM_BACKENDS,
+         config.IMAGE_BACKENDS, config.RECIPE_DELTA_DB_PATH) = self._saved_config
+        self._tmp.cleanup()
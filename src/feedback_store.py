@@ -0,0 +1,651 @@
+"""This module provides a persistent store for user feedback on generated recipes.
+Feedback is appended to a SQLite database indexed by recipe id, timestamp and rating,
+running aggregates are updated in the same transaction as each insert, and an IVF
+approximate nearest neighbour index over embedded user queries serves "similar past
+feedback" lookups."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.ann_index import IVFIndex
+from src.context_builder import get_context_builder
+
+
+class RecipeFeedback(BaseModel):
+    """
+    Pydantic class for storing user feedback on recipes.
+
+    Attributes:
+        recipe_id (str): Unique identifier for the recipe
+        user_query (str): Original user question/request
+        user_ingredients (str): Ingredients user had available
+        generated_recipe (dict): The recipe that was generated
+        rating (int): User rating (1-5 stars)
+        liked (bool): Simple thumbs up/down preference
+        feedback_text (Optional[str]): Optional detailed feedback from user
+        timestamp (str): When feedback was given
+        retrieved_recipes (list): The context recipes used for generation
+    """
+    recipe_id: str
+    user_query: str
+    user_ingredients: str
+    generated_recipe: dict
+    rating: int
+    liked: bool
+    feedback_text: Optional[str] = None
+    timestamp: str
+    retrieved_recipes: list
+
+
+def generate_recipe_id(title: str, user_query: str) -> str:
+    """Generate a unique ID for a recipe based on its title, the user query and the current time."""
+    content = f"{title}_{user_query}_{datetime.now().isoformat()}"
+    return hashlib.md5(content.encode()).hexdigest()[:12]
+
+
+def build_feedback(recipe, user_query: str, user_ingredients: str, retrieved_recipes: list,
+                   rating: int, liked: bool, feedback_text: Optional[str] = None) -> RecipeFeedback:
+    """
+    Build a feedback entry for a generated recipe.
+
+    Args:
+        recipe (Recipe): The generated recipe.
+        user_query (str): Original user question.
+        user_ingredients (str): Ingredients the user had available.
+        retrieved_recipes (list): Context recipes used for generation, with their "id" fields.
+        rating (int): Rating from 1 to 5.
+        liked (bool): Whether the user would cook the recipe.
+        feedback_text (str, optional): Free-text comment.
+
+    Returns:
+        RecipeFeedback: The entry, ready for `FeedbackStore.add`.
+    """
+    return RecipeFeedback(
+        recipe_id=generate_recipe_id(recipe.title, user_query),
+        user_query=user_query,
+        user_ingredients=user_ingredients,
+        generated_recipe={
+            "title": recipe.title,
+            "ingredients": recipe.ingredients,
+            "directions": recipe.directions,
+        },
+        rating=rating,
+        liked=liked,
+        feedback_text=feedback_text or None,
+        timestamp=datetime.now().isoformat(),
+        retrieved_recipes=retrieved_recipes,
+    )
+
+
+def is_positive(rating: int, liked: bool) -> bool:
+    """Return True if a feedback entry counts as a well-received recipe."""
+    return rating >= 4 and liked
+
+
+def is_negative(rating: int, liked: bool) -> bool:
+    """Return True if a feedback entry counts as a poorly received recipe."""
+    return rating <= 2 or not liked
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipe_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    liked INTEGER NOT NULL,
+    has_text INTEGER NOT NULL,
+    user_query TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    embedded INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_feedback_recipe_ts ON feedback (recipe_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback (timestamp);
+CREATE INDEX IF NOT EXISTS idx_feedback_rating ON feedback (rating, liked, has_text);
+CREATE INDEX IF NOT EXISTS idx_feedback_positive ON feedback (timestamp)
+    WHERE has_text = 1 AND liked = 1 AND rating >= 4;
+CREATE INDEX IF NOT EXISTS idx_feedback_negative ON feedback (timestamp)
+    WHERE has_text = 1 AND (rating <= 2 OR liked = 0);
+CREATE TABLE IF NOT EXISTS aggregates (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+_AGGREGATE_NAMES = (
+    "total",
+    "rating_sum",
+    "liked",
+    "positive",
+    "negative",
+    "positive_ingredients",
+    "positive_steps",
+)
+
+
+class FeedbackStore:
+    """
+    Append-only feedback store backed by SQLite.
+
+    Each new rating is a single indexed INSERT plus a handful of counter updates, so the
+    cost of saving feedback does not grow with the amount already stored. Insights for
+    prompt building are read from the running aggregates and small LIMIT queries served
+    by partial indexes instead of a full scan.
+
+    Query embeddings live next to the database in an append-only float32 file
+    (`<db>.qemb.f32`, ids in `<db>.qemb.ids`, dimension in `<db>.qemb.dim`), which is
+    memory-mapped on open, and the
+    IVF index layout is saved to `<db>.qemb.ivf.npz` so it is not retrained on restart.
+    """
+
+    def __init__(self, db_path: str, embed_fn: Callable[[List[str]], np.ndarray] = None):
+        """
+        Open (or create) a feedback store.
+
+        Args:
+            db_path: Path to the SQLite database file.
+            embed_fn: Optional function mapping a list of user queries to a 2D array of
+                embeddings (e.g. `SentenceTransformer.encode`). When provided, new queries
+                are embedded on insert and `similar_feedback` becomes available. Rows stored
+                without an embedding are embedded by `backfill_embeddings`.
+        """
+        self.db_path = db_path
+        self.embed_fn = embed_fn
+        self._listeners = []
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(feedback)")}
+        if "embedded" not in columns:
+            # Databases created before embeddings moved out of the table
+            self._conn.execute("ALTER TABLE feedback ADD COLUMN embedded INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_unembedded ON feedback (id) WHERE embedded = 0")
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO aggregates (name, value) VALUES (?, 0)",
+            [(name,) for name in _AGGREGATE_NAMES],
+        )
+        self._conn.commit()
+
+        self._emb_vectors_path = db_path + ".qemb.f32"
+        self._emb_ids_path = db_path + ".qemb.ids"
+        self._emb_dim_path = db_path + ".qemb.dim"
+        self._ivf_path = db_path + ".qemb.ivf.npz"
+        self._index: Optional[IVFIndex] = None
+        if embed_fn is not None:
+            self._load_index()
+
+    # ── writes ──────────────────────────────────────────────────
+
+    def add_listener(self, callback: Callable[[RecipeFeedback], None]):
+        """
+        Register a function called with every newly stored feedback entry,
+        e.g. `PopularityPrior.observe_feedback` to keep ranking priors up to date.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, feedback: RecipeFeedback):
+        for callback in self._listeners:
+            callback(feedback)
+
+    def add(self, feedback: RecipeFeedback) -> bool:
+        """
+        Append a feedback entry and update the aggregates.
+
+        Args:
+            feedback: The feedback entry to store.
+
+        Returns:
+            bool: True if the entry was stored, False if it was already present.
+        """
+        with self._lock, self._conn:
+            row_id = self._insert(feedback)
+        if row_id is None:
+            return False
+        if self.embed_fn is not None:
+            self._embed_rows([(row_id, feedback.user_query)])
+        self._notify(feedback)
+        return True
+
+    def add_many(self, entries: List[RecipeFeedback]) -> int:
+        """
+        Append several feedback entries in a single transaction.
+
+        Args:
+            entries: Feedback entries to store.
+
+        Returns:
+            int: Number of entries that were new.
+        """
+        added = []
+        with self._lock, self._conn:
+            for entry in entries:
+                row_id = self._insert(entry)
+                if row_id is not None:
+                    added.append((entry, row_id))
+        if self.embed_fn is not None and added:
+            self._embed_rows([(row_id, entry.user_query) for entry, row_id in added])
+        for entry, _ in added:
+            self._notify(entry)
+        return len(added)
+
+    def import_json(self, json_path: str) -> int:
+        """
+        Import feedback from the legacy `recipe_feedback.json` file.
+        Entries that are already in the store are skipped.
+
+        Args:
+            json_path: Path to the JSON list of feedback entries.
+
+        Returns:
+            int: Number of entries imported.
+        """
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        return self.add_many([RecipeFeedback(**entry) for entry in data])
+
+    def _insert(self, feedback: RecipeFeedback) -> Optional[int]:
+        cursor = self._conn.execute(
+            """INSERT OR IGNORE INTO feedback
+               (recipe_id, timestamp, rating, liked, has_text, user_query, payload)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                feedback.recipe_id,
+                feedback.timestamp,
+                feedback.rating,
+                int(feedback.liked),
+                int(bool(feedback.feedback_text)),
+                feedback.user_query,
+                json.dumps(feedback.model_dump(), ensure_ascii=False),
+            ),
+        )
+        if cursor.rowcount == 0:
+            return None
+
+        positive = is_positive(feedback.rating, feedback.liked)
+        increments = {
+            "total": 1,
+            "rating_sum": feedback.rating,
+            "liked": int(feedback.liked),
+            "positive": int(positive),
+            "negative": int(is_negative(feedback.rating, feedback.liked)),
+            "positive_ingredients": len(feedback.generated_recipe.get("ingredients", [])) if positive else 0,
+            "positive_steps": len(feedback.generated_recipe.get("directions", [])) if positive else 0,
+        }
+        self._conn.executemany(
+            "UPDATE aggregates SET value = value + ? WHERE name = ?",
+            [(value, name) for name, value in increments.items() if value],
+        )
+        return cursor.lastrowid
+
+    # ── reads ───────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        """Return the running aggregates as a dictionary."""
+        rows = self._conn.execute("SELECT name, value FROM aggregates").fetchall()
+        return {name: value for name, value in rows}
+
+    def __len__(self) -> int:
+        return int(self.stats()["total"])
+
+    def get_by_recipe(self, recipe_id: str) -> List[dict]:
+        """Return all feedback entries for a recipe id, oldest first."""
+        rows = self._conn.execute(
+            "SELECT payload FROM feedback WHERE recipe_id = ? ORDER BY timestamp", (recipe_id,)
+        ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def recent(self, limit: int = 10, since: str = None) -> List[dict]:
+        """
+        Return the most recent feedback entries.
+
+        Args:
+            limit: Maximum number of entries to return.
+            since: Optional ISO timestamp; only newer entries are returned.
+
+        Returns:
+            List[dict]: Feedback entries, newest first.
+        """
+        if since:
+            rows = self._conn.execute(
+                "SELECT payload FROM feedback WHERE timestamp > ? ORDER BY timestamp DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT payload FROM feedback ORDER BY timestamp DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def iter_all(self, batch_size: int = 1000):
+        """Yield every feedback entry in insertion order without loading them all at once."""
+        last_id = 0
+        while True:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM feedback WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for row_id, payload in rows:
+                yield json.loads(payload)
+            last_id = rows[-1][0]
+
+    def _patterns(self, positive: bool, limit: int) -> List[dict]:
+        # The WHERE clauses match the partial indexes idx_feedback_positive/negative,
+        # so SQLite walks the index backwards instead of sorting all matching rows.
+        if positive:
+            where = "has_text = 1 AND liked = 1 AND rating >= 4"
+        else:
+            where = "has_text = 1 AND (rating <= 2 OR liked = 0)"
+        rows = self._conn.execute(
+            f"SELECT payload FROM feedback WHERE {where} ORDER BY timestamp DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def get_feedback_insights(self, max_patterns: int = 3) -> dict:
+        """
+        Extract key insights from stored feedback to guide future recipe generation.
+
+        Args:
+            max_patterns: Maximum number of positive and negative examples to return.
+
+        Returns:
+            dict: Positive/negative patterns, common complaints, preferred features and
+                  the total amount of feedback.
+        """
+        stats = self.stats()
+        total = int(stats["total"])
+        insights = {
+            "positive_patterns": [],
+            "negative_patterns": [],
+            "common_complaints": [],
+            "preferred_features": [],
+            "total_feedback": total,
+        }
+        if total == 0:
+            return insights
+
+        for entry in self._patterns(True, max_patterns):
+            insights["positive_patterns"].append({
+                "recipe_title": entry["generated_recipe"]["title"],
+                "rating": entry["rating"],
+                "comment": entry["feedback_text"],
+                "ingredients_count": len(entry["generated_recipe"]["ingredients"]),
+            })
+        for entry in self._patterns(False, max_patterns):
+            insights["negative_patterns"].append({
+                "recipe_title": entry["generated_recipe"]["title"],
+                "rating": entry["rating"],
+                "complaint": entry["feedback_text"],
+                "ingredients_count": len(entry["generated_recipe"]["ingredients"]),
+            })
+            insights["common_complaints"].append(entry["feedback_text"])
+
+        positive = int(stats["positive"])
+        if positive:
+            avg_ingredients = stats["positive_ingredients"] / positive
+            avg_steps = stats["positive_steps"] / positive
+            insights["preferred_features"] = [
+                f"Recipes with ~{avg_ingredients:.0f} ingredients tend to be liked",
+                f"Recipes with ~{avg_steps:.0f} cooking steps work well",
+                f"{positive} out of {total} recipes were well-received",
+            ]
+        return insights
+
+    # ── query similarity index ──────────────────────────────────
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.embed_fn(texts), dtype=np.float32).reshape(len(texts), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _embedding_dim(self) -> int:
+        """Dimension of the stored embeddings, recorded next to the files on first use."""
+        if os.path.exists(self._emb_dim_path):
+            with open(self._emb_dim_path, encoding="utf-8") as f:
+                return int(f.read())
+        # Files written before the dimension was recorded: ask the embedding model
+        dim = self._embed_texts([""]).shape[1]
+        with open(self._emb_dim_path, "w", encoding="utf-8") as f:
+            f.write(str(dim))
+        return dim
+
+    def _read_embeddings(self):
+        """
+        Memory-map the embedding file. Returns (ids, vectors), or None if it is empty.
+
+        Vectors are appended before ids, so an interrupted append leaves trailing vectors
+        (or a partial id) without a partner; both files are cut back to the complete rows.
+        """
+        if not os.path.exists(self._emb_ids_path) or not os.path.exists(self._emb_vectors_path):
+            return None
+        dim = self._embedding_dim()
+        rows = os.path.getsize(self._emb_vectors_path) // (4 * dim)
+        count = min(os.path.getsize(self._emb_ids_path) // 8, rows)
+        with open(self._emb_vectors_path, "r+b") as f:
+            f.truncate(count * dim * 4)
+        with open(self._emb_ids_path, "r+b") as f:
+            f.truncate(count * 8)
+        if count == 0:
+            return None
+        ids = np.fromfile(self._emb_ids_path, dtype=np.int64)
+        vectors = np.memmap(self._emb_vectors_path, dtype=np.float32, mode="r", shape=(count, dim))
+        return ids, vectors
+
+    def _load_index(self):
+        stored = self._read_embeddings()
+        if stored is None:
+            return
+        ids, vectors = stored
+        consumed = 0
+        if os.path.exists(self._ivf_path):
+            # The saved layout lists index rows by id; rows are appended in file order,
+            # so the index covers exactly the first `count` rows of the file.
+            positions = {int(row_id): i for i, row_id in enumerate(ids)}
+            self._index = IVFIndex.load(
+                self._ivf_path, lambda wanted: vectors[[positions[int(i)] for i in wanted]]
+            )
+            consumed = self._index.count
+        else:
+            self._index = IVFIndex(vectors.shape[1])
+        self._index.add(ids[consumed:], vectors[consumed:])
+
+    def _embed_rows(self, rows: List[tuple]):
+        """Embed (row id, user query) pairs, append them to the embedding file and the index."""
+        ids = np.array([row_id for row_id, _ in rows], dtype=np.int64)
+        vectors = self._embed_texts([query for _, query in rows])
+        with self._lock:
+            # Vectors go first and ids second: a crash between the two leaves vectors
+            # without ids, which `_read_embeddings` cuts off. A crash before the rows are
+            # flagged leads to a row being embedded twice; duplicates are ignored on lookup.
+            if not os.path.exists(self._emb_dim_path):
+                with open(self._emb_dim_path, "w", encoding="utf-8") as f:
+                    f.write(str(vectors.shape[1]))
+            with open(self._emb_vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._emb_ids_path, "ab") as f:
+                f.write(ids.tobytes())
+            if self._index is None:
+                self._index = IVFIndex(vectors.shape[1])
+            self._index.add(ids, vectors)
+            with self._conn:
+                self._conn.executemany("UPDATE feedback SET embedded = 1 WHERE id = ?", [(int(i),) for i in ids])
+
+    def backfill_embeddings(self, batch_size: int = 256) -> int:
+        """
+        Embed every stored row that has no query embedding yet, in batches.
+
+        Rows stored while the store was opened without an `embed_fn` (e.g. a bulk
+        `import_json`) are only searchable after this has run.
+
+        Args:
+            batch_size: Number of queries passed to `embed_fn` at once.
+
+        Returns:
+            int: Number of rows embedded.
+        """
+        if self.embed_fn is None:
+            raise ValueError("backfill_embeddings requires the store to be created with an embed_fn")
+        total = 0
+        while True:
+            rows = self._conn.execute(
+                "SELECT id, user_query FROM feedback WHERE embedded = 0 ORDER BY id LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                return total
+            self._embed_rows(rows)
+            total += len(rows)
+
+    def save_index(self):
+        """Persist the IVF index layout so it does not need retraining on the next open."""
+        if self._index is not None:
+            with self._lock:
+                self._index.save(self._ivf_path)
+
+    def similar_feedback(self, query: str, k: int = 5, min_similarity: float = 0.0) -> List[dict]:
+        """
+        Find past feedback whose user query is most similar to the given query.
+
+        Args:
+            query: The new user query.
+            k: Number of entries to return.
+            min_similarity: Minimum cosine similarity for an entry to be returned.
+
+        Returns:
+            List[dict]: Feedback entries with an added "similarity" field, most similar first.
+        """
+        if self.embed_fn is None:
+            raise ValueError("similar_feedback requires the store to be created with an embed_fn")
+        if self._index is None:
+            return []
+
+        query_vector = self._embed_texts([query])[0]
+        with self._lock:
+            # `_embed_rows` appends to the IVF lists under the same lock
+            ids, scores = self._index.search(query_vector, 2 * k)
+        hits = {}
+        for row_id, score in zip(ids.tolist(), scores.tolist()):
+            if score >= min_similarity and row_id not in hits:
+                hits[row_id] = score
+            if len(hits) == k:
+                break
+        if not hits:
+            return []
+
+        placeholders = ",".join("?" * len(hits))
+        rows = self._conn.execute(
+            f"SELECT id, payload FROM feedback WHERE id IN ({placeholders})", list(hits)
+        ).fetchall()
+        payloads = dict(rows)
+        results = []
+        for row_id, score in hits.items():
+            entry = json.loads(payloads[row_id])
+            entry["similarity"] = score
+            results.append(entry)
+        return results
+
+    def close(self):
+        """Save the query index layout and close the underlying database connection."""
+        self.save_index()
+        self._conn.close()
+
+
+def open_feedback_store(db_path: str, json_path: Optional[str] = None,
+                        embed_fn: Callable[[List[str]], np.ndarray] = None) -> FeedbackStore:
+    """
+    Open the feedback store, importing the legacy JSON file the first time.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        json_path (str, optional): Legacy `recipe_feedback.json`, imported if the store is empty.
+        embed_fn (Callable, optional): Query embedding function, see `FeedbackStore`.
+
+    Returns:
+        FeedbackStore: The opened store.
+    """
+    store = FeedbackStore(db_path, embed_fn=embed_fn)
+    if json_path and len(store) == 0:
+        imported = store.import_json(json_path)
+        if imported:
+            print(f"Imported {imported} feedback entries from {json_path}")
+    return store
+
+
+def create_feedback_enhanced_prompt(question: str, ingredients: str, recipes_for_llm: list, store: FeedbackStore) -> str:
+    """
+    Create an enhanced prompt that includes lessons learned from user feedback.
+
+    Args:
+        question (str): The user's cooking request.
+        ingredients (str): Ingredients the user has.
+        recipes_for_llm (list): Context recipes from retrieval.
+        store (FeedbackStore): Store to read feedback insights from.
+
+    Returns:
+        str: The generation prompt.
+    """
+    insights = store.get_feedback_insights()
+    context = get_context_builder().build_recipes_context(recipes_for_llm)
+
+    enhanced_prompt = f"""You are a recipe assistant that learns from user feedback.
+
+User Request: {question}
+Available Ingredients: {ingredients}
+Context Recipes:
+{context}
+
+IMPORTANT - LEARN FROM PAST FEEDBACK:
+"""
+
+    if insights["total_feedback"] == 0:
+        enhanced_prompt += """
+FIRST-TIME RUN: No user feedback data available yet.
+- Focus on creating a well-balanced, appealing recipe
+- Use available ingredients effectively
+- Keep it simple but flavorful
+"""
+    else:
+        if insights["positive_patterns"]:
+            enhanced_prompt += "\nWHAT USERS LOVED (do more of this):\n"
+            for pattern in insights["positive_patterns"]:
+                enhanced_prompt += f"- '{pattern['recipe_title']}' ({pattern['rating']}/5): {pattern['comment']}\n"
+
+        if insights["negative_patterns"]:
+            enhanced_prompt += "\nWHAT USERS DISLIKED (avoid this):\n"
+            for pattern in insights["negative_patterns"]:
+                enhanced_prompt += f"- '{pattern['recipe_title']}' ({pattern['rating']}/5): {pattern['complaint']}\n"
+
+        if insights["preferred_features"]:
+            enhanced_prompt += "\nUSER PREFERENCES:\n"
+            for feature in insights["preferred_features"]:
+                enhanced_prompt += f"- {feature}\n"
+
+    enhanced_prompt += """
+
+Based on this information, create a recipe that users will actually want to cook.
+Avoid past mistakes and incorporate successful patterns.
+
+Return ONLY a JSON object in this format:
+{
+  "title": "...",
+  "ingredients": ["..."],
+  "directions": ["..."]
+}
+"""
+    return enhanced_prompt
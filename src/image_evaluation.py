@@ -1,10 +1,15 @@
 """This module provides utilities for computing semantic similarity between images and
 text using OpenAI's CLIP model via the Hugging Face Transformers library."""
 
+from typing import List
+
 import torch
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 
+from src.profiling import register_model
+from src.telemetry import traced
+
 def load_clip_model(model_name: str, device: str):
     """
     Load a pre-trained CLIP model and its processor.
@@ -18,8 +23,10 @@ def load_clip_model(model_name: str, device: str):
     """
     model = CLIPModel.from_pretrained(model_name).to(device)
     processor = CLIPProcessor.from_pretrained(model_name)
+    register_model(f"clip:{model_name}", model)
     return model, processor
 
+@traced("clip")
 def compute_image_text_similarity(image: Image.Image, text: str, model, processor) -> float:
     """
     Compute the cosine similarity between an image and a text description using CLIP.
@@ -52,3 +59,34 @@ def compute_image_text_similarity(image: Image.Image, text: str, model, processo
     text_embeds = text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
     similarity = torch.matmul(text_embeds, image_embeds.T).item()
     return similarity
+
+
+@traced("clip")
+def compute_image_text_similarities(images: List[Image.Image], texts: List[str], model, processor) -> List[float]:
+    """
+    Compute CLIP cosine similarity for several (image, text) pairs in one forward pass.
+
+    Args:
+        images (List[PIL.Image.Image]): The images to evaluate.
+        texts (List[str]): One description per image.
+        model (CLIPModel): A pre-loaded CLIP model.
+        processor (CLIPProcessor): The corresponding processor for the CLIP model.
+
+    Returns:
+        List[float]: Similarity of each image with its own text.
+    """
+    inputs = processor(
+        text=list(texts),
+        images=list(images),
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        max_length=77
+    )
+    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    with torch.no_grad():
+        image_embeds = model.get_image_features(pixel_values=inputs["pixel_values"])
+        text_embeds = model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+    image_embeds = image_embeds / image_embeds.norm(p=2, dim=-1, keepdim=True)
+    text_embeds = text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
+    return (image_embeds * text_embeds).sum(dim=-1).tolist()
@@ -2,24 +2,24 @@
 natural language prompts and a text-to-image generation API."""
 
 import base64
-from io import BytesIO
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
 import requests
 from PIL import Image
+from src import config
+from src.context_builder import get_context_builder, normalize_recipe
+from src.encoded_image import EncodedImage
+from src.model_router import chat_completion, get_router, image_route
+from src.response_parsing import ResponseParseError, parse_text
+from src.telemetry import increment, span
 
-def get_image_prompt_from_llm(recipe: str, url: str) -> str:
-    """
-    Generate a stylized image prompt for a dish using a language model.
-
-    Args:
-        recipe (str): Textual description of the recipe or dish.
-        url (str): API endpoint for the language model.
-
-    Returns:
-        str: A cleaned positive prompt string suitable for use with image generation models.
-    """
-    headers = {"Content-Type": "application/json"}
+logger = logging.getLogger(__name__)
 
-    system_prompt = """You are a helpful AI Assistant.
+IMAGE_PROMPT_SYSTEM = """You are a helpful AI Assistant.
 You write prompts for Stable Diffusion image generation, focused exclusively on food as the main subject.
 
 Rules to follow:
@@ -40,41 +40,182 @@ Example:
 
 Positive prompt: a watercolor painting of a slice of strawberry cheesecake, creamy texture with bright red strawberries on top, on a white ceramic plate, placed on a soft beige background, warm and inviting"""
 
+
+# Leading quantities, units and sizes dropped from ingredient lines in template prompts
+_QUANTITY_RE = re.compile(
+    r"^(?:[\d/.,-]+\s*|(?:c|cups?|tbsp|tsp|tablespoons?|teaspoons?|oz|ounces?|lbs?|pounds?|g|grams?|kg|ml|l|"
+    r"cans?|cartons?|jars?|pkgs?|packages?|sticks?|pinch|dash|large|medium|small|whole|of)\.?\s+)+",
+    re.IGNORECASE,
+)
+
+
+class PromptCache:
+    """Thread-safe LRU cache of LLM-written image prompts."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._prompts: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None:
+                self._prompts.move_to_end(key)
+        increment("cache_hits_total" if prompt is not None else "cache_misses_total", cache="image_prompt")
+        return prompt
+
+    def put(self, key: tuple, prompt: str):
+        with self._lock:
+            self._prompts[key] = prompt
+            self._prompts.move_to_end(key)
+            while len(self._prompts) > self.max_size:
+                self._prompts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._prompts.clear()
+
+
+_prompt_cache = PromptCache(config.IMAGE_PROMPT_CACHE_SIZE)
+
+
+def _dish_parts(recipe) -> Tuple[str, List[str]]:
+    """Title and ingredient lines of a Recipe/dict, or of a "title with a, b, c" description."""
+    if isinstance(recipe, str):
+        title, _, ingredients = recipe.partition(" with ")
+        return " ".join(title.split()), [i.strip() for i in ingredients.split(",") if i.strip()]
+    normalized = normalize_recipe(recipe)
+    return normalized["title"], normalized["ingredients"]
+
+
+def _ingredient_name(line: str) -> str:
+    """"2 c. shredded cheddar cheese, divided" -> "shredded cheddar cheese"."""
+    return _QUANTITY_RE.sub("", re.sub(r"\([^)]*\)", " ", line).split(",")[0].strip()).strip().lower()
+
+
+def build_template_image_prompt(recipe, template: str = None) -> str:
+    """
+    Fill the deployment's image prompt template from the dish title and main ingredients,
+    without calling the LLM. The style and background are picked from the configured
+    lists by a hash of the title, so the same dish always gets the same prompt.
+
+    Args:
+        recipe (str, dict or Recipe): The recipe, or a "title with ingredients" description.
+        template (str, optional): Format string with {style}, {dish}, {ingredients} and
+            {background}. Defaults to config.IMAGE_PROMPT_TEMPLATE.
+
+    Returns:
+        str: The positive prompt.
+    """
+    title, ingredients = _dish_parts(recipe)
+    names = []
+    for line in ingredients:
+        name = _ingredient_name(line)
+        if name and name not in names:
+            names.append(name)
+    digest = zlib.crc32(title.lower().encode("utf-8"))
+    return (template or config.IMAGE_PROMPT_TEMPLATE).format(
+        style=config.IMAGE_PROMPT_STYLES[digest % len(config.IMAGE_PROMPT_STYLES)],
+        background=config.IMAGE_PROMPT_BACKGROUNDS[(digest >> 8) % len(config.IMAGE_PROMPT_BACKGROUNDS)],
+        dish=title.lower() or "a dish",
+        ingredients=", ".join(names[:config.IMAGE_PROMPT_INGREDIENTS]) or "fresh ingredients",
+    )
+
+
+def get_image_prompt_from_llm(recipe, url: str, mode: str = None) -> str:
+    """
+    Generate a stylized image prompt for a dish.
+
+    In "template" mode the prompt is filled from the dish title and ingredients without a
+    model call (see `build_template_image_prompt`). In "llm" mode config.LLM_MODEL writes
+    it, and prompts are cached by title and ingredients.
+
+    Args:
+        recipe (str or Recipe): Textual description of the recipe or dish, or the recipe itself.
+        url (str): API endpoint for the language model.
+        mode (str, optional): "template" or "llm". Defaults to config.IMAGE_PROMPT_MODE.
+
+    Returns:
+        str: A cleaned positive prompt string suitable for use with image generation models.
+    """
+    if (mode or config.IMAGE_PROMPT_MODE) == "template":
+        return build_template_image_prompt(recipe)
+
+    title, ingredients = _dish_parts(recipe)
+    key = (config.LLM_MODEL, title.lower(), tuple(sorted(i.lower() for i in ingredients)))
+    cached = _prompt_cache.get(key)
+    if cached is not None:
+        return cached
+
     data = {
-        "model": "qwen3-0.6b",
         "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": recipe}
+            {"role": "system", "content": IMAGE_PROMPT_SYSTEM},
+            {"role": "user", "content": get_context_builder().build_dish_description(recipe)}
         ],
         "temperature": 0.1,
-        "max_tokens": 1024,
+        "max_tokens": config.IMAGE_PROMPT_MAX_TOKENS,
         "stream": False
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    answer = response.json()["choices"][0]["message"]["content"].strip()
+    with span("image_prompt"):
+        answer = chat_completion([config.LLM_MODEL], url, data).strip()
 
-    if "</think>" in answer:
-        clean_answer = answer.split("</think>")[-1].strip()
-    else:
-        clean_answer = answer.strip()
+    try:
+        clean_answer = parse_text(answer, "image_prompt")
+    except ResponseParseError as e:
+        # Reasoning used up the token budget: fall back to the template (not cached)
+        logger.warning("%s; using the template prompt", e)
+        return build_template_image_prompt(recipe)
 
-    print(clean_answer)
+    logger.debug("Raw image prompt output:\n%s", clean_answer)
 
     prompt = clean_answer.replace("Positive prompt:", "").strip()
+    _prompt_cache.put(key, prompt)
     return prompt
 
 
-def create_image_from_prompt(prompt: str, url: str) -> Image.Image:
+def _progress_url(txt2img_url: str) -> str:
+    """The WebUI progress endpoint next to a `/sdapi/v1/txt2img` URL."""
+    return txt2img_url.rsplit("/", 1)[0] + "/progress"
+
+
+def _poll_progress(url: str, on_preview: Callable[[float, Optional[EncodedImage]], None], done: threading.Event):
     """
-    Generate an image using a text prompt and a text-to-image generation API.
+    Call `on_preview(progress, preview)` with the WebUI's progress and its latest low-res
+    preview (None until the server has one) until `done` is set. The progress endpoint
+    reports the server's current job, so concurrent renders may see each other's preview.
+    """
+    last_preview = None
+    while not done.wait(config.IMAGE_PREVIEW_POLL_SECONDS):
+        try:
+            response = requests.get(url, params={"skip_current_image": "false"},
+                                    timeout=config.IMAGE_PREVIEW_POLL_SECONDS * 2)
+            response.raise_for_status()
+            state = response.json()
+        except (requests.RequestException, ValueError):
+            continue
+        current = state.get("current_image")
+        if current and current != last_preview:
+            last_preview = current
+            on_preview(float(state.get("progress") or 0.0), EncodedImage(base64.b64decode(current)))
+        else:
+            on_preview(float(state.get("progress") or 0.0), None)
+
+
+def render_image(prompt: str, url: str,
+                 on_preview: Callable[[float, Optional[EncodedImage]], None] = None) -> EncodedImage:
+    """
+    Generate an image with the text-to-image API and keep it encoded.
 
     Args:
         prompt (str): Text description of the image to generate.
         url (str): API endpoint of the image generation model.
+        on_preview (callable, optional): Called with (progress 0-1, EncodedImage or None)
+            while the render runs, from the WebUI's `/sdapi/v1/progress` endpoint.
 
     Returns:
-        Image.Image: The generated image as a PIL Image object.
+        EncodedImage: The image as returned by the server (usually PNG), not decoded.
     """
     payload = {
         "prompt": prompt,
@@ -87,14 +228,40 @@ def create_image_from_prompt(prompt: str, url: str) -> Image.Image:
         "seed": -1 
     }
 
-    response = requests.post(url, json=payload)
-    result = response.json()
+    def txt2img(backend):
+        done = threading.Event()
+        poller = None
+        if on_preview is not None:
+            poller = threading.Thread(target=_poll_progress, args=(_progress_url(backend.url), on_preview, done),
+                                      name="txt2img-progress", daemon=True)
+            poller.start()
+        try:
+            response = requests.post(backend.url, json=payload, timeout=config.LLM_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            # Only the image is kept; the echoed parameters and info are dropped with the response
+            return base64.b64decode(response.json()["images"][0])
+        finally:
+            done.set()
+            if poller is not None:
+                poller.join()
 
-    # Decode the image
-    image_base64 = result['images'][0]
-    image_bytes = base64.b64decode(image_base64)
-    image = Image.open(BytesIO(image_bytes))
+    # Routed like the LLM calls across config.IMAGE_BACKENDS, so a failing image server
+    # trips its circuit breaker and the next one takes over
+    with span("image_render", steps=payload["steps"]):
+        data = get_router().call(image_route(url), txt2img)
+    return EncodedImage(data)
 
-    # Display inline in Jupyter
-    # display(image)
-    return image
+
+def create_image_from_prompt(prompt: str, url: str) -> Image.Image:
+    """
+    Generate an image using a text prompt and a text-to-image generation API.
+
+    Args:
+        prompt (str): Text description of the image to generate.
+        url (str): API endpoint of the image generation model.
+
+    Returns:
+        Image.Image: The generated image as a PIL Image object (use `render_image` to
+        keep it encoded).
+    """
+    return render_image(prompt, url).image
@@ -0,0 +1,375 @@
+"""This module turns dietary constraints in a query ("no nuts", "I'm allergic to shellfish")
+into recipe id filters. Per-ingredient roaring bitmaps over recipe ids are built from the
+dataset's `NER` column, and the vector search uses the resulting filter while it selects
+candidates, so excluded recipes never reach the generation context."""
+
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.bitmap import RoaringBitmap
+from src.data_processing import parse_list_field
+from src.query_expansion import normalize_term
+
+# Words that stand for a whole group of ingredients
+INGREDIENT_GROUPS = {
+    "nut": ["nut", "almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia", "peanut",
+            "pine nut", "brazil nut", "praline", "marzipan", "nutella"],
+    "tree nut": ["almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia", "pine nut", "brazil nut"],
+    "shellfish": ["shrimp", "prawn", "crab", "lobster", "scallop", "clam", "mussel", "oyster", "crawfish",
+                  "crayfish", "langoustine", "squid", "calamari", "octopus"],
+    "seafood": ["fish", "shrimp", "prawn", "crab", "lobster", "scallop", "clam", "mussel", "oyster", "salmon",
+                "tuna", "cod", "tilapia", "anchovy", "sardine", "halibut", "squid", "calamari", "octopus"],
+    "fish": ["fish", "salmon", "tuna", "cod", "tilapia", "anchovy", "sardine", "halibut", "trout", "haddock",
+             "mackerel", "catfish", "snapper", "bass", "swordfish"],
+    "dairy": ["milk", "cheese", "butter", "cream", "yogurt", "yoghurt", "buttermilk", "ghee", "mozzarella",
+              "parmesan", "cheddar", "ricotta", "mascarpone", "whey", "half and half"],
+    "lactose": ["milk", "cheese", "cream", "yogurt", "yoghurt", "buttermilk", "ricotta", "mascarpone", "whey"],
+    "gluten": ["flour", "wheat", "bread", "breadcrumb", "pasta", "spaghetti", "noodle", "barley", "rye",
+               "couscous", "cracker", "tortilla", "biscuit", "semolina", "macaroni", "crouton"],
+    "egg": ["egg", "mayonnaise", "meringue"],
+    "soy": ["soy", "soya", "tofu", "edamame", "miso", "tempeh", "soy sauce"],
+    "pork": ["pork", "bacon", "ham", "sausage", "prosciutto", "pancetta", "chorizo", "salami", "lard"],
+    "meat": ["beef", "pork", "chicken", "turkey", "lamb", "bacon", "ham", "sausage", "veal", "duck", "steak",
+             "hamburger", "mince", "meat", "prosciutto", "pancetta", "chorizo", "salami", "venison"],
+    "sesame": ["sesame", "tahini"],
+}
+INGREDIENT_GROUPS["nuts"] = INGREDIENT_GROUPS["nut"]
+INGREDIENT_GROUPS["tree nuts"] = INGREDIENT_GROUPS["tree nut"]
+INGREDIENT_GROUPS["eggs"] = INGREDIENT_GROUPS["egg"]
+INGREDIENT_GROUPS["wheat"] = INGREDIENT_GROUPS["gluten"]
+INGREDIENT_GROUPS["vegetarian"] = INGREDIENT_GROUPS["meat"] + INGREDIENT_GROUPS["seafood"]
+INGREDIENT_GROUPS["vegan"] = INGREDIENT_GROUPS["vegetarian"] + INGREDIENT_GROUPS["dairy"] + ["egg", "honey", "gelatin"]
+
+# Ingredients that share a word with a group but are not part of it
+GROUP_EXCEPTIONS = {
+    "dairy": {"peanut butter", "almond butter", "apple butter", "cocoa butter", "coconut milk", "coconut cream",
+              "almond milk", "soy milk", "oat milk", "rice milk", "cream of tartar", "nut butter", "butter beans",
+              "cream style corn", "cream style", "butternut squash"},
+    "lactose": {"coconut milk", "coconut cream", "almond milk", "soy milk", "oat milk", "rice milk", "cream of tartar"},
+    "nut": {"nutmeg", "coconut", "butternut squash", "water chestnut", "water chestnuts"},
+    "gluten": {"rice flour", "corn tortilla", "corn tortillas", "almond flour", "coconut flour", "gluten free flour"},
+}
+GROUP_EXCEPTIONS["nuts"] = GROUP_EXCEPTIONS["nut"]
+GROUP_EXCEPTIONS["wheat"] = GROUP_EXCEPTIONS["gluten"]
+GROUP_EXCEPTIONS["vegan"] = GROUP_EXCEPTIONS["dairy"]
+
+# A list of items ends at punctuation or where the sentence moves on ("..., but", "... and I want")
+_END = (r"(?=\s*,?\s*(?:[.;:!?()]|$|(?:but|please|i|we|my|it|something|give|make|no|not|without)\b|"
+        r"and\s+(?:i|we|my|it|something|make|want|no|not)\b))")
+_EXCLUDE_PATTERNS = [
+    re.compile(r"\b(?:no|without|minus|excluding|except|free of|avoid(?:ing)?|hold the|skip(?:ping)? the)\s+"
+               r"((?:[a-z][a-z \-]*?)(?:\s*(?:,|\bor\b|\bnor\b|\band\b)\s*[a-z][a-z \-]*?)*?)" + _END),
+    re.compile(r"\b(?:allergic to|allergy to|allergies to|intolerant to|intolerance to|sensitive to|"
+               r"(?:can'?t|cannot|can not|don'?t|do not|won'?t|never) (?:eat|have|stand|tolerate|like|want|use)|"
+               r"(?:hate|dislike|not a fan of))\s+"
+               r"((?:[a-z][a-z \-]*?)(?:\s*(?:,|\bor\b|\bnor\b|\band\b)\s*[a-z][a-z \-]*?)*?)" + _END),
+    re.compile(r"\b([a-z]+(?: [a-z]+)?)[- ]free\b"),
+    re.compile(r"\b([a-z]+(?: [a-z]+)?) (?:allergy|allergies|intolerance)\b"),
+    re.compile(r"\b(?:i am|i'm|im|we are|we're)\s+(vegan|vegetarian)\b"),
+    re.compile(r"\b(vegan|vegetarian)\s+(?:recipe|dish|meal|food|option)"),
+]
+# Explicit requirements are hard filters; "with X" / "using X" only prefers recipes with X,
+# since it is just as often not an ingredient request ("to go with rice", "with a lot of flavor")
+_REQUIRE_PATTERNS = [
+    re.compile(r"\b(?:must|has to|have to|needs to|need to|should)\s+(?:have|include|contain|use|be made with)\s+"
+               r"((?:[a-z][a-z \-]*?)(?:\s*(?:,|\band\b)\s*[a-z][a-z \-]*?)*?)" + _END),
+]
+_PREFER_PATTERNS = [
+    re.compile(r"\b(?:with|using|made with|based on)\s+(?:some\s+|lots of\s+|a lot of\s+)?"
+               r"((?:[a-z][a-z \-]*?)(?:\s*(?:,|\band\b)\s*[a-z][a-z \-]*?)*?)" + _END),
+]
+_SPLIT_RE = re.compile(r"\s*(?:,|\bor\b|\bnor\b|\band\b)\s*")
+_FILLER_RE = re.compile(r"^(?:no|any|some|the|a|an|added|real|fresh|raw|too much|much|more)\s+")
+
+
+class IngredientConstraints:
+    """Ingredient keywords a query requires (`include`), rules out (`exclude`) or would like (`prefer`)."""
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = (), prefer: Iterable[str] = ()):
+        self.include = list(dict.fromkeys(include))
+        self.exclude = list(dict.fromkeys(exclude))
+        self.prefer = list(dict.fromkeys(prefer))
+
+    def __bool__(self) -> bool:
+        return bool(self.include or self.exclude or self.prefer)
+
+    def __repr__(self) -> str:
+        return f"IngredientConstraints(include={self.include}, exclude={self.exclude}, prefer={self.prefer})"
+
+
+def _split_items(phrase: str) -> List[str]:
+    items = []
+    for item in _SPLIT_RE.split(phrase):
+        item = _FILLER_RE.sub("", normalize_term(item))
+        if item:
+            items.append(item)
+    return items
+
+
+def extract_constraints(text: str) -> IngredientConstraints:
+    """
+    Extract ingredient constraints from free text, e.g.
+    "something with chicken, no nuts please, I'm allergic to shellfish"
+    -> prefer ["chicken"], exclude ["nuts", "shellfish"];
+    "it must include chicken" -> include ["chicken"].
+
+    Keywords are not checked against the dataset here; `IngredientIndex.build_filter`
+    drops the ones that match no ingredient.
+
+    Args:
+        text (str): The user's question.
+
+    Returns:
+        IngredientConstraints: The extracted keywords.
+    """
+    text = text.lower().replace("’", "'")
+    exclude = []
+    for pattern in _EXCLUDE_PATTERNS:
+        for match in pattern.finditer(text):
+            exclude.extend(_split_items(match.group(1)))
+    # "with" inside an exclusion ("no dish with nuts") must not become an inclusion
+    masked = text
+    for pattern in _EXCLUDE_PATTERNS:
+        masked = pattern.sub(" . ", masked)
+    include = []
+    for pattern in _REQUIRE_PATTERNS:
+        for match in pattern.finditer(masked):
+            include.extend(_split_items(match.group(1)))
+        masked = pattern.sub(" . ", masked)
+    prefer = []
+    for pattern in _PREFER_PATTERNS:
+        for match in pattern.finditer(masked):
+            prefer.extend(_split_items(match.group(1)))
+    return IngredientConstraints(include=[i for i in include if i not in exclude], exclude=exclude,
+                                 prefer=[i for i in prefer if i not in exclude and i not in include])
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "oes", "sses")) and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _singular_phrase(phrase: str) -> str:
+    return " ".join(_singular(w) for w in phrase.split())
+
+
+class RecipeFilter:
+    """
+    Id filter produced from constraints: allowed ids are in `include` (if set) and not in `exclude`.
+    Ids in `prefer` are not required, only ranked up by the search (see `preferred`).
+    """
+
+    def __init__(self, include: Optional[RoaringBitmap] = None, exclude: Optional[RoaringBitmap] = None,
+                 description: str = "", prefer: Optional[RoaringBitmap] = None):
+        self.include = include
+        self.exclude = exclude or RoaringBitmap()
+        self.description = description
+        self.prefer = prefer
+
+    @property
+    def restricts(self) -> bool:
+        """Whether the filter removes any ids (a prefer-only filter does not)."""
+        return self.include is not None or bool(self.exclude)
+
+    def relaxed(self) -> "RecipeFilter":
+        """The same filter with its required ingredients turned into preferred ones; exclusions stay."""
+        prefer = self.include if self.prefer is None else self.include | self.prefer
+        return RecipeFilter(None, self.exclude, f"{self.description}, relaxed", prefer)
+
+    def preferred(self, ids: np.ndarray) -> np.ndarray:
+        """Boolean mask of the preferred ids among `ids`."""
+        ids = np.asarray(ids, dtype=np.int64)
+        return self.prefer.contains_many(ids) if self.prefer is not None else np.zeros(len(ids), dtype=bool)
+
+    def mask(self, ids: np.ndarray) -> np.ndarray:
+        """Boolean mask of the allowed ids among `ids`."""
+        ids = np.asarray(ids, dtype=np.int64)
+        allowed = self.include.contains_many(ids) if self.include is not None else np.ones(len(ids), dtype=bool)
+        if self.exclude:
+            allowed &= ~self.exclude.contains_many(ids)
+        return allowed
+
+    def allows(self, recipe_id) -> bool:
+        return bool(self.mask(np.array([int(recipe_id)]))[0])
+
+    def __repr__(self) -> str:
+        return f"RecipeFilter({self.description})"
+
+
+class IngredientIndex:
+    """
+    Inverted index from normalized `NER` ingredient names to roaring bitmaps of recipe ids.
+
+    A keyword matches every ingredient name containing it as a word sequence, after
+    simple singularization ("walnut" matches "chopped walnuts"); group words such as
+    "nuts", "shellfish" or "dairy" expand to their member ingredients.
+    """
+
+    def __init__(self, terms: List[str], term_offsets: np.ndarray, keys: np.ndarray, sizes: np.ndarray,
+                 data_offsets: np.ndarray, data: np.ndarray):
+        """
+        Args:
+            terms (List[str]): Normalized ingredient names.
+            term_offsets (np.ndarray): Container range of term i is term_offsets[i]:term_offsets[i + 1].
+            keys, sizes (np.ndarray): Per-container high key and size (see `RoaringBitmap.to_arrays`).
+            data_offsets (np.ndarray): Offset of each term's container data in `data`.
+            data (np.ndarray): uint16 container data of all terms back to back.
+        """
+        self.terms = list(terms)
+        self._term_offsets = term_offsets
+        self._keys = keys
+        self._sizes = sizes
+        self._data_offsets = data_offsets
+        self._data = data
+        self._bitmaps: Dict[int, RoaringBitmap] = {}
+        self._base_terms = len(self.terms)
+        self._term_ids = {term: i for i, term in enumerate(self.terms)}
+        self._added: Dict[int, List[int]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._by_word: Dict[str, List[int]] = defaultdict(list)
+        for term_id, term in enumerate(self.terms):
+            self._index_words(term_id, term)
+
+    def _index_words(self, term_id: int, term: str):
+        for word in set(_singular_phrase(term).split()):
+            self._by_word[word].append(term_id)
+
+    @classmethod
+    def build(cls, ids: Iterable[int], ner_lists: Iterable) -> "IngredientIndex":
+        """
+        Build the index from recipe ids and their NER lists (lists or JSON strings).
+        """
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for recipe_id, ner in zip(ids, ner_lists):
+            for term in {normalize_term(item) for item in parse_list_field(ner)}:
+                if term:
+                    postings[term].append(int(recipe_id))
+
+        terms = sorted(postings)
+        term_offsets, keys, sizes, data_offsets, data = [0], [], [], [0], []
+        for term in terms:
+            k, s, d = RoaringBitmap.from_ids(np.array(postings[term], dtype=np.int64)).to_arrays()
+            keys.append(k)
+            sizes.append(s)
+            data.append(d)
+            term_offsets.append(term_offsets[-1] + len(k))
+            data_offsets.append(data_offsets[-1] + len(d))
+        concat = lambda parts, dtype: np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+        return cls(terms, np.array(term_offsets, dtype=np.int64), concat(keys, np.int64), concat(sizes, np.int64),
+                   np.array(data_offsets, dtype=np.int64), concat(data, np.uint16))
+
+    def add(self, recipe_id: int, ingredients: Iterable[str]):
+        """
+        Index a recipe added after the build, e.g. an approved generated recipe.
+
+        Online additions are kept in memory on top of the saved bitmaps and are not
+        written by `save`; `online_index.open_online_index` re-adds them at startup.
+
+        Args:
+            recipe_id (int): The recipe id.
+            ingredients (Iterable[str]): NER names or full ingredient lines.
+        """
+        with self._lock:
+            for term in {normalize_term(item) for item in parse_list_field(ingredients)}:
+                if not term:
+                    continue
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.terms.append(term)
+                    self._term_ids[term] = term_id
+                    self._index_words(term_id, term)
+                self._added[term_id].append(int(recipe_id))
+
+    def bitmap(self, term_id: int) -> RoaringBitmap:
+        """The recipe ids containing one ingredient term."""
+        bitmap = self._bitmaps.get(term_id)
+        if bitmap is None:
+            if term_id < self._base_terms:
+                start, end = self._term_offsets[term_id], self._term_offsets[term_id + 1]
+                data = self._data[self._data_offsets[term_id]:self._data_offsets[term_id + 1]]
+                bitmap = RoaringBitmap.from_arrays(self._keys[start:end], self._sizes[start:end], data)
+            else:
+                bitmap = RoaringBitmap()
+            self._bitmaps[term_id] = bitmap
+        added = self._added.get(term_id)
+        return bitmap | RoaringBitmap.from_ids(np.array(added, dtype=np.int64)) if added else bitmap
+
+    def match_terms(self, keyword: str) -> List[int]:
+        """Ids of the ingredient terms a keyword (or keyword group) refers to."""
+        keyword = normalize_term(keyword)
+        keywords = INGREDIENT_GROUPS.get(keyword) or INGREDIENT_GROUPS.get(_singular_phrase(keyword)) or [keyword]
+        exceptions = GROUP_EXCEPTIONS.get(keyword, set()) | GROUP_EXCEPTIONS.get(_singular_phrase(keyword), set())
+        matched = set()
+        for word_seq in keywords:
+            words = _singular_phrase(word_seq).split()
+            if not words:
+                continue
+            candidates = self._by_word.get(words[0], [])
+            for term_id in candidates:
+                term = self.terms[term_id]
+                if len(words) > 1 and f" {' '.join(words)} " not in f" {_singular_phrase(term)} ":
+                    continue
+                if term in exceptions or any(exc in term for exc in exceptions):
+                    continue
+                matched.add(term_id)
+        return sorted(matched)
+
+    def recipes_with(self, keywords: Iterable[str]) -> RoaringBitmap:
+        """Union of the recipes containing any of the keywords."""
+        return RoaringBitmap.union_all(self.bitmap(t) for keyword in keywords for t in self.match_terms(keyword))
+
+    def build_filter(self, constraints: IngredientConstraints) -> Optional[RecipeFilter]:
+        """
+        Turn extracted constraints into an id filter.
+
+        Every include keyword that matches the dataset must be present (intersection);
+        recipes containing any exclude keyword are removed; recipes containing any prefer
+        keyword are marked as preferred. Keywords that match no ingredient are ignored.
+
+        Returns:
+            Optional[RecipeFilter]: The filter, or None if no keyword matched.
+        """
+        include, used_include = None, []
+        for keyword in constraints.include:
+            recipes = self.recipes_with([keyword])
+            if recipes:
+                include = recipes if include is None else include & recipes
+                used_include.append(keyword)
+        used_exclude = [keyword for keyword in constraints.exclude if self.match_terms(keyword)]
+        used_prefer = [keyword for keyword in constraints.prefer if self.match_terms(keyword)]
+        if include is None and not used_exclude and not used_prefer:
+            return None
+        exclude = self.recipes_with(used_exclude)
+        prefer = self.recipes_with(used_prefer) if used_prefer else None
+        return RecipeFilter(include, exclude, f"include={used_include}, exclude={used_exclude}, prefer={used_prefer}",
+                            prefer)
+
+    @property
+    def nbytes(self) -> int:
+        return self._keys.nbytes + self._sizes.nbytes + self._data.nbytes + self._term_offsets.nbytes
+
+    def save(self, path: str):
+        """Save the index to a `.npz` file."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, terms=np.array(self.terms[:self._base_terms], dtype=object), term_offsets=self._term_offsets,
+                 keys=self._keys, sizes=self._sizes, data_offsets=self._data_offsets, data=self._data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IngredientIndex":
+        """Load an index saved with `save`."""
+        with np.load(path, allow_pickle=True) as data:
+            return cls(data["terms"].tolist(), data["term_offsets"], data["keys"], data["sizes"],
+                       data["data_offsets"], data["data"])
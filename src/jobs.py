@@ -0,0 +1,197 @@
+"""This module runs long recipe pipelines as background jobs.
+Jobs run on a thread pool so the caller (e.g. a Streamlit script run) returns
+immediately; each job reports its stages as they finish, can be cancelled between
+stages, and identical requests that are still in flight share a single job."""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from src.profiling import profiler
+from src.telemetry import increment
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when the job has been cancelled."""
+
+
+class Job:
+    """
+    State of one background job.
+
+    The job function receives the Job and calls `report(stage, result)` after each
+    stage; `results` then holds every finished stage's result in order, so callers can
+    render partial results while the rest is still running.
+    """
+
+    def __init__(self, job_id: str, key: Hashable, stages: tuple):
+        self.id = job_id
+        self.key = key
+        self.stages = stages
+        self.status = QUEUED
+        self.current_stage: Optional[str] = None
+        self.results: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.stage_seconds: Dict[str, float] = {}   # duration of each finished stage
+        self.stage_progress = 0.0                    # progress inside the current stage, if it reports any
+        self.preview: Any = None                     # latest partial output of the current stage, e.g. an image
+        self._stage_started = 0.0
+        self._cancel_event = threading.Event()
+
+    @property
+    def progress(self) -> float:
+        """Fraction of stages finished, from 0 to 1, including progress inside the running stage."""
+        if not self.stages:
+            return 0.0
+        return (len(self.results) + (self.stage_progress if self.current_stage else 0.0)) / len(self.stages)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def start_stage(self, stage: str):
+        """Mark `stage` as running. Raises JobCancelled if the job was cancelled."""
+        self.check_cancelled()
+        self.current_stage = stage
+        self.stage_progress = 0.0
+        self.preview = None
+        self._stage_started = time.perf_counter()
+
+    def update_preview(self, progress: float, preview: Any = None):
+        """Report progress (0-1) inside the current stage and, optionally, a newer partial result."""
+        self.stage_progress = progress
+        if preview is not None:
+            self.preview = preview
+
+    def report(self, stage: str, result: Any):
+        """Record the result of a finished stage. Raises JobCancelled if the job was cancelled."""
+        self.results[stage] = result
+        if self.current_stage == stage:
+            self.stage_seconds[stage] = time.perf_counter() - self._stage_started
+        self.current_stage = None
+        self.preview = None
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled; call between units of work."""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+
+class JobManager:
+    """
+    Thread-pool executor for background jobs, keyed for deduplication.
+
+    Shared across sessions: a request with the same key as a queued or running job
+    returns that job's id instead of starting a new one.
+    """
+
+    def __init__(self, max_workers: int = 2, keep_finished_seconds: float = 3600.0):
+        """
+        Args:
+            max_workers (int, optional): Jobs run concurrently. Defaults to 2.
+            keep_finished_seconds (float, optional): How long finished jobs stay queryable. Defaults to 3600.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lazycook-job")
+        self._jobs: Dict[str, Job] = {}
+        self._futures = {}
+        self._in_flight: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+        self.keep_finished_seconds = keep_finished_seconds
+
+    def submit(self, key: Hashable, fn: Callable, *args, stages: tuple = (), **kwargs) -> str:
+        """
+        Start `fn(job, *args, **kwargs)` in the background, or join an identical in-flight job.
+
+        Args:
+            key (Hashable): Identity of the request, e.g. the normalized question and ingredients.
+            fn (Callable): Job function; receives the Job as first argument and returns nothing.
+            *args: Positional arguments for `fn`.
+            stages (tuple, optional): Names of the stages `fn` reports, used for progress.
+            **kwargs: Keyword arguments for `fn`.
+
+        Returns:
+            str: The job id.
+        """
+        with self._lock:
+            self._prune()
+            existing = self._in_flight.get(key)
+            if existing is not None:
+                increment("cache_hits_total", cache="jobs")
+                return existing
+            increment("cache_misses_total", cache="jobs")
+            job = Job(uuid.uuid4().hex[:12], key, tuple(stages))
+            self._jobs[job.id] = job
+            self._in_flight[key] = job.id
+            self._futures[job.id] = self._executor.submit(self._run, job, fn, args, kwargs)
+            return job.id
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict):
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.check_cancelled()
+            with profiler.profile(getattr(fn, "__name__", "job")):
+                fn(job, *args, **kwargs)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                if self._in_flight.get(job.key) == job.id:
+                    del self._in_flight[job.key]
+                self._futures.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job, or None if it is unknown or has expired."""
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job. A queued job never starts; a running job stops at its next stage boundary.
+
+        Returns:
+            bool: True if the job was still queued or running.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            job._cancel_event.set()
+            # A cancelled job no longer absorbs identical new requests
+            if self._in_flight.get(job.key) == job.id:
+                del self._in_flight[job.key]
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            job.status = CANCELLED
+            job.finished = time.time()
+            with self._lock:
+                self._futures.pop(job_id, None)
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_finished_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        """Cancel every job and stop the worker threads."""
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=False)
@@ -1,14 +1,19 @@
 """This file provides functions to interact with an LLM for generating and reviewing recipes
  based on user input, including seasonal context and ingredient availability."""
-import json
-import re
+import logging
 from datetime import datetime
 from typing import List
-import requests
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel
 from src import config
+from src.context_builder import get_context_builder
+from src.model_router import chat_completion, get_router, review_route
+from src.replay_cache import get_replay_cache
+from src.response_parsing import ResponseParseError, parse_model, parse_text
+from src.telemetry import span
 from google import genai
 
+logger = logging.getLogger(__name__)
+
 class Recipe(BaseModel):
     """
     Pydantic class that represents a cooking recipe.
@@ -35,6 +40,20 @@ class ReviewResult(BaseModel):
     ingredients_to_buy: List[str]
     explanation: str
 
+RECIPE_SYSTEM_PROMPT = """You are a helpful recipe assistant. Your task is to provide a concise and relevant response based on the user's question and the ingredients they have at home.
+You should return a new recipe based on the user's question and the ingredients they have, using the top recipes from a dataset.
+Do not include any explanations or additional information, just the recipe details in valid JSON format.
+If the user specifies that he doesn't like a certain ingredient, or is allergic to it, DO NOT INCLUDE IT and replace it with something similar.
+If the user message says the last recipe was rejected, make sure to correct the stated problem in your new recipe.
+
+Return ONLY a JSON object in this format:
+{
+"title": "...",
+"ingredients": ["..."],
+"directions": ["..."]
+}
+"""
+
 def get_season(date):
     """
     Determine the season based on a given date.
@@ -63,6 +82,7 @@ def get_season(date):
 def get_keywords_from_llm(question: str, url: str, model: str) -> str:
     """
     Get expanded keywords from LLM for a given question, including seasonal context.
+    The call goes through the model router (circuit breaker, hedging).
     
     Args:
         question (str): The user's question about what they want to cook
@@ -72,14 +92,11 @@ def get_keywords_from_llm(question: str, url: str, model: str) -> str:
     Returns:
         str: Comma-separated list of relevant keywords
     """
-    headers = {"Content-Type": "application/json"}
-
     # Add seasonal context to the user's question
     current_season = get_season(datetime.now())
     question_with_context = f"{question}, season {current_season}"
 
     data = {
-        "model": model,
         "messages": [
             {"role": "system", "content": """You are an intelligent recipe query enrichment assistant. Your task is not to answer the user's question, but to think out loud and then output a list of highly relevant keywords related to food, cooking, ingredients, cuisines, or dish types.
 
@@ -105,11 +122,15 @@ def get_keywords_from_llm(question: str, url: str, model: str) -> str:
         "stream": False
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    print(response.json()["choices"][0]["message"]["content"])
-    raw_query = response.json()["choices"][0]["message"]["content"]
-    _, q_ext = raw_query.split('</think>\n\n')
-    return q_ext
+    with span("expansion_llm", model=model):
+        raw_query = chat_completion([model], url, data)
+    logger.debug("Raw keyword output:\n%s", raw_query)
+    try:
+        return parse_text(raw_query, "keywords")
+    except ResponseParseError as e:
+        # Reasoning cut off before the keywords: search with the question alone
+        logger.warning("%s; using the question as its own expansion", e)
+        return question
 
 def generate_recipe_from_llm(question: str, ingredients: str, recipes: List[dict], url: str, model: str, model_big: str, feedback: str = "") -> Recipe:
     """
@@ -121,41 +142,32 @@ def generate_recipe_from_llm(question: str, ingredients: str, recipes: List[dict
         recipes (List[dict]): Top candidate recipes from the vector database.
         url (str): API endpoint for the LLM.
         model (str): Default model identifier.
-        model_big (str): Bigger/more powerful model for use when feedback is provided.
+        model_big (str): Bigger/more powerful model, preferred when feedback is provided. The
+            model router falls back to `model` when it is saturated, failing or slow.
         feedback (str, optional): Feedback from previous review to guide improvement.
 
     Returns:
         Recipe: Parsed and validated recipe object.
     """
 
-    headers = {"Content-Type": "application/json"}   
-    system_prompt = """You are a helpful recipe assistant. Your task is to provide a concise and relevant response based on the user's question and the ingredients they have at home.
-    You should return a new recipe based on the user's question and the ingredients they have, using the top recipes from a dataset.
-    Do not include any explanations or additional information, just the recipe details in valid JSON format.
-    If the user specifies that he doesn't like a certain ingredient, or is allergic to it, DO NOT INCLUDE IT and replace it with something similar.
-
-    Return ONLY a JSON object in this format:
-    {
-    "title": "...",
-    "ingredients": ["..."],
-    "directions": ["..."]
-    }
-    """
-    model_to_use = model_big if feedback else model
+    models = [model_big, model] if feedback else [model]
 
+    # The system prompt is kept byte-identical across requests so the LLM server can
+    # reuse its prefix cache; everything request-specific goes into the user message.
+    context = get_context_builder().build_recipes_context(recipes)
+    user_message = f"question: {question}\ningredients: {ingredients}\ntop recipes:\n{context}"
     if feedback:
-        system_prompt += f"\nThe last recipe was rejected for the following reason: {feedback}\nMake sure to correct this in your new recipe."
+        user_message += f"\n\nThe last recipe was rejected for the following reason: {feedback}\nMake sure to correct this in your new recipe."
 
     data = {
-        "model": model_to_use,
         "messages": [
             {
                 "role": "system",
-                "content": system_prompt
+                "content": RECIPE_SYSTEM_PROMPT
             },
             {
                 "role": "user",
-                "content": f"question: {question}, ingredients: {ingredients}, top recipes: {recipes}"
+                "content": user_message
             }
         ],
         "temperature": 0.6,
@@ -164,24 +176,18 @@ def generate_recipe_from_llm(question: str, ingredients: str, recipes: List[dict
     }
 
     # Call model
-    response = requests.post(url, headers=headers, json=data)
-    content = response.json()["choices"][0]["message"]["content"]
-    print("🔍 Raw model output:\n", content)
-
-    # Extract JSON after </think>, or fallback to parsing from full content
-    match = re.search(r"</think>\s*(\{.*\})", content, re.DOTALL)
-    json_block = match.group(1) if match else content.strip()
+    with span("generate", model=models[0], feedback=bool(feedback)):
+        content = chat_completion(models, url, data)
+    logger.debug("Raw model output:\n%s", content)
 
     try:
-        parsed = json.loads(json_block)
-        recipe = Recipe(**parsed)
-        print("\n✅ Structured recipe:")
-        print(recipe)
-        return recipe
-    except (json.JSONDecodeError, ValidationError) as e:
-        print("❌ Error parsing or validating the recipe:\n", e)
-        print("🔍 Raw model output:\n", content)
-        raise ValueError("Invalid recipe format")
+        recipe = parse_model(content, Recipe, "recipe")
+    except ResponseParseError as e:
+        logger.warning("Error parsing or validating the recipe: %s", e)
+        logger.debug("Raw model output of the invalid recipe:\n%s", content)
+        raise ValueError("Invalid recipe format") from e
+    logger.debug("Structured recipe: %s", recipe)
+    return recipe
 
 
 def review_generated_recipe(question: str, ingredients: str, recipe: Recipe, model: str = "gemini-1.5-flash") -> ReviewResult:
@@ -198,6 +204,7 @@ def review_generated_recipe(question: str, ingredients: str, recipe: Recipe, mod
         ReviewResult: Structured result indicating approval, missing ingredients, and explanation.
     """
     client = genai.Client(api_key=config.GOOGLE_API_KEY)
+    recipe_text = get_context_builder().build_recipe_text(recipe, config.REVIEW_RECIPE_TOKEN_BUDGET)
 
     prompt = f"""
 You are a helpful recipe reviewer assistant.
@@ -243,20 +250,37 @@ This explanation is meant to guide another assistant model that will revise the
 Inputs:
 User question: {question}
 User ingredients: {ingredients}
-Recipe: {recipe}
+Recipe:
+{recipe_text}
 """
 
 
-    # Call the Gemini model with structured response
-    response = client.models.generate_content(
-        model= model,
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": ReviewResult,
-        },
-    )
-
-    # Get parsed response directly as a typed Pydantic object
-    review_result: ReviewResult = response.parsed
+    # Call the Gemini model with structured response, through the model router
+    def generate(backend):
+        return client.models.generate_content(
+            model=backend.model,
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": ReviewResult,
+            },
+        )
+
+    # Get parsed response directly as a typed Pydantic object, falling back to the tolerant
+    # parser when the SDK could not validate the text; recorded reviews are replayed
+    # without a Gemini call when record/replay is enabled
+    def review():
+        response = get_router().call(review_route(model), generate)
+        if isinstance(response.parsed, ReviewResult):
+            return response.parsed
+        return parse_model(response.text or "", ReviewResult, "review")
+
+    with span("review", model=model) as review_span:
+        review_result: ReviewResult = get_replay_cache().call(
+            "review", {"model": model, "prompt": prompt},
+            review,
+            encode=lambda result: result.model_dump(),
+            decode=lambda value: ReviewResult(**value),
+        )
+        review_span.set(approved=getattr(review_result, "approved", None))
     return review_result
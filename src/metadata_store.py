@@ -0,0 +1,240 @@
+"""This module provides a local SQLite store mapping recipe ids to recipe metadata,
+so the vector index only needs to hold ids and search results are hydrated locally
+with a batched multi-get."""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from src.data_processing import parse_list_field
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    ingredients TEXT NOT NULL,
+    directions TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_title ON recipes (title);
+CREATE TABLE IF NOT EXISTS id_sequence (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+"""
+
+# SQLite's default limit on host parameters is 999 in older builds
+_MAX_PARAMS = 900
+
+
+class RecipeMetadataStore:
+    """
+    Recipe metadata keyed by integer recipe id.
+
+    Ingredients and directions are stored as JSON lists and returned as Python lists.
+    """
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file.
+            read_only (bool, optional): Open the database read-only. Defaults to False.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+        # Large page cache and memory-mapped I/O keep hot pages out of the syscall path
+        self._conn.execute("PRAGMA mmap_size=1073741824")
+        self._conn.execute("PRAGMA cache_size=-65536")
+
+    def put_many(self, rows: Iterable[dict]) -> int:
+        """
+        Insert or replace recipes.
+
+        Args:
+            rows (Iterable[dict]): Dicts with "id", "title", "ingredients" and "directions".
+                List fields may be lists or JSON-encoded strings.
+
+        Returns:
+            int: Number of rows written.
+        """
+        records = [
+            (
+                int(row["id"]),
+                row["title"],
+                json.dumps(parse_list_field(row["ingredients"]), ensure_ascii=False),
+                json.dumps(parse_list_field(row["directions"]), ensure_ascii=False),
+            )
+            for row in rows
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO recipes (id, title, ingredients, directions) VALUES (?, ?, ?, ?)",
+                records,
+            )
+        return len(records)
+
+    def put_dataframe(self, df: pd.DataFrame, batch_size: int = 10_000) -> int:
+        """
+        Insert every recipe of a preprocessed dataset DataFrame.
+
+        Args:
+            df (pd.DataFrame): DataFrame with "id", "title", "ingredients" and "directions" columns.
+            batch_size (int, optional): Rows per transaction. Defaults to 10000.
+
+        Returns:
+            int: Number of rows written.
+        """
+        columns = ["id", "title", "ingredients", "directions"]
+        written = 0
+        for start in range(0, len(df), batch_size):
+            batch = df[columns].iloc[start:start + batch_size]
+            written += self.put_many(batch.to_dict("records"))
+        return written
+
+    def delete_many(self, ids: Iterable) -> int:
+        """
+        Delete recipes by id, e.g. near-duplicates collapsed into a canonical recipe.
+
+        Args:
+            ids (Iterable[int or str]): Recipe ids.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        int_ids = [int(i) for i in ids]
+        deleted = 0
+        with self._lock, self._conn:
+            for start in range(0, len(int_ids), _MAX_PARAMS):
+                chunk = int_ids[start:start + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                deleted += self._conn.execute(f"DELETE FROM recipes WHERE id IN ({placeholders})", chunk).rowcount
+        return deleted
+
+    def get_many(self, ids: List) -> List[Optional[dict]]:
+        """
+        Fetch several recipes in as few queries as possible.
+
+        Args:
+            ids (List[int or str]): Recipe ids, e.g. the ids of vector search matches.
+
+        Returns:
+            List[Optional[dict]]: Recipes in the order of `ids`; None for unknown ids.
+        """
+        int_ids = [int(i) for i in ids]
+        found: Dict[int, dict] = {}
+        for start in range(0, len(int_ids), _MAX_PARAMS):
+            chunk = int_ids[start:start + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT id, title, ingredients, directions FROM recipes WHERE id IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            for recipe_id, title, ingredients, directions in rows:
+                found[recipe_id] = {
+                    "id": str(recipe_id),
+                    "title": title,
+                    "ingredients": json.loads(ingredients),
+                    "directions": json.loads(directions),
+                }
+        return [found.get(i) for i in int_ids]
+
+    def get(self, recipe_id) -> Optional[dict]:
+        """Fetch a single recipe by id, or None if it is unknown."""
+        return self.get_many([recipe_id])[0]
+
+    def ids_for_titles(self, titles: Iterable[str]) -> Dict[str, int]:
+        """
+        Look up recipe ids by exact title, e.g. for feedback recorded before ids were kept.
+
+        Args:
+            titles (Iterable[str]): Recipe titles.
+
+        Returns:
+            Dict[str, int]: Title to the smallest id with that title; unknown titles are omitted.
+        """
+        unique = list(dict.fromkeys(titles))
+        found: Dict[str, int] = {}
+        for start in range(0, len(unique), _MAX_PARAMS):
+            chunk = unique[start:start + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT title, MIN(id) FROM recipes WHERE title IN ({placeholders}) GROUP BY title",
+                chunk,
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def max_id(self) -> int:
+        """The largest recipe id, or -1 if the store is empty."""
+        return self._conn.execute("SELECT COALESCE(MAX(id), -1) FROM recipes").fetchone()[0]
+
+    def reserve_ids(self, count: int, floor: int = 0) -> List[int]:
+        """
+        Reserve `count` new consecutive ids, at least `floor` and above every id handed out
+        before. The counter lives in the database, so processes sharing the file (the app,
+        the API server, batch runs) never get the same id.
+
+        Args:
+            count (int): Number of ids.
+            floor (int, optional): Smallest id to hand out. Defaults to 0.
+
+        Returns:
+            List[int]: The reserved ids.
+        """
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock before reading the counter
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT next_id FROM id_sequence WHERE name = 'recipes'").fetchone()
+                start = max(int(floor), row[0] if row else 0, self.max_id() + 1)
+                self._conn.execute("INSERT OR REPLACE INTO id_sequence (name, next_id) VALUES ('recipes', ?)",
+                                   (start + count,))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return list(range(start, start + count))
+
+    def get_from(self, min_id: int) -> List[dict]:
+        """Fetch every recipe with id >= `min_id`, e.g. recipes added online, in id order."""
+        rows = self._conn.execute(
+            "SELECT id, title, ingredients, directions FROM recipes WHERE id >= ? ORDER BY id", (int(min_id),)
+        ).fetchall()
+        return [
+            {"id": str(recipe_id), "title": title, "ingredients": json.loads(ingredients),
+             "directions": json.loads(directions)}
+            for recipe_id, title, ingredients, directions in rows
+        ]
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection."""
+        self._conn.close()
+
+
+def open_metadata_store(db_path: str) -> Optional[RecipeMetadataStore]:
+    """
+    Open the metadata store read-only if it has been built.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        Optional[RecipeMetadataStore]: The store, or None if the file does not exist.
+    """
+    if not os.path.exists(db_path):
+        return None
+    return RecipeMetadataStore(db_path, read_only=True)
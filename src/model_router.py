@@ -0,0 +1,282 @@
+"""This module routes model calls across backends based on their recent health.
+Every (model, endpoint) pair keeps a rolling window of latencies and errors and a
+circuit breaker. A call is tried on the first healthy, unsaturated backend of its
+route; if that backend is slower than its usual latency percentile the call is hedged
+to the next backend, and failures fall through to the next backend immediately."""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import requests
+
+from src import config
+from src.replay_cache import get_replay_cache
+from src.telemetry import telemetry
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class NoBackendAvailable(RuntimeError):
+    """Raised when every backend of a route failed or has an open circuit breaker."""
+
+
+class Backend:
+    """
+    One model served at one endpoint, with its rolling statistics and circuit breaker.
+
+    The breaker opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_seconds`, then lets a single trial call through (half-open) and closes again
+    if it succeeds.
+    """
+
+    def __init__(self, model: str, url: str, max_concurrency: int = 2, window: int = 100,
+                 failure_threshold: int = 3, reset_seconds: float = 30.0):
+        self.model = model
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self.in_flight = 0
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}@{self.url}"
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.max_concurrency
+
+    def available(self) -> bool:
+        """Whether the breaker lets a call through now."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == HALF_OPEN:
+                return not self._trial_running
+            return self.state == CLOSED
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile of successful calls in seconds, or None without enough samples."""
+        with self._lock:
+            if len(self._latencies) < config.HEDGE_MIN_SAMPLES:
+                return None
+            return float(np.percentile(self._latencies, percentile))
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return 1.0 - (sum(self._outcomes) / len(self._outcomes)) if self._outcomes else 0.0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            if self.state == HALF_OPEN:
+                self._trial_running = True
+
+    def finished(self, latency: float, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self._outcomes.append(ok)
+            if ok:
+                self._latencies.append(latency)
+                self._consecutive_failures = 0
+                self.state = CLOSED
+                return
+            self._consecutive_failures += 1
+            if self.state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        """Current statistics, e.g. for a health endpoint or benchmark report."""
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(config.HEDGE_PERCENTILE)
+        return {
+            "backend": self.name,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "error_rate": self.error_rate(),
+            "p50_s": p50,
+            "p95_s": p95,
+        }
+
+
+class ModelRouter:
+    """
+    Chooses, hedges and falls back between backends for each call.
+
+    A route is an ordered list of (model, url) pairs, most preferred first, e.g.
+    `[(LLM_MODEL_BIG, url), (LLM_MODEL, url)]` for generation after a rejected review.
+    """
+
+    def __init__(self, hedge_percentile: float = 95.0, max_workers: int = 16):
+        self.hedge_percentile = hedge_percentile
+        self._backends: Dict[Tuple[str, str], Backend] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+
+    def backend(self, model: str, url: str) -> Backend:
+        """Return the shared Backend for a (model, url) pair, creating it on first use."""
+        with self._lock:
+            key = (model, url)
+            if key not in self._backends:
+                self._backends[key] = Backend(
+                    model, url,
+                    max_concurrency=config.MODEL_MAX_CONCURRENCY.get(model, config.DEFAULT_MODEL_CONCURRENCY),
+                    window=config.ROUTER_WINDOW,
+                    failure_threshold=config.BREAKER_FAILURES,
+                    reset_seconds=config.BREAKER_RESET_SECONDS,
+                )
+            return self._backends[key]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            backends = list(self._backends.values())
+        return [b.snapshot() for b in backends]
+
+    def _candidates(self, route: Sequence[Tuple[str, str]]) -> List[Backend]:
+        backends = [self.backend(model, url) for model, url in route]
+        healthy = [b for b in backends if b.available()]
+        # Prefer unsaturated backends: a saturated big model falls back to the small one
+        unsaturated = [b for b in healthy if not b.saturated]
+        return unsaturated + [b for b in healthy if b.saturated]
+
+    def _timed(self, backend: Backend, fn: Callable[[Backend], object]):
+        backend.started()
+        start = time.perf_counter()
+        try:
+            result = fn(backend)
+        except Exception:
+            backend.finished(time.perf_counter() - start, ok=False)
+            raise
+        backend.finished(time.perf_counter() - start, ok=True)
+        return result
+
+    def call(self, route: Sequence[Tuple[str, str]], fn: Callable[[Backend], object]):
+        """
+        Run `fn(backend)` on the best backend of `route`.
+
+        If the chosen backend has not answered within its hedge percentile latency, the
+        call is also started on the next candidate and the first success wins; if it
+        fails, the next candidate is tried. The losing hedged call is left to finish in
+        the background and only updates statistics.
+
+        Args:
+            route (Sequence[Tuple[str, str]]): (model, url) pairs, most preferred first.
+            fn (Callable[[Backend], object]): Performs the call against `backend.model` / `backend.url`.
+
+        Returns:
+            The result of the first successful call.
+
+        Raises:
+            NoBackendAvailable: If every candidate failed or is unavailable.
+        """
+        candidates = self._candidates(route)
+        if not candidates:
+            raise NoBackendAvailable(f"all backends have open circuit breakers: {[m for m, _ in route]}")
+
+        errors = []
+        pending = {}
+        next_candidate = 0
+
+        def launch():
+            nonlocal next_candidate
+            backend = candidates[next_candidate]
+            next_candidate += 1
+            pending[self._executor.submit(self._timed, backend, fn)] = backend
+
+        launch()
+        while pending:
+            hedge_after = None
+            if next_candidate < len(candidates) and len(pending) == 1:
+                (only_backend,) = pending.values()
+                hedge_after = only_backend.latency_percentile(self.hedge_percentile)
+            done, _ = wait(list(pending), timeout=hedge_after, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slower than usual: hedge to the next backend
+                launch()
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    errors.append(f"{backend.name}: {type(e).__name__}: {e}")
+            if not pending and next_candidate < len(candidates):
+                launch()
+        raise NoBackendAvailable("; ".join(errors))
+
+
+def _ordered(first: Sequence[str], rest: Sequence[str]) -> List[str]:
+    return list(dict.fromkeys([*first, *rest]))
+
+
+def llm_route(models: Sequence[str], url: str = None) -> List[Tuple[str, str]]:
+    """
+    Route for a chat completion: each of `models`, then config.LLM_FALLBACK_MODELS, on
+    `url` and then every other endpoint in config.LLM_BACKENDS.
+    """
+    urls = _ordered([url] if url else [], config.LLM_BACKENDS)
+    return [(model, u) for model in _ordered(models, config.LLM_FALLBACK_MODELS) for u in urls]
+
+
+def image_route(url: str = None) -> List[Tuple[str, str]]:
+    """Route for a txt2img call: `url`, then every other endpoint in config.IMAGE_BACKENDS."""
+    return [("txt2img", u) for u in _ordered([url] if url else [], config.IMAGE_BACKENDS)]
+
+
+def review_route(model: str = None) -> List[Tuple[str, str]]:
+    """Route for a Gemini review: `model`, then every other model in config.REVIEW_MODELS."""
+    return [(m, "gemini") for m in _ordered([model] if model else [], config.REVIEW_MODELS)]
+
+
+@lru_cache(maxsize=1)
+def get_router() -> ModelRouter:
+    """Return the process-wide model router configured from `config`."""
+    return ModelRouter(hedge_percentile=config.HEDGE_PERCENTILE)
+
+
+def chat_completion(models: Sequence[str], url: str, data: dict) -> str:
+    """
+    Send an OpenAI-compatible chat completion through the router, or answer it from the
+    replay cache when record/replay is enabled.
+
+    Args:
+        models (Sequence[str]): Models to route between, most preferred first; the
+            configured fallback models and endpoints are added by `llm_route`.
+        url (str): Preferred chat completions endpoint.
+        data (dict): Request body; its "model" field is set per backend.
+
+    Returns:
+        str: The content of the first choice's message.
+    """
+    def post(backend: Backend) -> str:
+        start = time.perf_counter()
+        response = requests.post(
+            backend.url,
+            headers={"Content-Type": "application/json"},
+            json={**data, "model": backend.model},
+            timeout=config.LLM_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        body = response.json()
+        telemetry.record_llm_usage(backend.model, body.get("usage"), time.perf_counter() - start)
+        return body["choices"][0]["message"]["content"]
+
+    # Recorded responses are keyed by models and body, not the endpoint (see src.replay_cache)
+    return get_replay_cache().call("chat", {"models": list(models), "data": data},
+                                   lambda: get_router().call(llm_route(models, url), post))
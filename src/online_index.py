@@ -0,0 +1,459 @@
+"""This module adds recipes to the search index while the app is running. Approved
+generated recipes and highly rated feedback recipes are embedded and appended to a small
+delta segment (vectors) and a delta SQLite store (metadata), which are searched together
+with the main index, so new recipes are retrievable immediately. When the delta grows past
+a threshold it is merged into the main files by a background thread, so the number of
+searched segments, and with it search latency, stays flat."""
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src import config
+from src.data_processing import make_full_text
+from src.ingredient_filter import IngredientIndex, RecipeFilter, normalize_term
+from src.metadata_store import RecipeMetadataStore
+from src.sharded_index import ShardedVectorIndex
+from src.vector_index import LocalVectorIndex, merge_top_k
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaSegment:
+    """
+    Append-only vector segment: `<path>.f32` rows and `<path>.ids` int64 ids, mirrored in memory.
+
+    Rows are written before ids, so an interrupted append leaves at most trailing rows
+    without an id, which are dropped on the next open.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        ids = np.fromfile(path + ".ids", dtype=np.int64) if os.path.exists(path + ".ids") else np.zeros(0, np.int64)
+        vectors = (np.fromfile(path + ".f32", dtype=np.float32) if os.path.exists(path + ".f32")
+                   else np.zeros(0, np.float32))
+        count = min(len(ids), len(vectors) // dim)
+        if os.path.exists(path + ".f32"):
+            with open(path + ".f32", "r+b") as f:
+                f.truncate(count * dim * 4)
+            with open(path + ".ids", "r+b") as f:
+                f.truncate(count * 8)
+        capacity = max(64, 2 * count)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids[:count] = ids[:count]
+        self._vectors[:count] = vectors[:count * dim].reshape(count, dim)
+        self.count = count
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.count]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self.count]
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """Append rows to the files and the in-memory copy."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        with self._lock:
+            with open(self.path + ".f32", "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.path + ".ids", "ab") as f:
+                f.write(ids.tobytes())
+            needed = self.count + len(ids)
+            if needed > len(self._ids):
+                capacity = max(needed, 2 * len(self._ids))
+                grown_ids = np.zeros(capacity, dtype=np.int64)
+                grown_vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+                grown_ids[:self.count] = self._ids[:self.count]
+                grown_vectors[:self.count] = self._vectors[:self.count]
+                self._ids, self._vectors = grown_ids, grown_vectors
+            self._ids[self.count:needed] = ids
+            self._vectors[self.count:needed] = vectors
+            # Readers take `count` first, so they never see rows that are not written yet
+            self.count = needed
+
+    def search(self, queries: np.ndarray, k: int,
+               recipe_filter: Optional[RecipeFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over the segment; same contract as `LocalVectorIndex.search`."""
+        count = self.count
+        ids, vectors = self._ids[:count], self._vectors[:count]
+        if recipe_filter is not None and count:
+            keep = recipe_filter.mask(ids)
+            ids, vectors = ids[keep], vectors[keep]
+        k = min(k, len(ids))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        scores = queries @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return ids[top], np.take_along_axis(scores, top, axis=1)
+
+    def rename(self, path: str):
+        """Move the segment files, e.g. when the segment is sealed for merging."""
+        with self._lock:
+            for suffix in (".f32", ".ids"):
+                if os.path.exists(self.path + suffix):
+                    os.replace(self.path + suffix, path + suffix)
+            self.path = path
+
+    def remove(self):
+        for suffix in (".f32", ".ids"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class SegmentedVectorIndex:
+    """
+    The main memory-mapped index plus at most two small in-memory delta segments.
+
+    New vectors go to the active delta. `merge` seals it (a new empty delta takes
+    over) and appends the sealed rows to the main files in the background; searches
+    cover main, sealed and active segments throughout, so results never miss a recipe.
+    """
+
+    supports_prefilter = True
+
+    def __init__(self, main):
+        """
+        Args:
+            main (LocalVectorIndex or ShardedVectorIndex): The main index; its `path` prefix
+                is also used for the delta segment files.
+        """
+        self.path = main.path
+        self.main = main
+        self.active = DeltaSegment(self.path + ".delta", self.main.dim)
+        self.sealed = (DeltaSegment(self.path + ".sealed", self.main.dim)
+                       if os.path.exists(self.path + ".sealed.ids") else None)
+        self.merges = 0
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+
+    @property
+    def dim(self) -> int:
+        return self.main.dim
+
+    def __len__(self) -> int:
+        return len(self.main) + len(self.active) + (len(self.sealed) if self.sealed is not None else 0)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Boolean mask of the ids present in any segment."""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            segments = [self.main.ids, self.active.ids] + ([self.sealed.ids] if self.sealed is not None else [])
+        return np.isin(ids, np.concatenate(segments))
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """Add vectors to the active delta segment; they are searchable on return."""
+        # Held during the append so a concurrent merge cannot seal the segment half-way
+        with self._lock:
+            self.active.add(ids, vectors)
+
+    def search(self, queries: np.ndarray, k: int,
+               recipe_filter: Optional[RecipeFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k over every segment; same contract as `LocalVectorIndex.search`."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            segments = [self.main, self.sealed, self.active]
+        return merge_top_k([s.search(queries, k, recipe_filter) for s in segments if s is not None], k)
+
+    def query(self, vector, top_k: int, namespace: str = None, include_metadata: bool = False,
+              recipe_filter: Optional[RecipeFilter] = None) -> dict:
+        """Pinecone-compatible single query, see `LocalVectorIndex.query`."""
+        ids, scores = self.search(np.asarray(vector, dtype=np.float32), top_k, recipe_filter)
+        return {"matches": [{"id": str(i), "score": float(s)} for i, s in zip(ids[0], scores[0])]}
+
+    def merge(self) -> int:
+        """
+        Merge the delta into the main index; blocks until done. Runs one merge at a time,
+        and first finishes a merge interrupted by a restart.
+
+        Returns:
+            int: Number of rows merged.
+        """
+        with self._merge_lock:
+            with self._lock:
+                if self.sealed is None:
+                    if len(self.active) == 0:
+                        return 0
+                    self.active.rename(self.path + ".sealed")
+                    self.sealed = self.active
+                    self.active = DeltaSegment(self.path + ".delta", self.dim)
+                sealed = self.sealed
+            main = self.main.append(sealed.ids, sealed.vectors)
+            with self._lock:
+                self.main = main
+                self.sealed = None
+            sealed.remove()
+            self.merges += 1
+            return len(sealed)
+
+
+class OnlineMetadataStore:
+    """
+    Read view over the main metadata store and the delta store of recipes added online,
+    with the `RecipeMetadataStore` lookup methods used by `search_recipes`.
+
+    Without a main store (Pinecone serving its own metadata) the view only knows the
+    recipes added online: `covers_index` is False, and `search_recipes` then keeps the
+    index's metadata and hydrates only ids from config.ONLINE_ID_BASE up.
+    """
+
+    def __init__(self, main: Optional[RecipeMetadataStore], delta: RecipeMetadataStore):
+        self.main = main
+        self.delta = delta
+        self.covers_index = main is not None
+
+    @property
+    def db_path(self) -> str:
+        return self.main.db_path if self.main is not None else self.delta.db_path
+
+    def get_many(self, ids: List) -> List[Optional[dict]]:
+        found = self.main.get_many(ids) if self.main is not None else [None] * len(ids)
+        missing = [i for i, recipe in enumerate(found) if recipe is None]
+        if missing:
+            for position, recipe in zip(missing, self.delta.get_many([ids[i] for i in missing])):
+                found[position] = recipe
+        return found
+
+    def get(self, recipe_id) -> Optional[dict]:
+        return self.get_many([recipe_id])[0]
+
+    def ids_for_titles(self, titles: Iterable[str]) -> Dict[str, int]:
+        titles = list(titles)
+        found = self.delta.ids_for_titles(titles)
+        if self.main is not None:
+            found.update(self.main.ids_for_titles(titles))
+        return found
+
+    def __len__(self) -> int:
+        return (len(self.main) if self.main is not None else 0) + len(self.delta)
+
+
+def _recipe_fields(recipe) -> dict:
+    if not isinstance(recipe, dict):
+        recipe = recipe.model_dump()
+    return {"title": recipe["title"], "ingredients": list(recipe["ingredients"]),
+            "directions": list(recipe["directions"])}
+
+
+def _fingerprint(recipe: dict) -> str:
+    return normalize_term(recipe["title"]) + "|" + "|".join(sorted(normalize_term(i) for i in recipe["ingredients"]))
+
+
+class OnlineRecipeIndex:
+    """
+    Adds recipes to a running search index: metadata to the delta store, vectors to the
+    local delta segment (or straight to Pinecone) and ingredients to the filter bitmaps.
+
+    Use `index` and `metadata_store` in place of the plain index and store when calling
+    `search_recipes`.
+    """
+
+    def __init__(self, index, metadata_store: OnlineMetadataStore, embed_fn: Callable[[List[str]], np.ndarray],
+                 ingredient_index: Optional[IngredientIndex] = None, main_store_path: str = None,
+                 merge_rows: int = 2000, min_rating: int = 4, next_id: int = 0):
+        """
+        Args:
+            index: SegmentedVectorIndex, or a Pinecone index (upserts are searchable directly).
+            metadata_store (OnlineMetadataStore): Main and delta metadata.
+            embed_fn (Callable): Embeds a list of recipe texts, e.g. `rag.encode_queries`.
+            ingredient_index (IngredientIndex, optional): Bitmaps that new recipes are added to.
+            main_store_path (str, optional): Main metadata database that merges write to.
+            merge_rows (int, optional): Delta size that triggers a background merge. Defaults to 2000.
+            min_rating (int, optional): Minimum rating of liked feedback whose recipe is added. Defaults to 4.
+            next_id (int, optional): Smallest id to assign; ids are reserved in the delta
+                store (see `RecipeMetadataStore.reserve_ids`).
+        """
+        self.index = index
+        self.metadata_store = metadata_store
+        self.embed_fn = embed_fn
+        self.ingredient_index = ingredient_index
+        self.main_store_path = main_store_path or config.RECIPE_METADATA_PATH
+        self.merge_rows = merge_rows
+        self.min_rating = min_rating
+        self._next_id = next_id
+        self._fingerprints = set()
+        self._pending = set()   # fingerprints of recipes being added right now
+        self._lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self.added = 0
+
+    def _register(self, recipe_id: int, recipe: dict):
+        self._fingerprints.add(_fingerprint(recipe))
+        if self.ingredient_index is not None:
+            self.ingredient_index.add(recipe_id, recipe["ingredients"])
+
+    def add_recipes(self, recipes: Iterable) -> List[int]:
+        """
+        Embed and index recipes; they are returned by searches as soon as this returns.
+
+        Args:
+            recipes (Iterable[Recipe or dict]): Recipes with title, ingredients and directions.
+                Recipes already added (same title and ingredients) are skipped.
+
+        Returns:
+            List[int]: Ids of the recipes that were added.
+        """
+        with self._lock:
+            rows, fingerprints = [], []
+            for recipe in map(_recipe_fields, recipes):
+                fingerprint = _fingerprint(recipe)
+                if fingerprint in self._fingerprints or fingerprint in self._pending:
+                    continue
+                self._pending.add(fingerprint)
+                fingerprints.append(fingerprint)
+                rows.append(recipe)
+        if not rows:
+            return []
+
+        try:
+            # Ids come from the delta database, which every process adding recipes shares
+            ids = self.metadata_store.delta.reserve_ids(len(rows), self._next_id)
+            rows = [{"id": recipe_id, **recipe} for recipe_id, recipe in zip(ids, rows)]
+            vectors = np.asarray(self.embed_fn([
+                make_full_text(row["title"], row["ingredients"], row["directions"]) for row in rows
+            ]), dtype=np.float32)
+            ids = np.array(ids, dtype=np.int64)
+            # Metadata first, so a search that finds the new vectors can always hydrate them
+            self.metadata_store.delta.put_many(rows)
+            try:
+                if isinstance(self.index, SegmentedVectorIndex):
+                    self.index.add(ids, vectors)
+                else:
+                    self.index.upsert(vectors=[{"id": str(i), "values": v.tolist()} for i, v in zip(ids, vectors)],
+                                      namespace="recipes-namespace")
+            except Exception:
+                self.metadata_store.delta.delete_many(ids.tolist())
+                raise
+            # Only recipes that made it into the index count as added; a failed add can be retried
+            with self._lock:
+                for row in rows:
+                    self._register(row["id"], row)
+                self.added += len(rows)
+        finally:
+            with self._lock:
+                self._pending.difference_update(fingerprints)
+
+        if len(self.metadata_store.delta) >= self.merge_rows:
+            self.merge()
+        return ids.tolist()
+
+    def add_recipe(self, recipe) -> Optional[int]:
+        """Add one recipe, e.g. as the `on_approved` callback of `generate_validated_recipe`."""
+        added = self.add_recipes([recipe])
+        return added[0] if added else None
+
+    def on_feedback(self, feedback):
+        """Feedback store listener: index the generated recipe of liked, highly rated feedback."""
+        if feedback.liked and feedback.rating >= self.min_rating and feedback.generated_recipe:
+            self.add_recipes([feedback.generated_recipe])
+
+    def merge(self, wait: bool = False):
+        """
+        Start merging the delta into the main index and metadata store in the background.
+
+        Args:
+            wait (bool, optional): Block until the merge has finished. Defaults to False.
+        """
+        if not isinstance(self.index, SegmentedVectorIndex) and not self.metadata_store.covers_index:
+            return   # Pinecone without a main store: the delta is the only store of online recipes
+        with self._lock:
+            if self._merge_thread is None or not self._merge_thread.is_alive():
+                self._merge_thread = threading.Thread(target=self._merge, name="delta-merge", daemon=True)
+                self._merge_thread.start()
+            thread = self._merge_thread
+        if wait:
+            thread.join()
+
+    def _merge(self):
+        try:
+            if isinstance(self.index, SegmentedVectorIndex):
+                self.index.merge()
+                # Rows added since the delta was sealed stay in the delta store with their vectors
+                active = set(self.index.active.ids.tolist())
+                rows = [r for r in self.metadata_store.delta.get_from(0) if int(r["id"]) not in active]
+            else:
+                rows = self.metadata_store.delta.get_from(0)
+            if not rows:
+                return
+            main = RecipeMetadataStore(self.main_store_path)
+            main.put_many(rows)
+            main.close()
+            if self.metadata_store.main is None:
+                self.metadata_store.main = RecipeMetadataStore(self.main_store_path, read_only=True)
+            self.metadata_store.delta.delete_many([r["id"] for r in rows])
+        except Exception as e:
+            logger.warning("Merging the recipe delta failed, it stays searchable in the delta: %s", e)
+
+    def close(self):
+        """Wait for a running merge, close the delta store and stop shard workers."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+        self.metadata_store.delta.close()
+        main = getattr(self.index, "main", None)
+        if isinstance(main, ShardedVectorIndex):
+            main.close()
+
+
+def open_online_index(index, metadata_store: Optional[RecipeMetadataStore], embed_fn: Callable,
+                      feedback_store=None, ingredient_index: Optional[IngredientIndex] = None,
+                      delta_path: str = None) -> OnlineRecipeIndex:
+    """
+    Open the online-update layer over an index and metadata store.
+
+    A LocalVectorIndex is wrapped in a SegmentedVectorIndex (finishing any merge that
+    was interrupted by a restart), recipes added online earlier are re-registered with
+    the ingredient bitmaps, delta rows whose vectors were lost in a crash are re-embedded,
+    and the index subscribes to the feedback store for highly rated recipes.
+
+    Args:
+        index: LocalVectorIndex, ShardedVectorIndex, SegmentedVectorIndex or Pinecone index.
+        metadata_store (RecipeMetadataStore, optional): Main metadata store.
+        embed_fn (Callable): Embeds a list of texts, e.g. `rag.encode_queries`.
+        feedback_store (FeedbackStore, optional): Source of highly rated recipes.
+        ingredient_index (IngredientIndex, optional): Filter bitmaps to keep up to date.
+        delta_path (str, optional): Delta metadata database. Defaults to config.RECIPE_DELTA_DB_PATH.
+
+    Returns:
+        OnlineRecipeIndex: The online index; use its `index` and `metadata_store` for search.
+    """
+    delta = RecipeMetadataStore(delta_path or config.RECIPE_DELTA_DB_PATH)
+    if isinstance(index, (LocalVectorIndex, ShardedVectorIndex)):
+        index = SegmentedVectorIndex(index)
+    if isinstance(index, SegmentedVectorIndex) and index.sealed is not None:
+        index.merge()
+
+    store = OnlineMetadataStore(metadata_store, delta)
+    main_path = metadata_store.db_path if metadata_store is not None else config.RECIPE_METADATA_PATH
+    online = OnlineRecipeIndex(
+        index, store, embed_fn, ingredient_index, main_store_path=main_path,
+        merge_rows=config.DELTA_MERGE_ROWS, min_rating=config.ONLINE_MIN_RATING,
+    )
+
+    existing = (metadata_store.get_from(config.ONLINE_ID_BASE) if metadata_store is not None else []) \
+        + delta.get_from(config.ONLINE_ID_BASE)
+    for recipe in existing:
+        online._register(int(recipe["id"]), recipe)
+    online._next_id = max([config.ONLINE_ID_BASE] + [int(r["id"]) + 1 for r in existing])
+
+    if isinstance(index, SegmentedVectorIndex):
+        pending = delta.get_from(0)
+        lost = [r for r, present in zip(pending, index.contains([int(r["id"]) for r in pending])) if not present]
+        if lost:
+            vectors = embed_fn([make_full_text(r["title"], r["ingredients"], r["directions"]) for r in lost])
+            index.add(np.array([int(r["id"]) for r in lost], dtype=np.int64), np.asarray(vectors, dtype=np.float32))
+
+    if feedback_store is not None:
+        feedback_store.add_listener(online.on_feedback)
+    return online
@@ -0,0 +1,243 @@
+"""This module maintains per-recipe popularity priors derived from user feedback.
+Ratings and likes are accumulated in compact arrays aligned with the vector index ids,
+so every new feedback event is an O(1) update and the priors can be blended with
+vector similarity at query time without re-indexing."""
+
+import atexit
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+class PopularityPrior:
+    """
+    Smoothed per-recipe rating and like-rate, stored as float32 arrays indexed by recipe id.
+
+    Recipes without feedback fall back to the global mean, so the prior only moves a
+    recipe up or down once it has collected some evidence.
+    """
+
+    def __init__(self, size: int = 0, rating_strength: float = 5.0, like_strength: float = 2.0,
+                 aliases: Optional[Dict[int, int]] = None):
+        """
+        Args:
+            size (int): Initial number of recipe ids to allocate. Arrays grow on demand.
+            rating_strength (float): Number of pseudo-ratings at the global mean added to each recipe.
+            like_strength (float): Number of pseudo-votes at the global like rate added to each recipe.
+            aliases (dict, optional): Near-duplicate recipe id -> canonical id; feedback on an
+                alias is credited to its canonical recipe.
+        """
+        self.aliases = aliases or {}
+        self.rating_strength = rating_strength
+        self.like_strength = like_strength
+        self.counts = np.zeros(size, dtype=np.float32)
+        self.rating_sums = np.zeros(size, dtype=np.float32)
+        self.likes = np.zeros(size, dtype=np.float32)
+        self.total_count = 0.0
+        self.total_rating = 0.0
+        self.total_likes = 0.0
+        self.observed_feedback = 0  # feedback entries credited so far, in store insertion order
+        self._lock = threading.Lock()
+
+    def _ensure_size(self, recipe_id: int):
+        if recipe_id < len(self.counts):
+            return
+        new_size = max(recipe_id + 1, 2 * len(self.counts), 1024)
+        for name in ("counts", "rating_sums", "likes"):
+            old = getattr(self, name)
+            grown = np.zeros(new_size, dtype=np.float32)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def observe(self, recipe_id: int, rating: int, liked: bool):
+        """
+        Record one feedback event for a recipe.
+
+        Args:
+            recipe_id (int): Index id of the recipe.
+            rating (int): Rating from 1 to 5.
+            liked (bool): Whether the user liked the recipe.
+        """
+        with self._lock:
+            self._ensure_size(recipe_id)
+            self.counts[recipe_id] += 1
+            self.rating_sums[recipe_id] += rating
+            self.likes[recipe_id] += int(liked)
+            self.total_count += 1
+            self.total_rating += rating
+            self.total_likes += int(liked)
+
+    def observe_feedback(self, feedback, title_to_id: Optional[Dict[str, int]] = None) -> int:
+        """
+        Credit a feedback entry's rating to every recipe retrieved for it.
+
+        Retrieved recipes are matched by their "id" field, or by title through
+        `title_to_id` for entries recorded before ids were kept.
+
+        Args:
+            feedback (RecipeFeedback or dict): The feedback entry.
+            title_to_id (dict, optional): Mapping from recipe title to index id.
+
+        Returns:
+            int: Number of recipes updated.
+        """
+        entry = feedback if isinstance(feedback, dict) else feedback.model_dump()
+        updated = 0
+        for recipe in entry.get("retrieved_recipes", []):
+            recipe_id = recipe.get("id")
+            if recipe_id is None and title_to_id is not None:
+                recipe_id = title_to_id.get(recipe.get("title"))
+            if recipe_id is None:
+                continue
+            recipe_id = self.aliases.get(int(recipe_id), int(recipe_id))
+            self.observe(recipe_id, entry["rating"], entry["liked"])
+            updated += 1
+        self.observed_feedback += 1
+        return updated
+
+    def observe_many(self, entries: Iterable, title_to_id: Optional[Dict[str, int]] = None) -> int:
+        """Credit a sequence of feedback entries. Returns the number of recipe updates."""
+        return sum(self.observe_feedback(entry, title_to_id) for entry in entries)
+
+    def scores(self, recipe_ids) -> np.ndarray:
+        """
+        Return the prior for each recipe id as a value in [0, 1].
+
+        The prior is the mean of the smoothed rating (rescaled from 1-5) and the
+        smoothed like rate.
+
+        Args:
+            recipe_ids (array-like of int): Index ids.
+
+        Returns:
+            np.ndarray: Prior scores aligned with `recipe_ids`.
+        """
+        ids = np.asarray(recipe_ids, dtype=np.int64)
+        mean_rating = self.total_rating / self.total_count if self.total_count else 3.0
+        like_rate = self.total_likes / self.total_count if self.total_count else 0.5
+
+        in_range = ids < len(self.counts)
+        counts = np.zeros(len(ids), dtype=np.float32)
+        rating_sums = np.zeros(len(ids), dtype=np.float32)
+        likes = np.zeros(len(ids), dtype=np.float32)
+        counts[in_range] = self.counts[ids[in_range]]
+        rating_sums[in_range] = self.rating_sums[ids[in_range]]
+        likes[in_range] = self.likes[ids[in_range]]
+
+        rating = (rating_sums + self.rating_strength * mean_rating) / (counts + self.rating_strength)
+        liked = (likes + self.like_strength * like_rate) / (counts + self.like_strength)
+        return 0.5 * (rating - 1.0) / 4.0 + 0.5 * liked
+
+    def save(self, path: str):
+        """Save the prior arrays and global totals to a `.npz` file."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            np.savez(
+                path,
+                counts=self.counts,
+                rating_sums=self.rating_sums,
+                likes=self.likes,
+                totals=np.array([self.total_count, self.total_rating, self.total_likes], dtype=np.float64),
+                observed_feedback=np.array(self.observed_feedback, dtype=np.int64),
+            )
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "PopularityPrior":
+        """Load a prior saved with `save`. Returns an empty prior if the file does not exist."""
+        prior = cls(**kwargs)
+        if not os.path.exists(path):
+            return prior
+        with np.load(path) as data:
+            prior.counts = data["counts"].astype(np.float32)
+            prior.rating_sums = data["rating_sums"].astype(np.float32)
+            prior.likes = data["likes"].astype(np.float32)
+            prior.total_count, prior.total_rating, prior.total_likes = data["totals"].tolist()
+            if "observed_feedback" in data:
+                prior.observed_feedback = int(data["observed_feedback"])
+        return prior
+
+
+def _missing_title_ids(entries: list, metadata_store) -> Dict[str, int]:
+    """Resolve titles of retrieved recipes that have no "id" through the metadata store."""
+    if metadata_store is None:
+        return {}
+    titles = [
+        recipe.get("title")
+        for entry in entries
+        for recipe in entry.get("retrieved_recipes", [])
+        if recipe.get("id") is None and recipe.get("title")
+    ]
+    return metadata_store.ids_for_titles(titles) if titles else {}
+
+
+def open_popularity_prior(path: str, feedback_store=None, metadata_store=None, aliases: Optional[Dict[int, int]] = None,
+                          save_every: int = 20, batch_size: int = 1000) -> PopularityPrior:
+    """
+    Load the popularity prior and keep it in sync with the feedback store.
+
+    Feedback stored since the prior was last saved (all of it, the first time) is
+    credited in batches, with retrieved recipes recorded before ids were kept matched
+    by title through the metadata store. The prior is then registered as a listener
+    on the feedback store and saved every `save_every` new entries and at exit.
+
+    Args:
+        path (str): Location of the saved prior, e.g. config.POPULARITY_PRIOR_PATH.
+        feedback_store (FeedbackStore, optional): Source of feedback events.
+        metadata_store (RecipeMetadataStore, optional): Used to resolve titles to ids.
+        aliases (dict, optional): Near-duplicate id -> canonical id, see `deduplication.load_alias_map`.
+        save_every (int, optional): Save after this many new feedback entries. Defaults to 20.
+        batch_size (int, optional): Entries credited per title lookup during catch-up. Defaults to 1000.
+
+    Returns:
+        PopularityPrior: The prior.
+    """
+    prior = PopularityPrior.load(path, aliases=aliases)
+    if feedback_store is None:
+        return prior
+
+    if prior.observed_feedback < len(feedback_store):
+        batch = []
+        for position, entry in enumerate(feedback_store.iter_all(batch_size)):
+            if position < prior.observed_feedback:
+                continue
+            batch.append(entry)
+            if len(batch) == batch_size:
+                prior.observe_many(batch, _missing_title_ids(batch, metadata_store))
+                batch = []
+        if batch:
+            prior.observe_many(batch, _missing_title_ids(batch, metadata_store))
+        prior.save(path)
+
+    def on_feedback(feedback):
+        entry = feedback.model_dump()
+        prior.observe_feedback(entry, _missing_title_ids([entry], metadata_store))
+        if prior.observed_feedback % save_every == 0:
+            prior.save(path)
+
+    feedback_store.add_listener(on_feedback)
+    atexit.register(prior.save, path)
+    return prior
+
+
+def rerank_with_prior(matches: list, prior: PopularityPrior, top_k: int, weight: float) -> list:
+    """
+    Re-rank vector search matches by blending similarity with the popularity prior.
+
+    Args:
+        matches (list): Matches with "id" and "score" fields, as returned by the index.
+        prior (PopularityPrior): The popularity prior.
+        top_k (int): Number of matches to keep.
+        weight (float): Weight of the prior in the blended score (0 keeps the vector order).
+
+    Returns:
+        list: The top_k matches, best first.
+    """
+    if not matches:
+        return []
+    similarity = np.array([m["score"] for m in matches], dtype=np.float32)
+    popularity = prior.scores([int(m["id"]) for m in matches])
+    blended = (1.0 - weight) * similarity + weight * popularity
+    order = np.argsort(-blended, kind="stable")[:top_k]
+    return [matches[i] for i in order]
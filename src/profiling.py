@@ -0,0 +1,257 @@
+"""This module provides an opt-in per-request profiler. For a configurable fraction of
+requests it runs a wall-clock sampling profiler over the request's thread (written in the
+collapsed format read by flamegraph.pl and speedscope) and takes `tracemalloc` snapshots
+before and after, writing the top allocation sites. Allocation tracing is process-wide,
+so those sites can include requests running concurrently. Each report also lists the
+parameter memory of the loaded embedding and CLIP models.
+
+Profiling is switched on with LAZYCOOK_PROFILE_RATE (e.g. 0.05 for 5% of requests) and
+hooks into the job runner and the pipeline entry points, so callers need no changes."""
+
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+# Models registered by their loaders, for the parameter memory report
+_models: "weakref.WeakValueDictionary" = weakref.WeakValueDictionary()
+
+
+def register_model(name: str, model):
+    """Record a loaded model (e.g. the embedding or CLIP model) for `model_memory_report`."""
+    try:
+        _models[name] = model
+    except TypeError:
+        pass   # not weak-referenceable; such models are skipped in reports
+
+
+def model_memory_report() -> List[dict]:
+    """
+    Parameter and buffer memory of every registered model, by dtype and device.
+
+    Returns:
+        List[dict]: {"model", "parameters", "parameter_bytes", "buffer_bytes", "by_dtype", "devices"}
+    """
+    report = []
+    for name, model in list(_models.items()):
+        if not hasattr(model, "parameters"):
+            continue
+        by_dtype: Dict[str, int] = Counter()
+        devices = set()
+        count = parameter_bytes = 0
+        for p in model.parameters():
+            size = p.numel() * p.element_size()
+            count += p.numel()
+            parameter_bytes += size
+            by_dtype[str(p.dtype).replace("torch.", "")] += size
+            devices.add(str(p.device))
+        buffer_bytes = sum(b.numel() * b.element_size() for b in model.buffers()) if hasattr(model, "buffers") else 0
+        report.append({"model": name, "parameters": count, "parameter_bytes": parameter_bytes,
+                       "buffer_bytes": buffer_bytes, "by_dtype": dict(by_dtype), "devices": sorted(devices)})
+    return report
+
+
+# Allocations of the profiler itself are left out of the reports
+_ALLOCATION_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, threading.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the stack of one thread (the profiled request's) every `interval` seconds.
+    While tracemalloc is tracing it also snapshots the heap whenever traced memory reaches
+    a new high, so short-lived allocations show up in the report even though they are
+    freed by the end.
+    """
+
+    def __init__(self, interval: float, thread_id: int):
+        super().__init__(name="lazycook-profiler", daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.peak_snapshot = None
+        self.peak_bytes = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        thread = next((t for t in threading.enumerate() if t.ident == self.thread_id), None)
+        thread_name = thread.name if thread is not None else f"thread-{self.thread_id}"
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_name)
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+            if tracemalloc.is_tracing() and self.samples % 10 == 0:
+                current = tracemalloc.get_traced_memory()[0]
+                if current > self.peak_bytes * 1.1:
+                    self.peak_bytes = current
+                    self.peak_snapshot = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """
+    Decides which requests are profiled and writes their reports to `directory`.
+
+    Per profiled request it writes `<stem>.collapsed` (sampled stacks), `<stem>.alloc.txt`
+    (top allocation sites) and `<stem>.json` (summary with model memory).
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.0, interval_ms: float = 5.0, top_allocations: int = 25):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000.0
+        self.top_allocations = top_allocations
+        self._local = threading.local()
+        self._tracemalloc_users = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def _start_tracemalloc(self) -> bool:
+        with self._lock:
+            if self._tracemalloc_users == 0 and tracemalloc.is_tracing():
+                return False   # traced by someone else: leave it alone
+            if self._tracemalloc_users == 0:
+                tracemalloc.start(16)
+            self._tracemalloc_users += 1
+            return True
+
+    def _stop_tracemalloc(self, started: bool):
+        if not started:
+            return
+        with self._lock:
+            self._tracemalloc_users -= 1
+            if self._tracemalloc_users == 0:
+                tracemalloc.stop()
+
+    @contextmanager
+    def profile(self, name: str, force: bool = False):
+        """
+        Profile the block if this request is sampled (or `force`). Nested calls in the
+        same thread are not profiled again.
+        """
+        if getattr(self._local, "active", False) or not (force or (self.enabled and self._rng.random() < self.sample_rate)):
+            yield None
+            return
+        self._local.active = True
+        own_tracemalloc = self._start_tracemalloc()
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        sampler = _Sampler(self.interval, threading.get_ident())
+        start = time.perf_counter()
+        sampler.start()
+        error = None
+        try:
+            yield sampler
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - start
+            after = tracemalloc.take_snapshot() if before is not None else None
+            current, peak = tracemalloc.get_traced_memory() if after is not None else (0, None)
+            self._stop_tracemalloc(own_tracemalloc)
+            self._local.active = False
+            try:
+                self._write(name, duration, sampler, before, after, current, peak, error)
+            except OSError as e:
+                logger.warning("Could not write profile for %s: %s", name, e)
+
+    def _write(self, name: str, duration: float, sampler: _Sampler, before, after, current: int,
+               peak: Optional[int], error: Optional[str]):
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}-"
+                                            f"{threading.get_ident() % 100000}")
+        with open(stem + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        allocations = []
+        if after is not None:
+            # Sites live at the highest sampled heap, or still held at the end if that is larger
+            peak_snapshot = sampler.peak_snapshot
+            top = peak_snapshot if peak_snapshot is not None and sampler.peak_bytes > current else after
+            allocations = top.filter_traces(_ALLOCATION_FILTERS).compare_to(
+                before.filter_traces(_ALLOCATION_FILTERS), "lineno")[:self.top_allocations]
+            with open(stem + ".alloc.txt", "w", encoding="utf-8") as f:
+                f.write("# Process-wide allocations; sites can include requests running concurrently\n")
+                for stat in allocations:
+                    f.write(f"{stat}\n")
+
+        summary = {
+            "name": name,
+            "duration_s": duration,
+            "samples": sampler.samples,
+            "interval_ms": self.interval * 1000.0,
+            "error": error,
+            "traced_peak_bytes": peak,
+            "allocation_scope": "process",   # tracemalloc cannot attribute allocations to a thread
+            "max_rss_bytes": _max_rss_bytes(),
+            "top_allocations": [
+                {"site": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in allocations[:10]
+            ],
+            "models": model_memory_report(),
+        }
+        with open(stem + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+def _max_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+profiler = RequestProfiler(config.PROFILE_DIR, config.PROFILE_SAMPLE_RATE, config.PROFILE_INTERVAL_MS)
+
+
+def profiled(name: str):
+    """Decorator profiling a sampled fraction of calls of the function (see `RequestProfiler.profile`)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with profiler.profile(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
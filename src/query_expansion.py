@@ -0,0 +1,221 @@
+"""This module provides an LLM-free query expander mined from the recipe dataset.
+Ingredient names (from `NER`) and title words are counted per recipe, pairwise
+co-occurrence is scored with pointwise mutual information (PMI), and the top
+neighbours of every term are stored, so expanding a query is a few dictionary and
+array lookups instead of an LLM generation."""
+
+import json
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.data_processing import parse_list_field
+
+_TOKEN_RE = re.compile(r"[a-z]+")
+
+# Title words that say nothing about the dish itself
+STOPWORDS = frozenset("""
+a an and the of with in on for to or my mom s moms grandma grandmas aunt easy quick best
+favorite famous recipe style homemade simple new old good great delicious super special
+i want something like some would eat make cook have at home me please
+""".split())
+
+# Seasonal produce, tagged with the season names returned by `llm_interaction.get_season`
+SEASONAL_INGREDIENTS = {
+    "Spring": ["asparagus", "peas", "rhubarb", "radishes", "spinach", "strawberries", "artichokes", "leeks", "mint"],
+    "Summer": ["tomatoes", "zucchini", "corn", "peaches", "berries", "basil", "cucumber", "watermelon", "peppers"],
+    "Autumn": ["pumpkin", "apples", "squash", "sweet potatoes", "mushrooms", "pears", "cranberries", "cinnamon"],
+    "Winter": ["cabbage", "kale", "potatoes", "carrots", "citrus", "oranges", "parsnips", "beets", "chestnuts"],
+}
+
+
+def normalize_term(text: str) -> str:
+    """Lower-case a term and keep only its letters, e.g. "Brown Sugar," -> "brown sugar"."""
+    return " ".join(_TOKEN_RE.findall(str(text).lower()))
+
+
+def recipe_terms(title: str, ner: Sequence[str]) -> List[str]:
+    """Unique terms of one recipe: normalized ingredient names and non-stopword title words."""
+    terms = {normalize_term(item) for item in ner}
+    terms.update(word for word in _TOKEN_RE.findall(str(title).lower()) if word not in STOPWORDS and len(word) > 2)
+    terms.discard("")
+    return sorted(terms)
+
+
+def _count_pairs(doc_terms: List[np.ndarray], vocab_size: int) -> Dict[int, int]:
+    """Count co-occurring term pairs (i < j) across documents, encoded as i * vocab_size + j."""
+    codes = []
+    for ids in doc_terms:
+        if len(ids) < 2:
+            continue
+        i, j = np.triu_indices(len(ids), k=1)
+        codes.append(ids[i] * vocab_size + ids[j])
+    if not codes:
+        return {}
+    unique, counts = np.unique(np.concatenate(codes), return_counts=True)
+    return dict(zip(unique.tolist(), counts.tolist()))
+
+
+class QueryExpander:
+    """
+    PMI-based keyword expander.
+
+    For each vocabulary term the `n_neighbors` terms with the highest PMI (among pairs
+    seen at least `min_pair_count` times) are kept in dense arrays. A query is expanded
+    by matching its words and bigrams against the vocabulary and summing the neighbour
+    scores of the matched terms.
+    """
+
+    def __init__(self, vocab: List[str], neighbors: np.ndarray, scores: np.ndarray,
+                 season_terms: Optional[Dict[str, List[str]]] = None):
+        """
+        Args:
+            vocab (List[str]): Terms, indexed by id.
+            neighbors (np.ndarray): int32 array (len(vocab), n_neighbors) of neighbour ids, -1 for none.
+            scores (np.ndarray): float32 array of the same shape with PMI scores.
+            season_terms (dict, optional): Season name -> in-vocabulary seasonal ingredients.
+        """
+        self.vocab = list(vocab)
+        self.term_ids = {term: i for i, term in enumerate(self.vocab)}
+        self.neighbors = neighbors
+        self.scores = scores
+        self.season_terms = season_terms or {}
+
+    @classmethod
+    def build(cls, titles: Iterable[str], ner_lists: Iterable, min_count: int = 5, min_pair_count: int = 3,
+              max_vocab: int = 20000, n_neighbors: int = 20, chunk_size: int = 50000) -> "QueryExpander":
+        """
+        Mine co-occurrence statistics from the dataset's titles and NER columns.
+
+        Args:
+            titles (Iterable[str]): Recipe titles.
+            ner_lists (Iterable): NER ingredient lists (lists or JSON strings).
+            min_count (int, optional): Minimum number of recipes a term must appear in. Defaults to 5.
+            min_pair_count (int, optional): Minimum co-occurrence count for a neighbour. Defaults to 3.
+            max_vocab (int, optional): Keep at most this many most frequent terms. Defaults to 20000.
+            n_neighbors (int, optional): Neighbours kept per term. Defaults to 20.
+            chunk_size (int, optional): Recipes per pair-counting chunk. Defaults to 50000.
+
+        Returns:
+            QueryExpander: The expander.
+        """
+        docs = [recipe_terms(title, parse_list_field(ner)) for title, ner in zip(titles, ner_lists)]
+        doc_freq = Counter(term for terms in docs for term in terms)
+        vocab = [term for term, count in doc_freq.most_common(max_vocab) if count >= min_count]
+        term_ids = {term: i for i, term in enumerate(vocab)}
+        vocab_size = len(vocab)
+        n_docs = max(len(docs), 1)
+
+        pair_counts: Counter = Counter()
+        for start in range(0, len(docs), chunk_size):
+            chunk = [
+                np.array(sorted(term_ids[t] for t in terms if t in term_ids), dtype=np.int64)
+                for terms in docs[start:start + chunk_size]
+            ]
+            pair_counts.update(_count_pairs(chunk, vocab_size))
+
+        codes = np.fromiter((c for c, n in pair_counts.items() if n >= min_pair_count), dtype=np.int64)
+        counts = np.fromiter((n for n in pair_counts.values() if n >= min_pair_count), dtype=np.float64)
+        left, right = codes // vocab_size, codes % vocab_size
+        freq = np.array([doc_freq[t] for t in vocab], dtype=np.float64)
+        pmi = np.log(counts * n_docs / (freq[left] * freq[right])).astype(np.float32)
+
+        # Symmetric edges, then the top n_neighbors per term by PMI
+        src = np.concatenate([left, right])
+        dst = np.concatenate([right, left])
+        edge_pmi = np.concatenate([pmi, pmi])
+        order = np.lexsort((-edge_pmi, src))
+        src, dst, edge_pmi = src[order], dst[order], edge_pmi[order]
+        starts = np.searchsorted(src, np.arange(vocab_size))
+        rank = np.arange(len(src)) - starts[src]
+        keep = rank < n_neighbors
+
+        neighbors = np.full((vocab_size, n_neighbors), -1, dtype=np.int32)
+        scores = np.zeros((vocab_size, n_neighbors), dtype=np.float32)
+        neighbors[src[keep], rank[keep]] = dst[keep]
+        scores[src[keep], rank[keep]] = edge_pmi[keep]
+
+        season_terms = {
+            season: [normalize_term(t) for t in terms if normalize_term(t) in term_ids]
+            for season, terms in SEASONAL_INGREDIENTS.items()
+        }
+        return cls(vocab, neighbors, scores, season_terms)
+
+    def match_terms(self, text: str) -> List[int]:
+        """Ids of vocabulary terms (bigrams first, then single words) found in `text`."""
+        words = _TOKEN_RE.findall(text.lower())
+        found, used = [], set()
+        for i in range(len(words) - 1):
+            term_id = self.term_ids.get(f"{words[i]} {words[i + 1]}")
+            if term_id is not None:
+                found.append(term_id)
+                used.update((i, i + 1))
+        for i, word in enumerate(words):
+            if i not in used and word not in STOPWORDS:
+                term_id = self.term_ids.get(word)
+                if term_id is not None:
+                    found.append(term_id)
+        return list(dict.fromkeys(found))
+
+    def expand(self, question: str, ingredients: str = "", k: int = 8, date: datetime = None,
+               n_seasonal: int = 2) -> List[str]:
+        """
+        Expand a query into related keywords.
+
+        Args:
+            question (str): The user's question.
+            ingredients (str, optional): Ingredients the user has.
+            k (int, optional): Number of co-occurrence keywords. Defaults to 8.
+            date (datetime, optional): Date used to pick seasonal ingredients. Defaults to now.
+            n_seasonal (int, optional): Seasonal ingredients added. Defaults to 2.
+
+        Returns:
+            List[str]: The matched query terms followed by the expansion keywords;
+            empty if nothing in the query is in the vocabulary.
+        """
+        matched = self.match_terms(f"{question} {ingredients}")
+        if not matched:
+            return []
+        ids = self.neighbors[matched].ravel()
+        scores = self.scores[matched].ravel()
+        valid = ids >= 0
+        totals = np.zeros(len(self.vocab), dtype=np.float32)
+        np.add.at(totals, ids[valid], np.maximum(scores[valid], 0.0))
+        totals[matched] = 0.0
+        top = np.argsort(-totals)[:k]
+        keywords = [self.vocab[i] for i in matched] + [self.vocab[i] for i in top if totals[i] > 0]
+
+        if n_seasonal:
+            from src.llm_interaction import get_season
+
+            seasonal = self.season_terms.get(get_season(date or datetime.now()), [])
+            # Prefer seasonal ingredients related to the query, then the list order
+            seasonal = sorted(seasonal, key=lambda t: -totals[self.term_ids[t]])
+            keywords += [t for t in seasonal[:n_seasonal] if t not in keywords]
+        return keywords
+
+    def save(self, path: str):
+        """Save the expander to a `.npz` file."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(
+            path,
+            vocab=np.array(self.vocab, dtype=object),
+            neighbors=self.neighbors,
+            scores=self.scores,
+            season_terms=np.array(json.dumps(self.season_terms)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "QueryExpander":
+        """Load an expander saved with `save`."""
+        with np.load(path, allow_pickle=True) as data:
+            return cls(
+                data["vocab"].tolist(),
+                data["neighbors"],
+                data["scores"],
+                json.loads(str(data["season_terms"])),
+            )
@@ -1,50 +1,232 @@
+import logging
+import os
+from functools import lru_cache
+
 import numpy as np
-from pinecone import Pinecone
 from . import config
 from .embedding_utils import load_embedding_model
 from .llm_interaction import get_keywords_from_llm
+from .metadata_store import RecipeMetadataStore
+from .popularity import PopularityPrior, rerank_with_prior
+from .batching import MicroBatcher
+from .query_expansion import QueryExpander
+from .ingredient_filter import IngredientIndex, RecipeFilter, extract_constraints
+from .vector_index import supports_prefilter
+from .telemetry import span, traced
+from .profiling import profiled
+
+logger = logging.getLogger(__name__)
 
 # Load the embedding model globally
 _model_emb = load_embedding_model(config.EMBEDDING_MODEL, config.DEVICE)
+_query_batcher = None
+
+
+def _encode_batch(texts: list) -> np.ndarray:
+    return _model_emb.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
 
-def search_recipes(query: str, ingredients: str, index: Pinecone, top_k: int = 3) -> list:
+def enable_query_batching(max_batch_size: int = None, max_wait_ms: float = None) -> MicroBatcher:
     """
-    Search for recipes using Pinecone vector search with weighted query combination.
+    Route query embeddings through a shared micro-batcher, so concurrent `search_recipes`
+    calls (e.g. from the HTTP service) share one forward pass of the embedding model.
+
+    Args:
+        max_batch_size (int, optional): Defaults to config.BATCH_MAX_SIZE.
+        max_wait_ms (float, optional): Defaults to config.BATCH_MAX_WAIT_MS.
+
+    Returns:
+        MicroBatcher: The batcher, e.g. to read its batch statistics.
+    """
+    global _query_batcher
+    if _query_batcher is None:
+        _query_batcher = MicroBatcher(
+            _encode_batch,
+            max_batch_size=max_batch_size or config.BATCH_MAX_SIZE,
+            max_wait_ms=max_wait_ms if max_wait_ms is not None else config.BATCH_MAX_WAIT_MS,
+            name="query-embedding-batcher",
+        )
+    return _query_batcher
+
+
+def encode_queries(texts: list) -> np.ndarray:
+    """Embed query texts in one call, through the micro-batcher when it is enabled."""
+    if _query_batcher is not None:
+        return np.stack(_query_batcher.map(texts))
+    return _encode_batch(texts)
+
+def blend_query_vectors(query_vector: np.ndarray, expanded_vector: np.ndarray) -> np.ndarray:
+    """Weighted query embedding used for search: 70% original query, 30% enriched query."""
+    return 0.7 * query_vector + 0.3 * expanded_vector
+
+@lru_cache(maxsize=1)
+def get_query_expander():
+    """Return the local PMI query expander, or None if it has not been built yet."""
+    if not os.path.exists(config.QUERY_EXPANSION_PATH):
+        return None
+    return QueryExpander.load(config.QUERY_EXPANSION_PATH)
+
+
+@lru_cache(maxsize=1)
+def get_ingredient_index():
+    """Return the per-ingredient recipe bitmaps, or None if they have not been built yet."""
+    if not os.path.exists(config.INGREDIENT_INDEX_PATH):
+        return None
+    return IngredientIndex.load(config.INGREDIENT_INDEX_PATH)
+
+
+def build_recipe_filter(query: str) -> RecipeFilter:
+    """Id filter for the ingredient constraints in the query ("no nuts", ...), or None."""
+    constraints = extract_constraints(query)
+    if not constraints:
+        return None
+    ingredient_index = get_ingredient_index()
+    return ingredient_index.build_filter(constraints) if ingredient_index is not None else None
+
+
+def expand_query(query: str, ingredients: str, expansion: str = None) -> str:
+    """
+    Enrich the query with related keywords.
+
+    Args:
+        query (str): The user's question.
+        ingredients (str): Available ingredients.
+        expansion (str, optional): "local" for the PMI co-occurrence expander or "llm".
+            Defaults to config.QUERY_EXPANSION.
+
+    Returns:
+        str: Comma-separated keywords. With "local", falls back to the LLM when the
+        expander is missing or matches nothing (if config.QUERY_EXPANSION_LLM_FALLBACK).
+    """
+    expansion = expansion or config.QUERY_EXPANSION
+    if expansion == "local":
+        expander = get_query_expander()
+        keywords = expander.expand(query, ingredients, k=config.QUERY_EXPANSION_KEYWORDS) if expander else []
+        if keywords or not config.QUERY_EXPANSION_LLM_FALLBACK:
+            return ", ".join(keywords) or query
+    return get_keywords_from_llm(query, config.LLM_API_URL, config.LLM_MODEL)
+
+
+@profiled("search_recipes")
+@traced("retrieval")
+def search_recipes(query: str, ingredients: str, index, top_k: int = 3,
+                   prior: PopularityPrior = None, metadata_store: RecipeMetadataStore = None,
+                   expansion: str = None) -> list:
+    """
+    Search for recipes using vector search with weighted query combination.
+
+    When a popularity prior is given, an oversampled candidate set is retrieved and
+    re-ranked by blending vector similarity with the feedback-derived prior.
+    When a metadata store is given, the index is queried for ids only and the
+    results are hydrated locally.
+    Ingredient constraints in the query ("no nuts", "allergic to shellfish", "must
+    include chicken") become an id filter that the local index applies during candidate
+    selection; with Pinecone, an oversampled candidate set is filtered instead. When
+    fewer than `top_k` recipes have every required ingredient, the search is repeated
+    with them only preferred. Preferred ingredients ("with chicken") add
+    config.PREFER_BOOST to a candidate's score.
 
     Args:
         query (str): The user's question about what they want to cook
         ingredients (str): Available ingredients
-        index (Pinecone): Pinecone index instance
+        index: Pinecone index or LocalVectorIndex (see `vector_index.open_vector_index`)
         top_k (int): Number of recipes to return
+        prior (PopularityPrior, optional): Per-recipe popularity prior for re-ranking
+        metadata_store (RecipeMetadataStore, optional): Local id-to-recipe store
+        expansion (str, optional): Query expander, "local" or "llm"; defaults to config.QUERY_EXPANSION
 
     Returns:
         list: List of dictionaries with recipe info
     """
-    # Step 1: Get enriched query using LLM
-    q_ext = get_keywords_from_llm(query, config.LLM_API_URL, config.LLM_MODEL)
+    # Step 1: Get enriched query (local co-occurrence expander, or the LLM)
+    with span("expansion", expansion=expansion or config.QUERY_EXPANSION):
+        q_ext = expand_query(query, ingredients, expansion)
     query_text1 = query + " " + ingredients
     query_text2 = q_ext
 
-    # Step 2: Embed both queries using the embedding model
-    query_vector1 = _model_emb.encode(query_text1, show_progress_bar=False).tolist()
-    query_vector2 = _model_emb.encode(query_text2, show_progress_bar=False).tolist()
+    # Step 2: Embed both queries using the embedding model, in a single batch
+    with span("embed"):
+        query_vector1, query_vector2 = encode_queries([query_text1, query_text2])
 
     # Step 3: Combine vectors with weights (70% original query, 30% enriched query)
-    query_vector = (0.7 * np.array(query_vector1) + 0.3 * np.array(query_vector2)).tolist()
+    query_vector = blend_query_vectors(query_vector1, query_vector2).tolist()
+
+    # Step 4: Search the index (oversampled when re-ranking with the prior, and with a
+    # small margin when hydrating locally so ids missing from the store can be dropped)
+    num_candidates = top_k * config.PRIOR_OVERSAMPLE if prior is not None else top_k
+    if metadata_store is not None:
+        num_candidates += config.HYDRATION_MARGIN
+    # A store of only the recipes added online (`OnlineMetadataStore` without a main store)
+    # hydrates those ids; the index's own metadata is kept for the rest
+    store_covers_index = metadata_store is not None and getattr(metadata_store, "covers_index", True)
+    def run_query(recipe_filter):
+        filter_kwargs, candidates = {}, num_candidates
+        if recipe_filter is not None and recipe_filter.restricts and supports_prefilter(index):
+            filter_kwargs["recipe_filter"] = recipe_filter
+        if recipe_filter is not None and (recipe_filter.prefer is not None or
+                                          (recipe_filter.restricts and not filter_kwargs)):
+            # Post-filtering and preference boosts both need a wider candidate set
+            candidates *= config.FILTER_OVERSAMPLE
+        with span("query", top_k=candidates, filtered=bool(recipe_filter is not None and recipe_filter.restricts)):
+            results = index.query(
+                vector=query_vector,
+                top_k=candidates,
+                namespace="recipes-namespace",
+                include_metadata=not store_covers_index,
+                **filter_kwargs
+            )
+        found = results["matches"]
+        if recipe_filter is not None and recipe_filter.restricts and not filter_kwargs:
+            found = [m for m in found if recipe_filter.allows(m["id"])]
+        return found
+
+    recipe_filter = build_recipe_filter(query)
+    matches = run_query(recipe_filter)
+    if recipe_filter is not None and recipe_filter.include is not None and len(matches) < top_k:
+        # Too few recipes have every required ingredient: keep the exclusions, prefer the rest
+        recipe_filter = recipe_filter.relaxed()
+        matches = run_query(recipe_filter)
+    if recipe_filter is not None and recipe_filter.prefer is not None and matches:
+        boost = recipe_filter.preferred([int(m["id"]) for m in matches]) * config.PREFER_BOOST
+        boosted = []
+        for match, extra in zip(matches, boost.tolist()):
+            entry = {"id": match["id"], "score": match["score"] + extra}
+            if not store_covers_index:
+                entry["metadata"] = match["metadata"]
+            boosted.append(entry)
+        matches = sorted(boosted, key=lambda m: -m["score"])
+
+    # Step 5: Hydrate every candidate from the metadata store before cutting to top_k
+    recipes = None
+    if metadata_store is not None:
+        to_hydrate = matches if store_covers_index else [m for m in matches
+                                                         if int(m["id"]) >= config.ONLINE_ID_BASE]
+        hydrated = metadata_store.get_many([m["id"] for m in to_hydrate]) if to_hydrate else []
+        missing = [m["id"] for m, recipe in zip(to_hydrate, hydrated) if recipe is None]
+        if missing:
+            logger.warning("%d of %d search results are not in the metadata store (e.g. id %s); "
+                           "the index and %s are out of sync.", len(missing), len(to_hydrate), missing[0],
+                           metadata_store.db_path)
+        recipes = {m["id"]: recipe for m, recipe in zip(to_hydrate, hydrated) if recipe is not None}
+        missing = set(missing)
+        matches = [m for m in matches if m["id"] not in missing]
 
-    # Step 4: Search Pinecone
-    results = index.query(
-        vector=query_vector,
-        top_k=top_k,
-        namespace="recipes-namespace",
-        include_metadata=True
-    )
+    # Step 6: Re-rank with the popularity prior
+    if prior is not None:
+        matches = rerank_with_prior(matches, prior, top_k, config.PRIOR_WEIGHT)
+    else:
+        matches = matches[:top_k]
 
-    # Step 5: Format results
+    # Step 7: Format results
+    recipes = recipes or {}
     recipes_for_llm = []
-    for match in results["matches"]:
-        metadata = match["metadata"]
+    for match in matches:
+        if match["id"] in recipes:
+            recipes_for_llm.append(recipes[match["id"]])
+            continue
+        metadata = match["metadata"] or {}
         recipes_for_llm.append({
+            "id": match["id"],
             "title": metadata.get("title", ""),
             "ingredients": metadata.get("ingredients", ""),
             "directions": metadata.get("directions", "")
@@ -0,0 +1,194 @@
+"""This module provides a bounded per-session history of generated recipes.
+Only small JPEG thumbnails and the most recent entries are held in memory; full-size
+images are written to a disk cache as soon as they are added, and older entries are
+spilled to disk once the session exceeds its memory cap."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from typing import List, Optional, Union
+
+from PIL import Image
+
+from src.encoded_image import EncodedImage
+
+
+class RecipeHistory:
+    """
+    Recipe history for one UI session, newest entry first.
+
+    Each in-memory entry holds the recipe fields, the missing ingredients, any extra
+    fields passed to `add` and a JPEG thumbnail. When the estimated memory of the
+    in-memory entries exceeds `memory_cap_bytes`, the oldest ones are written to
+    `<cache_dir>/<entry id>.json` and only their id and title stay in memory. Beyond
+    `max_entries` the oldest entries are deleted altogether.
+    """
+
+    def __init__(self, cache_root: str, memory_cap_bytes: int = 8 * 1024 * 1024, max_entries: int = 100,
+                 thumbnail_size=(256, 128), thumbnail_quality: int = 70):
+        """
+        Args:
+            cache_root (str): Directory under which this session's cache directory is created.
+            memory_cap_bytes (int, optional): Memory budget for in-memory entries. Defaults to 8 MiB.
+            max_entries (int, optional): Maximum number of entries kept, in memory or on disk. Defaults to 100.
+            thumbnail_size (tuple, optional): Bounding box of the thumbnails. Defaults to (256, 128).
+            thumbnail_quality (int, optional): JPEG quality of the thumbnails. Defaults to 70.
+        """
+        os.makedirs(cache_root, exist_ok=True)
+        self.cache_dir = tempfile.mkdtemp(prefix="session-", dir=cache_root)
+        self.memory_cap_bytes = memory_cap_bytes
+        self.max_entries = max_entries
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self._entries: List[dict] = []
+        self._lock = threading.Lock()
+        # Remove the session's cache directory when the history is garbage collected
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.cache_dir, True)
+
+    # ── writes ──────────────────────────────────────────────────
+
+    def add(self, recipe, missing: list, image: Union[EncodedImage, Image.Image, None] = None, **extra) -> str:
+        """
+        Add a generated recipe to the front of the history.
+
+        Args:
+            recipe (Recipe or dict): The generated recipe.
+            missing (list): Ingredients the user needs to buy.
+            image (EncodedImage or PIL.Image.Image, optional): The full-size recipe image, written
+                to disk as WebP (an EncodedImage is re-encoded without keeping a decoded copy).
+            **extra: Additional JSON-serializable fields stored with the entry.
+
+        Returns:
+            str: The id of the new entry.
+        """
+        entry_id = uuid.uuid4().hex[:12]
+        recipe = recipe if isinstance(recipe, dict) else recipe.model_dump()
+        entry = {"id": entry_id, "title": recipe["title"], "recipe": recipe, "missing": list(missing or []), **extra}
+        entry["thumbnail"] = None
+        entry["has_image"] = image is not None
+        if image is not None:
+            if not isinstance(image, EncodedImage):
+                image = EncodedImage.from_image(image)
+            with open(self._image_path(entry_id), "wb") as f:
+                f.write(image.to_bytes("WEBP", quality=90))
+            entry["thumbnail"] = image.thumbnail(self.thumbnail_size, self.thumbnail_quality)
+        entry["size"] = self._estimate_size(entry)
+
+        with self._lock:
+            self._entries.insert(0, entry)
+            self._enforce_limits()
+        return entry_id
+
+    def update(self, entry_id: str, **fields):
+        """Set fields on an entry (e.g. `rated=True`), wherever it is stored."""
+        with self._lock:
+            for entry in self._entries:
+                if entry["id"] != entry_id:
+                    continue
+                if entry.get("spilled"):
+                    full = self._read_spilled(entry_id)
+                    full.update(fields)
+                    self._write_spilled(full)
+                else:
+                    entry.update(fields)
+                    entry["size"] = self._estimate_size(entry)
+                    self._enforce_limits()
+                return
+
+    def clear(self):
+        """Remove every entry and its cached files."""
+        with self._lock:
+            for entry in self._entries:
+                self._remove_files(entry["id"])
+            self._entries = []
+
+    # ── reads ───────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def summaries(self) -> List[dict]:
+        """Return the id, title and thumbnail (None once spilled) of every entry, newest first."""
+        with self._lock:
+            return [
+                {"id": e["id"], "title": e["title"], "thumbnail": e.get("thumbnail")}
+                for e in self._entries
+            ]
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        """Return the full entry, reading it back from disk if it was spilled."""
+        with self._lock:
+            for entry in self._entries:
+                if entry["id"] == entry_id:
+                    return self._read_spilled(entry_id) if entry.get("spilled") else dict(entry)
+        return None
+
+    def full_image(self, entry_id: str) -> Optional[Image.Image]:
+        """Load the full-size image of an entry from the disk cache."""
+        path = self._image_path(entry_id)
+        if not os.path.exists(path):
+            return None
+        with Image.open(path) as image:
+            image.load()
+            return image
+
+    def image_bytes(self, entry_id: str) -> Optional[bytes]:
+        """The WebP-encoded full-size image of an entry, e.g. for `st.image`, without decoding it."""
+        path = self._image_path(entry_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def memory_usage(self) -> int:
+        """Estimated bytes held by in-memory entries."""
+        return sum(e["size"] for e in self._entries if not e.get("spilled"))
+
+    # ── internals ───────────────────────────────────────────────
+
+    def _image_path(self, entry_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{entry_id}.webp")
+
+    def _entry_path(self, entry_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{entry_id}.json")
+
+    @staticmethod
+    def _estimate_size(entry: dict) -> int:
+        fields = {k: v for k, v in entry.items() if k not in ("thumbnail", "size")}
+        return len(json.dumps(fields, default=str)) + len(entry.get("thumbnail") or b"")
+
+    def _write_spilled(self, entry: dict):
+        fields = {k: v for k, v in entry.items() if k not in ("thumbnail", "size", "spilled")}
+        with open(self._entry_path(entry["id"]), "w", encoding="utf-8") as f:
+            json.dump(fields, f, ensure_ascii=False, default=str)
+
+    def _read_spilled(self, entry_id: str) -> dict:
+        with open(self._entry_path(entry_id), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        entry["thumbnail"] = None
+        return entry
+
+    def _remove_files(self, entry_id: str):
+        for path in (self._image_path(entry_id), self._entry_path(entry_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _enforce_limits(self):
+        while len(self._entries) > self.max_entries:
+            self._remove_files(self._entries.pop()["id"])
+
+        # Spill oldest in-memory entries first; the newest entry always stays in memory
+        usage = self.memory_usage()
+        for position in range(len(self._entries) - 1, 0, -1):
+            if usage <= self.memory_cap_bytes:
+                break
+            entry = self._entries[position]
+            if entry.get("spilled"):
+                continue
+            self._write_spilled(entry)
+            usage -= entry["size"]
+            self._entries[position] = {"id": entry["id"], "title": entry["title"], "spilled": True, "size": 0}
@@ -0,0 +1,141 @@
+"""This module provides a record/replay layer for model calls (LLM chat completions, the
+Gemini reviewer and the shopping agent). Responses are stored in a local SQLite file
+keyed by a fingerprint of the request, so evaluation loops and benchmarks that re-issue
+the same calls can run offline, in seconds and deterministically.
+
+Modes (config.REPLAY_MODE, env LAZYCOOK_REPLAY):
+    passthrough  every call goes to the live model; nothing is read or written (default)
+    record       recorded responses are returned; misses call the live model and are recorded
+    replay       recorded responses only; a miss raises ReplayMiss instead of calling a model
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from src import config
+from src.telemetry import increment
+
+MODES = ("passthrough", "record", "replay")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key BLOB PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class ReplayMiss(KeyError):
+    """Raised in replay mode when no response was recorded for a request."""
+
+
+def fingerprint(kind: str, request: Any) -> bytes:
+    """16-byte digest of the call kind and its request, stable across processes."""
+    canonical = json.dumps({"kind": kind, "request": request}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+
+class ReplayCache:
+    """
+    Request fingerprint -> response store with record, replay and passthrough modes.
+
+    Values are JSON, zlib-compressed; keys are 16-byte digests (see `fingerprint`).
+    The database is only opened in record and replay mode.
+    """
+
+    def __init__(self, db_path: str, mode: str = "passthrough"):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file.
+            mode (str, optional): "passthrough", "record" or "replay". Defaults to "passthrough".
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown replay mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.db_path = db_path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._conn = None
+        if mode != "passthrough":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def lookup(self, kind: str, request: Any) -> Optional[Any]:
+        """
+        The recorded response for a request, or None if the live model should be called.
+
+        Raises:
+            ReplayMiss: In replay mode, when nothing was recorded for the request.
+        """
+        if self._conn is None:
+            return None
+        key = fingerprint(kind, request)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            increment("cache_hits_total", cache="replay", kind=kind)
+            return json.loads(zlib.decompress(row[0]))
+        increment("cache_misses_total", cache="replay", kind=kind)
+        if self.mode == "replay":
+            raise ReplayMiss(f"No recorded {kind} response for request {key.hex()} in {self.db_path}")
+        return None
+
+    def store(self, kind: str, request: Any, value: Any):
+        """Record a response (record mode only)."""
+        if self.mode != "record":
+            return
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, kind, value, created) VALUES (?, ?, ?, ?)",
+                               (fingerprint(kind, request), kind, data, time.time()))
+            self._conn.commit()
+
+    def call(self, kind: str, request: Any, fn: Callable[[], Any],
+             encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None) -> Any:
+        """
+        Return the recorded response for `request`, or call `fn()` and record its result.
+
+        Args:
+            kind (str): Call type, e.g. "chat" or "review"; part of the fingerprint.
+            request (Any): JSON-serializable description of everything that determines the response.
+            fn (Callable[[], Any]): Makes the live call.
+            encode (Callable, optional): Turns `fn`'s result into JSON; a None result is not recorded.
+            decode (Callable, optional): Turns a recorded value back into `fn`'s result type.
+        """
+        value = self.lookup(kind, request)
+        if value is not None:
+            return decode(value) if decode else value
+        result = fn()
+        encoded = encode(result) if encode and result is not None else result
+        if encoded is not None:
+            self.store(kind, request, encoded)
+        return result
+
+    def __len__(self) -> int:
+        if self._conn is None:
+            return 0
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+
+@lru_cache(maxsize=1)
+def get_replay_cache() -> ReplayCache:
+    """Return the process-wide replay cache configured from `config`."""
+    return ReplayCache(config.REPLAY_DB_PATH, config.REPLAY_MODE)
@@ -0,0 +1,176 @@
+"""This module provides shared parsing of LLM responses. The local Qwen models answer with
+a <think> reasoning block before the actual answer, and their JSON is not always clean:
+it can be wrapped in a code fence, surrounded by prose or have trailing commas. Here the
+reasoning is split off in one pass, JSON is read with a fast path for clean output and a
+single-scan repair for the common defects, and the result is validated into a pydantic
+model, so repairable output no longer costs a whole new generation attempt.
+
+Every parse is counted as `llm_parse_total{kind, outcome}` with outcome "ok" (clean),
+"repaired" (clean after repair) or "failed", so the failure rate per kind is
+failed / total."""
+
+import json
+import logging
+from typing import Any, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from src.telemetry import increment
+
+logger = logging.getLogger(__name__)
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class ResponseParseError(ValueError):
+    """Raised when a model response holds no usable JSON or does not validate."""
+
+
+def split_reasoning(text: str) -> Tuple[str, str]:
+    """
+    Split a response into its <think> block and the answer after it.
+
+    Args:
+        text (str): Raw model output.
+
+    Returns:
+        Tuple[str, str]: (reasoning, answer). A response without a <think> block is all
+            answer; one whose block was never closed (cut off by max_tokens) is all reasoning.
+    """
+    end = text.rfind(THINK_CLOSE)
+    if end >= 0:
+        reasoning = text[:end]
+        start = reasoning.find(THINK_OPEN)
+        if start >= 0:
+            reasoning = reasoning[start + len(THINK_OPEN):]
+        return reasoning.strip(), text[end + len(THINK_CLOSE):].strip()
+    stripped = text.strip()
+    if stripped.startswith(THINK_OPEN):
+        return stripped[len(THINK_OPEN):].strip(), ""
+    return "", stripped
+
+
+def strip_reasoning(text: str) -> str:
+    """The answer part of a response, without its <think> block."""
+    return split_reasoning(text)[1]
+
+
+def _repair_json(text: str) -> str:
+    """
+    Cut the first complete JSON object out of `text` and drop trailing commas, in one scan.
+
+    Code fences and prose around the object are skipped because only the characters from
+    the first '{' to its matching '}' are kept.
+
+    Raises:
+        ResponseParseError: If there is no object or it is not closed.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ResponseParseError("no JSON object in the response")
+    out = []
+    depth = 0
+    in_string = escaped = False
+    pending_comma = False
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch in " \t\r\n":
+            out.append(ch)
+            continue
+        if pending_comma:
+            if ch not in "}]":
+                out.append(",")
+            pending_comma = False
+        if ch == ",":
+            pending_comma = True
+            continue
+        out.append(ch)
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return "".join(out)
+    raise ResponseParseError("JSON object is not closed (truncated response?)")
+
+
+def extract_json(text: str) -> Tuple[Any, bool]:
+    """
+    Parse the JSON object in a response, after its <think> block.
+
+    Returns:
+        Tuple[Any, bool]: (value, repaired); `repaired` is False when the answer was clean JSON.
+
+    Raises:
+        ResponseParseError: If no JSON object can be read, even after repair.
+    """
+    answer = strip_reasoning(text)
+    if answer.startswith("{"):
+        try:
+            return json.loads(answer, strict=False), False
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(_repair_json(answer), strict=False), True
+    except json.JSONDecodeError as e:
+        raise ResponseParseError(f"invalid JSON: {e}") from e
+
+
+def parse_model(text: str, model: Type[M], kind: str) -> M:
+    """
+    Extract the JSON object from a response and validate it into `model`.
+
+    An object wrapped in a single key (e.g. {"recipe": {...}}) is unwrapped when the outer
+    object does not validate.
+
+    Args:
+        text (str): Raw model output.
+        model (Type[BaseModel]): Pydantic model to validate into, e.g. `Recipe`.
+        kind (str): Label for the parse counters, e.g. "recipe".
+
+    Raises:
+        ResponseParseError: If the response cannot be parsed or validated.
+    """
+    try:
+        value, repaired = extract_json(text)
+        try:
+            result = model.model_validate(value)
+        except ValidationError:
+            inner = list(value.values())[0] if isinstance(value, dict) and len(value) == 1 else None
+            if not isinstance(inner, dict):
+                raise
+            result, repaired = model.model_validate(inner), True
+    except (ResponseParseError, ValidationError) as e:
+        increment("llm_parse_total", kind=kind, outcome="failed")
+        logger.debug("Unparseable %s response:\n%s", kind, text)
+        raise ResponseParseError(f"Invalid {kind} format: {e}") from e
+    increment("llm_parse_total", kind=kind, outcome="repaired" if repaired else "ok")
+    return result
+
+
+def parse_text(text: str, kind: str) -> str:
+    """
+    The answer of a plain-text response, without its <think> block.
+
+    Raises:
+        ResponseParseError: If nothing is left after the reasoning (e.g. it was cut off).
+    """
+    answer = strip_reasoning(text)
+    if not answer:
+        increment("llm_parse_total", kind=kind, outcome="failed")
+        raise ResponseParseError(f"Empty {kind} response after the reasoning block")
+    increment("llm_parse_total", kind=kind, outcome="ok")
+    return answer
@@ -0,0 +1,124 @@
+"""This module splits the local memory-mapped recipe index into shards searched by one
+worker process each. Every worker maps the same vector file and scores only its range of
+rows, so a batch of queries is scattered to all shards in parallel and the per-shard top-k
+lists are merged in the parent. Workers share the file's pages through the OS page cache,
+so adding shards costs CPU cores, not memory."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.ingredient_filter import RecipeFilter
+from src.vector_index import LocalVectorIndex, merge_top_k
+
+# Per-process state of a shard worker
+_shard = {}
+
+
+def _init_shard(path: str, shard_no: int, n_shards: int, chunk_rows: int, blas_threads: int):
+    _shard.update(path=path, shard_no=shard_no, n_shards=n_shards, chunk_rows=chunk_rows,
+                  generation=None, index=None)
+    try:
+        # One BLAS thread per worker; the workers themselves provide the parallelism
+        from threadpoolctl import threadpool_limits
+        _shard["limits"] = threadpool_limits(blas_threads)
+    except ImportError:
+        pass
+
+
+def _search_shard(generation: int, n_rows: int, queries: np.ndarray, k: int,
+                  recipe_filter: Optional[RecipeFilter]) -> Tuple[np.ndarray, np.ndarray]:
+    if _shard["generation"] != generation:
+        # The index was appended to: remap and take this shard's share of the first n_rows rows
+        index = LocalVectorIndex(_shard["path"], _shard["chunk_rows"])
+        no, count = _shard["shard_no"], _shard["n_shards"]
+        _shard["index"] = index.slice(no * n_rows // count, (no + 1) * n_rows // count)
+        _shard["generation"] = generation
+    return _shard["index"].search(queries, k, recipe_filter)
+
+
+class ShardedVectorIndex:
+    """
+    LocalVectorIndex split into `n_shards` row ranges, each searched by its own process.
+
+    Has the same `search`/`query`/`append` interface as LocalVectorIndex, so it can be used
+    directly by `search_recipes` or as the main index of a SegmentedVectorIndex.
+    """
+
+    supports_prefilter = True
+
+    def __init__(self, path: str, n_shards: int, chunk_rows: int = 65536, blas_threads: int = 1):
+        """
+        Args:
+            path (str): Path prefix of the local index, e.g. config.RECIPE_VECTOR_INDEX_PATH.
+            n_shards (int): Number of shards and worker processes, usually the number of cores.
+            chunk_rows (int, optional): Rows scored per matrix multiply in each worker.
+            blas_threads (int, optional): BLAS threads per worker (needs threadpoolctl).
+        """
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.n_shards = n_shards
+        self.local = LocalVectorIndex(path, chunk_rows)
+        self.generation = 0
+        # spawn: workers start without the parent's models and threads
+        context = multiprocessing.get_context("spawn")
+        self._workers = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_shard,
+                                initargs=(path, no, n_shards, chunk_rows, blas_threads))
+            for no in range(n_shards)
+        ]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.local.ids
+
+    @property
+    def dim(self) -> int:
+        return self.local.dim
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def search(self, queries: np.ndarray, k: int,
+               recipe_filter: Optional[RecipeFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k search for a batch of queries across all shards.
+
+        Args:
+            queries (np.ndarray): Query vectors of shape (q, dim) or (dim,). Larger batches
+                amortize the inter-process overhead.
+            k (int): Results per query.
+            recipe_filter (RecipeFilter, optional): Allowed ids; applied inside each shard.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (ids, scores), each of shape (q, k'), best first.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        generation, n_rows = self.generation, len(self.local)
+        futures = [worker.submit(_search_shard, generation, n_rows, queries, k, recipe_filter)
+                   for worker in self._workers]
+        results: List[Tuple[np.ndarray, np.ndarray]] = [f.result() for f in futures]
+        return merge_top_k(results, k)
+
+    def query(self, vector, top_k: int, namespace: str = None, include_metadata: bool = False,
+              recipe_filter: Optional[RecipeFilter] = None) -> dict:
+        """Pinecone-compatible single query, as in LocalVectorIndex.query."""
+        ids, scores = self.search(np.asarray(vector, dtype=np.float32), top_k, recipe_filter)
+        return {"matches": [{"id": str(i), "score": float(s)} for i, s in zip(ids[0], scores[0])]}
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> "ShardedVectorIndex":
+        """
+        Append rows as in LocalVectorIndex.append; workers remap on their next search.
+
+        Returns:
+            ShardedVectorIndex: This index.
+        """
+        self.local = self.local.append(ids, vectors)
+        self.generation += 1
+        return self
+
+    def close(self):
+        for worker in self._workers:
+            worker.shutdown(wait=False)
@@ -3,6 +3,19 @@ import google.generativeai as genai
 from typing import List, Dict, Any, Optional, Tuple
 import json
 
+from src.replay_cache import get_replay_cache
+from src.telemetry import span
+
+AGENT_MODEL = "gemini-1.5-flash"
+
+
+def _content_dict(content) -> dict:
+    """A chat history entry (a Gemini `Content` proto, or a dict) as a plain dict."""
+    if isinstance(content, dict):
+        return content
+    to_dict = getattr(type(content), "to_dict", None)
+    return to_dict(content) if to_dict is not None else {"text": str(content)}
+
 class ShoppingListAgent:
     """
     A React-style shopping list agent that can perform multiple intelligent actions
@@ -254,13 +267,44 @@ class ShoppingListAgent:
     def _react_agent(self, user_text: str, history: List = None) -> Tuple[str, List]:
         """
         React-style agent that can perform multiple actions intelligently.
+
+        With record/replay enabled (see src.replay_cache), the model's turns and the
+        resulting chat history are recorded per request, keyed by the message, history and
+        the current shopping list. Replayed turns still run their tool calls locally, so the
+        list ends up in the same state, and the recorded history is returned as dicts, so
+        the next turn of a conversation is keyed exactly as when it was recorded.
         """
         if history is None:
             history = []
 
+        request = {
+            "model": AGENT_MODEL,
+            "system": self.system_prompt,
+            "history": [_content_dict(h) for h in history],
+            "message": user_text,
+            "shopping_list": list(self.shopping_list),
+        }
+        cache = get_replay_cache()
+        recorded = cache.lookup("shopping_agent", request)
+        if recorded is not None:
+            for turn in recorded["turns"]:
+                for call in turn["function_calls"]:
+                    self._call_tool(call["name"], call["args"])
+            return recorded["turns"][-1]["text"], recorded["history"]
+
+        text, chat_history, turns = self._run_agent(user_text, history)
+        cache.store("shopping_agent", request, {"turns": turns, "history": [_content_dict(h) for h in chat_history]})
+        return text, chat_history
+
+    def _call_tool(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        with span("agent_tool", tool=name):
+            return self.py_funcs[name](**args)
+
+    def _run_agent(self, user_text: str, history: List) -> Tuple[str, List, List[dict]]:
+        """Run the agent against Gemini; also returns the model's turns for the replay cache."""
         # Create the model with system prompt
         model = genai.GenerativeModel(
-            'gemini-1.5-flash',
+            AGENT_MODEL,
             tools=[genai.protos.Tool(function_declarations=self.function_declarations)],
             system_instruction=self.system_prompt,
             generation_config=genai.GenerationConfig(
@@ -272,7 +316,9 @@ class ShoppingListAgent:
         chat = model.start_chat(history=history)
 
         # Send user message
-        response = chat.send_message(user_text)
+        with span("agent_llm"):
+            response = chat.send_message(user_text)
+        turns = []
         
         # Continue conversation until no more function calls
         while True:
@@ -286,13 +332,16 @@ class ShoppingListAgent:
             if function_calls:
                 # Execute all function calls and prepare responses
                 function_responses = []
+                turn_calls = []
                 
                 for function_call in function_calls:
                     func_name = function_call.name
                     func_args = dict(function_call.args)
+                    # Proto repeated fields (e.g. "items") become plain lists for recording
+                    turn_calls.append({"name": func_name, "args": json.loads(json.dumps(func_args, default=list))})
 
                     # Execute the function
-                    result = self.py_funcs[func_name](**func_args)
+                    result = self._call_tool(func_name, func_args)
 
                     # Create function response
                     function_response = genai.protos.Part(
@@ -302,15 +351,18 @@ class ShoppingListAgent:
                         )
                     )
                     function_responses.append(function_response)
+                turns.append({"function_calls": turn_calls, "text": None})
 
                 # Send all function responses back to model
-                response = chat.send_message(function_responses)
+                with span("agent_llm"):
+                    response = chat.send_message(function_responses)
                 
             else:
                 # No more function calls, return final response
                 break
         
-        return response.text, chat.history
+        turns.append({"function_calls": [], "text": response.text})
+        return response.text, chat.history, turns
     
     def get_current_list(self) -> List[str]:
         """Get current shopping list."""
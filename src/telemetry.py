@@ -0,0 +1,246 @@
+"""This module provides lightweight tracing and metrics for the request pipeline: nested
+timing spans (retrieval, expansion, embedding, index query, generation attempts, review,
+image rendering, CLIP scoring, agent tool calls) and counters such as review attempts,
+approvals, cache hits and LLM token throughput. Spans are aggregated into latency
+histograms that can be served as Prometheus text, and can also be written as JSON lines.
+When tracing is disabled, `span` returns a shared no-op context manager, so instrumented
+code pays one attribute lookup and a function call."""
+
+import bisect
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src import config
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("lazycook_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class _NoopSpan:
+    """Returned by `span` when tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed operation; nested spans share the trace id of their outermost span."""
+
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "duration", "_token", "_telemetry")
+
+    def __init__(self, telemetry: "Telemetry", name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self._telemetry = telemetry
+
+    def set(self, **attrs):
+        """Attach attributes discovered while the span runs, e.g. `approved=True`."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = next(_span_ids)
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self._telemetry._finish(self)
+        return False
+
+
+class Telemetry:
+    """
+    Process-wide span histograms and counters, with optional JSON-lines export.
+
+    Counters are keyed by name and a sorted tuple of label pairs, e.g.
+    ("cache_hits_total", (("cache", "image_prompt"),)).
+    """
+
+    def __init__(self, enabled: bool = False, jsonl_path: str = None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+        self._histograms: Dict[str, list] = {}   # span name -> [per-bucket counts..., count, sum]
+        self._jsonl = None
+
+    def configure(self, enabled: bool = None, jsonl_path: str = None):
+        """Switch tracing on or off, or start writing spans as JSON lines to `jsonl_path`."""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if jsonl_path is not None and jsonl_path != self.jsonl_path:
+                if self._jsonl is not None:
+                    self._jsonl.close()
+                    self._jsonl = None
+                self.jsonl_path = jsonl_path
+
+    def span(self, name: str, **attrs):
+        """Context manager timing a block as a span named `name`; a no-op when disabled."""
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs)
+
+    def increment(self, name: str, value: float = 1.0, **labels):
+        """Add `value` to a counter; a no-op when disabled."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def record_llm_usage(self, model: str, usage: Optional[dict], seconds: float):
+        """
+        Count tokens from an OpenAI-style `usage` field and the time the call took, so
+        tokens/s per model is `llm_completion_tokens_total / llm_seconds_total`.
+        """
+        if not self.enabled or not usage:
+            return
+        self.increment("llm_prompt_tokens_total", usage.get("prompt_tokens", 0), model=model)
+        self.increment("llm_completion_tokens_total", usage.get("completion_tokens", 0), model=model)
+        self.increment("llm_seconds_total", seconds, model=model)
+        self.increment("llm_calls_total", model=model)
+
+    def tokens_per_second(self) -> Dict[str, float]:
+        """Completion tokens per second of LLM call time, per model."""
+        with self._lock:
+            tokens = {dict(l)["model"]: v for (n, l), v in self._counters.items() if n == "llm_completion_tokens_total"}
+            seconds = {dict(l)["model"]: v for (n, l), v in self._counters.items() if n == "llm_seconds_total"}
+        return {model: tokens[model] / seconds[model] for model in tokens if seconds.get(model)}
+
+    def _finish(self, span: Span):
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = [0] * (len(LATENCY_BUCKETS) + 2)
+            bucket = bisect.bisect_left(LATENCY_BUCKETS, span.duration)
+            if bucket < len(LATENCY_BUCKETS):
+                histogram[bucket] += 1
+            histogram[-2] += 1
+            histogram[-1] += span.duration
+            if self.jsonl_path:
+                if self._jsonl is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.jsonl_path)), exist_ok=True)
+                    self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+                self._jsonl.write(json.dumps({
+                    "trace_id": span.trace_id, "span_id": span.span_id, "parent_id": span.parent_id,
+                    "name": span.name, "start": time.time() - span.duration,
+                    "duration_ms": span.duration * 1000.0, "attrs": span.attrs,
+                }, default=str) + "\n")
+                self._jsonl.flush()
+
+    def snapshot(self) -> dict:
+        """Counters and per-span count/total seconds, e.g. for a health endpoint."""
+        with self._lock:
+            counters = {
+                name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""): value
+                for (name, labels), value in self._counters.items()
+            }
+            spans = {name: {"count": h[-2], "seconds": h[-1]} for name, h in self._histograms.items()}
+        return {"counters": counters, "spans": spans, "llm_tokens_per_second": self.tokens_per_second()}
+
+    def prometheus_text(self) -> str:
+        """All counters and span histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((name, list(h)) for name, h in self._histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"lazycook_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+        tokens_per_second = self.tokens_per_second()
+        if tokens_per_second:
+            lines.append("# TYPE lazycook_llm_tokens_per_second gauge")
+        for model, value in sorted(tokens_per_second.items()):
+            lines.append(f'lazycook_llm_tokens_per_second{{model="{model}"}} {value:g}')
+        if histograms:
+            lines.append("# TYPE lazycook_span_seconds histogram")
+        for name, histogram in histograms:
+            cumulative = itertools.accumulate(histogram[:len(LATENCY_BUCKETS)])
+            for bound, count in zip(LATENCY_BUCKETS, cumulative):
+                lines.append(f'lazycook_span_seconds_bucket{{span="{name}",le="{bound:g}"}} {count}')
+            lines.append(f'lazycook_span_seconds_bucket{{span="{name}",le="+Inf"}} {histogram[-2]}')
+            lines.append(f'lazycook_span_seconds_count{{span="{name}"}} {histogram[-2]}')
+            lines.append(f'lazycook_span_seconds_sum{{span="{name}"}} {histogram[-1]:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+telemetry = Telemetry(enabled=config.TRACING_ENABLED, jsonl_path=config.TRACE_JSONL_PATH)
+
+# Module-level shortcuts used by instrumented code
+span = telemetry.span
+increment = telemetry.increment
+
+
+def traced(name: str):
+    """Decorator running every call of the function inside a span named `name`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not telemetry.enabled:
+                return fn(*args, **kwargs)
+            with telemetry.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Count, mean and percentiles of latencies in seconds, reported in milliseconds."""
+    ms = np.asarray(latencies, dtype=np.float64) * 1000.0
+    if len(ms) == 0:
+        return {"n": 0}
+    return {
+        "n": int(len(ms)),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "min_ms": float(ms.min()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def configure_logging(level: str = None):
+    """Configure stdout logging for an entry point; DEBUG also shows raw model outputs."""
+    import logging
+
+    logging.basicConfig(level=(level or config.LOG_LEVEL).upper(), format="%(levelname)s %(name)s: %(message)s")
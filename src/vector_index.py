@@ -0,0 +1,242 @@
+"""This module provides a local, memory-mapped recipe vector index with the same `query`
+interface as the Pinecone index, so `search_recipes` can run against either. Unlike the
+remote index, the local one applies ingredient filters while it selects candidates:
+excluded rows are never scored and include filters restrict the scan to their rows."""
+
+import json
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.ingredient_filter import RecipeFilter
+
+
+class LocalVectorIndex:
+    """
+    Exact inner-product search over recipe embeddings stored as a float32 memmap.
+
+    Files: `<path>.f32` (rows sorted by id), `<path>.ids.npy` (sorted int64 ids) and
+    `<path>.json` (dimension). Pages are shared by every process that maps the same file.
+    """
+
+    supports_prefilter = True
+
+    def __init__(self, path: str, chunk_rows: int = 65536):
+        """
+        Args:
+            path (str): Path prefix written by `build`.
+            chunk_rows (int, optional): Rows scored per matrix multiply. Defaults to 65536.
+        """
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.ids = np.load(path + ".ids.npy")
+        if os.path.exists(path + ".json"):
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            self.dim = os.path.getsize(path + ".f32") // 4 // max(len(self.ids), 1)
+        self.vectors = (
+            np.memmap(path + ".f32", dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+            if len(self.ids) else np.zeros((0, 0), dtype=np.float32)
+        )
+
+    @staticmethod
+    def build(path: str, ids: np.ndarray, vectors: np.ndarray) -> "LocalVectorIndex":
+        """
+        Write the index files for (ids, vectors) and open them.
+
+        Args:
+            path (str): Path prefix of the index files.
+            ids (np.ndarray): Integer recipe ids.
+            vectors (np.ndarray): Embeddings of shape (n, dim), one row per id.
+
+        Returns:
+            LocalVectorIndex: The opened index.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        out = np.memmap(path + ".f32.tmp", dtype=np.float32, mode="w+", shape=(len(ids), vectors.shape[1]))
+        for start in range(0, len(order), 65536):
+            out[start:start + 65536] = np.asarray(vectors[order[start:start + 65536]], dtype=np.float32)
+        out.flush()
+        del out
+        os.replace(path + ".f32.tmp", path + ".f32")
+        _write_ids(path, ids[order], vectors.shape[1])
+        return LocalVectorIndex(path)
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> "LocalVectorIndex":
+        """
+        Append rows with ids above every existing id, e.g. a merged delta segment.
+
+        The vector file is extended in place, so mappings held by readers of the old
+        index stay valid; the id list is replaced atomically afterwards. Ids that are
+        already covered (from an interrupted earlier append) are skipped.
+
+        Returns:
+            LocalVectorIndex: A new index over the extended files.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        order = np.argsort(ids, kind="stable")
+        ids, vectors = ids[order], vectors[order]
+        new = np.isin(ids, self.ids, invert=True)
+        ids, vectors = ids[new], vectors[new]
+        if len(self.ids) and len(ids) and ids[0] <= self.ids[-1]:
+            # Ids below the current maximum: fall back to a full rewrite
+            return LocalVectorIndex.build(self.path, np.concatenate([self.ids, ids]),
+                                          np.concatenate([np.asarray(self.vectors), vectors]))
+        if len(ids) == 0:
+            return self
+        dim = vectors.shape[1]
+        with open(self.path + ".f32", "r+b") as f:
+            # Drop rows left behind by an interrupted append before extending the file
+            f.truncate(len(self.ids) * dim * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        _write_ids(self.path, np.concatenate([self.ids, ids]), dim)
+        return LocalVectorIndex(self.path, self.chunk_rows)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def slice(self, start: int, end: int) -> "LocalVectorIndex":
+        """A view of rows [start, end) sharing the same memory map, e.g. one shard."""
+        view = object.__new__(LocalVectorIndex)
+        view.path, view.chunk_rows, view.dim = self.path, self.chunk_rows, self.dim
+        view.ids = self.ids[start:end]
+        view.vectors = self.vectors[start:end]
+        return view
+
+    def rows_for(self, ids: np.ndarray) -> np.ndarray:
+        """Row numbers of the given ids; ids not in the index are skipped."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        rows[rows == len(self.ids)] = 0
+        return rows[self.ids[rows] == ids] if len(self.ids) else rows[:0]
+
+    def search(self, queries: np.ndarray, k: int,
+               recipe_filter: Optional[RecipeFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k search for one or more query vectors.
+
+        Args:
+            queries (np.ndarray): Query vectors of shape (q, dim) or (dim,).
+            k (int): Results per query.
+            recipe_filter (RecipeFilter, optional): Allowed ids; applied before ranking.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (ids, scores), each of shape (q, k'), best first,
+            where k' <= k if fewer rows pass the filter.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        rows = None
+        if recipe_filter is not None and recipe_filter.include is not None:
+            # Include filter: only the listed rows are scored at all
+            rows = self.rows_for(recipe_filter.include.to_array())
+            if recipe_filter.exclude:
+                rows = rows[~recipe_filter.exclude.contains_many(self.ids[rows])]
+        excluded = None
+        if rows is None and recipe_filter is not None and recipe_filter.exclude:
+            excluded = self.rows_for(recipe_filter.exclude.to_array())
+
+        n = len(self.ids) if rows is None else len(rows)
+        k = min(k, n)
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, n, self.chunk_rows):
+            if rows is None:
+                chunk_rows = np.arange(start, min(start + self.chunk_rows, n))
+                scores = np.asarray(self.vectors[start:start + self.chunk_rows]) @ queries.T
+                if excluded is not None:
+                    hit = excluded[(excluded >= start) & (excluded < start + self.chunk_rows)] - start
+                    scores[hit] = -np.inf
+            else:
+                chunk_rows = rows[start:start + self.chunk_rows]
+                scores = self.vectors[chunk_rows] @ queries.T
+            scores = scores.T
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_rows = np.concatenate([best_rows, np.broadcast_to(chunk_rows, scores.shape)], axis=1)
+            keep = min(k, merged_scores.shape[1])
+            top = np.argpartition(-merged_scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+            best_rows = np.take_along_axis(merged_rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = self.ids[np.take_along_axis(best_rows, order, axis=1)]
+        # Excluded rows only ever carry -inf; drop them if fewer than k rows passed the filter
+        valid = np.isfinite(best_scores).all(axis=0)
+        return best_ids[:, valid], best_scores[:, valid]
+
+    def query(self, vector, top_k: int, namespace: str = None, include_metadata: bool = False,
+              recipe_filter: Optional[RecipeFilter] = None) -> dict:
+        """
+        Pinecone-compatible single query. Metadata is not stored here; hydrate results
+        from the metadata store.
+
+        Returns:
+            dict: {"matches": [{"id": str, "score": float}, ...]}
+        """
+        ids, scores = self.search(np.asarray(vector, dtype=np.float32), top_k, recipe_filter)
+        return {"matches": [{"id": str(i), "score": float(s)} for i, s in zip(ids[0], scores[0])]}
+
+
+def _write_ids(path: str, ids: np.ndarray, dim: int):
+    with open(path + ".ids.npy.tmp", "wb") as f:
+        np.save(f, ids)
+    os.replace(path + ".ids.npy.tmp", path + ".ids.npy")
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump({"dim": int(dim)}, f)
+
+
+def merge_top_k(results: List[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge per-segment (ids, scores) results of shape (q, k_i) into the overall top k per query.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (ids, scores) of shape (q, min(k, sum k_i)), best first.
+    """
+    ids = np.concatenate([r[0] for r in results], axis=1)
+    scores = np.concatenate([r[1] for r in results], axis=1)
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return ids[:, :0], scores[:, :0]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(np.take_along_axis(ids, top, axis=1), order, axis=1), \
+        np.take_along_axis(top_scores, order, axis=1)
+
+
+def supports_prefilter(index) -> bool:
+    """Whether `index.query` accepts a `recipe_filter` applied during candidate selection."""
+    return getattr(index, "supports_prefilter", False)
+
+
+def open_vector_index():
+    """
+    Open the recipe vector index selected by `config.VECTOR_BACKEND`.
+
+    Returns:
+        The local memory-mapped index ("local", sharded across worker processes when
+        config.VECTOR_SHARDS > 1) or the Pinecone index ("pinecone").
+    """
+    # Imported here so shard worker processes, which import this module, do not load config/torch
+    from src import config
+
+    if config.VECTOR_BACKEND == "local":
+        if config.VECTOR_SHARDS > 1:
+            from src.sharded_index import ShardedVectorIndex
+
+            return ShardedVectorIndex(config.RECIPE_VECTOR_INDEX_PATH, config.VECTOR_SHARDS)
+        return LocalVectorIndex(config.RECIPE_VECTOR_INDEX_PATH)
+    from pinecone import Pinecone
+
+    return Pinecone(api_key=config.PINECONE_API_KEY).Index("lazycook")
@@ -1,6 +1,5 @@
 # app.py  – USE THIS WHOLE FILE OR MERGE THE CHUNK INTO YOUR EXISTING ONE
-import os, sys, warnings, asyncio, streamlit as st
-from pinecone import Pinecone
+import os, sys, time, warnings, asyncio, streamlit as st
 
 if sys.platform == "win32" and (3, 8, 0) <= sys.version_info < (3, 9, 0):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -10,16 +9,53 @@ warnings.filterwarnings("ignore", message=".*no running event loop.*")
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from src import config
-from src.rag import search_recipes
-from scripts.pipelines import generate_validated_recipe, image_pipeline
+from scripts.pipelines import recipe_job, RECIPE_JOB_STAGES
 from src.image_evaluation import load_clip_model
 from src.embedding_utils import load_embedding_model
 from src.shopping_agent import create_shopping_agent
+from src.metadata_store import open_metadata_store
+from src.feedback_store import open_feedback_store, build_feedback
+from src.popularity import open_popularity_prior
+from src.deduplication import load_alias_map
+from src.llm_interaction import Recipe
+from src.recipe_history import RecipeHistory
+from src.jobs import JobManager, DONE, FAILED, CANCELLED, FINISHED_STATES
+from src.vector_index import open_vector_index
+from src.online_index import open_online_index
+from src.rag import encode_queries, get_ingredient_index
+from src.telemetry import configure_logging
+
+configure_logging()
 
 # ── cached resources ─────────────────────────────────────────────
 @st.cache_resource(show_spinner=False)
 def init_pinecone():
-    return Pinecone(api_key=config.PINECONE_API_KEY).Index("lazycook")
+    return open_vector_index()
+
+@st.cache_resource(show_spinner=False)
+def load_metadata_store():
+    return open_metadata_store(config.RECIPE_METADATA_PATH)
+
+@st.cache_resource(show_spinner=False)
+def load_feedback_store():
+    return open_feedback_store(config.FEEDBACK_DB_PATH, config.FEEDBACK_JSON_PATH)
+
+@st.cache_resource(show_spinner=False)
+def load_popularity_prior():
+    # Registers itself as a listener, so new ratings update the ranking immediately
+    return open_popularity_prior(config.POPULARITY_PRIOR_PATH, load_feedback_store(), load_metadata_store(),
+                                 aliases=load_alias_map(config.RECIPE_ALIAS_PATH))
+
+@st.cache_resource(show_spinner=False)
+def load_online_index():
+    # Approved and highly rated recipes become searchable without re-running the embedding script
+    return open_online_index(init_pinecone(), load_metadata_store(), encode_queries,
+                             load_feedback_store(), get_ingredient_index())
+
+@st.cache_resource(show_spinner=False)
+def load_job_manager():
+    # shared by all sessions, so identical in-flight requests run only once
+    return JobManager(max_workers=config.JOB_WORKERS)
 
 @st.cache_resource(show_spinner=False)
 def load_clip_cached():
@@ -33,8 +69,19 @@ def load_embedding_cached():
 if "shopping_agent" not in st.session_state:
     st.session_state.shopping_agent = create_shopping_agent()
 
-if "recipes" not in st.session_state:
-    st.session_state.recipes = []          # will hold dicts {recipe, img, missing}
+if "history" not in st.session_state:
+    # thumbnails + recent entries in memory, full images and old entries on disk
+    st.session_state.history = RecipeHistory(
+        config.HISTORY_CACHE_DIR,
+        memory_cap_bytes=config.HISTORY_MEMORY_CAP_MB * 1024 * 1024,
+        max_entries=config.HISTORY_MAX_ENTRIES,
+    )
+    st.session_state.selected = None       # id of the entry rendered at full size
+
+if "jobs" not in st.session_state:
+    st.session_state.jobs = []             # ids of this session's background jobs, newest first
+
+history = st.session_state.history
 
 # ── sidebar: live shopping list ─────────────────────────────────
 with st.sidebar:
@@ -51,42 +98,97 @@ ingredients = st.text_input("What ingredients do you have?",
                             placeholder="e.g. eggs, milk, flour…")
 
 # ── generate button ─────────────────────────────────────────────
+jobs = load_job_manager()
+
 if st.button("Generate Recipe"):
     if not (question and ingredients):
         st.warning("Please fill both fields.")
         st.stop()
 
-    with st.spinner("Finding inspiration…"):
-        index = init_pinecone()
-        _emb = load_embedding_cached()
-        similar = search_recipes(question, ingredients, index=index, top_k=3)
-
-    with st.spinner("Cooking up your recipe…"):
-        recipe, missing = generate_validated_recipe(
-            question, ingredients, similar, config
-        )
-
-    with st.spinner("Painting a tasty image…"):
-        clip_model, clip_proc = load_clip_cached()
-        img = image_pipeline(
-            f"{recipe.title} with {', '.join(recipe.ingredients)}",
-            config, clip_model, clip_proc
+    # resources are loaded here so the job thread never touches Streamlit's cache
+    clip_model, clip_proc = load_clip_cached()
+    load_embedding_cached()
+    online = load_online_index()
+    job_id = jobs.submit(
+        (question.strip().lower(), ingredients.strip().lower()),
+        recipe_job, question, ingredients, online.index, config, clip_model, clip_proc,
+        prior=load_popularity_prior(), metadata_store=online.metadata_store, on_approved=online.add_recipe,
+        stages=RECIPE_JOB_STAGES,
+    )
+    if job_id not in st.session_state.jobs:
+        st.session_state.jobs.insert(0, job_id)
+
+# ── running jobs: partial results while the pipeline runs ──────
+STAGE_LABELS = {"retrieved": "Finding inspiration…", "recipe": "Cooking up your recipe…",
+                "image": "Painting a tasty image…"}
+
+for job_id in list(st.session_state.jobs):
+    job = jobs.get(job_id)
+    if job is None:
+        st.session_state.jobs.remove(job_id)
+        continue
+    question_, ingredients_ = job.key
+
+    if job.status == DONE:
+        # move the finished job into the history
+        recipe, missing = job.results["recipe"]
+        st.session_state.selected = history.add(
+            recipe, missing, job.results["image"],
+            question=question_, ingredients=ingredients_, retrieved=job.results["retrieved"],
         )
-
-    # save everything to history
-    st.session_state.recipes.insert(0, {
-        "recipe": recipe,
-        "missing": missing,
-        "image": img,
-    })
-
-# ── render all stored recipes ───────────────────────────────────
-for idx, entry in enumerate(st.session_state.recipes):
-    recipe = entry["recipe"]
+        st.session_state.jobs.remove(job_id)
+        continue
+
+    with st.container(border=True):
+        st.markdown(f"**{question_}** — *{ingredients_}*")
+        if job.status == FAILED:
+            st.error(f"Generation failed: {job.error}")
+        elif job.status == CANCELLED:
+            st.info("Cancelled.")
+        else:
+            st.progress(job.progress, text=STAGE_LABELS.get(job.current_stage, "Waiting for a free worker…"))
+
+        if "retrieved" in job.results:
+            st.caption("Inspiration: " + ", ".join(r["title"] for r in job.results["retrieved"]))
+        if "recipe" in job.results:
+            recipe, _ = job.results["recipe"]
+            st.subheader(recipe.title)
+            st.write("\n".join(f"• {i}" for i in recipe.ingredients))
+        if job.current_stage == "image" and job.preview is not None:
+            # low-res preview polled from the txt2img server while it renders
+            st.image(job.preview.to_bytes(config.IMAGE_DISPLAY_FORMAT, config.IMAGE_DISPLAY_QUALITY),
+                     caption=f"Rendering… {job.stage_progress:.0%}")
+
+        if job.status in FINISHED_STATES:
+            if st.button("Dismiss", key=f"dismiss_{job_id}"):
+                st.session_state.jobs.remove(job_id)
+                st.rerun()
+        elif st.button("Cancel", key=f"cancel_{job_id}"):
+            jobs.cancel(job_id)
+            st.rerun()
+
+# ── render stored recipes ───────────────────────────────────────
+# Only the selected entry is rendered in full; the rest show a title and thumbnail.
+summaries = history.summaries()
+if summaries and st.session_state.selected not in {e["id"] for e in summaries}:
+    st.session_state.selected = summaries[0]["id"]
+
+for summary in summaries:
+    entry_id = summary["id"]
+    if entry_id != st.session_state.selected:
+        thumb_col, title_col = st.columns([1, 4])
+        if summary["thumbnail"] is not None:
+            thumb_col.image(summary["thumbnail"])
+        if title_col.button(f"🍽️  {summary['title']}", key=f"open_{entry_id}"):
+            st.session_state.selected = entry_id
+            st.rerun()
+        continue
+
+    entry = history.get(entry_id)
+    recipe = Recipe(**entry["recipe"])
     missing = entry["missing"]
-    img     = entry["image"]
 
-    with st.expander(f"🍽️  {recipe.title}", expanded=(idx == 0)):
+    with st.expander(f"🍽️  {recipe.title}", expanded=True):
         st.subheader("Ingredients")
         st.write("\n".join(f"• {i}" for i in recipe.ingredients))
 
@@ -95,7 +197,7 @@ for idx, entry in enumerate(st.session_state.recipes):
 
             add_btn = st.button(
                 f"➕ Add to shopping list ({recipe.title})",
-                key=f"add_{idx}"
+                key=f"add_{entry_id}"
             )
             if add_btn:
                 with st.spinner("Updating shopping list…"):
@@ -114,8 +216,29 @@ for idx, entry in enumerate(st.session_state.recipes):
         st.subheader("Directions")
         st.write("\n".join(f"{i+1}. {step}" for i, step in enumerate(recipe.directions)))
 
+        img = history.image_bytes(entry_id) if entry["has_image"] else None
         if img is not None:
             st.image(img, caption=recipe.title)
         else:
             st.info("No image available.")
 
+        if entry.get("rated"):
+            st.caption("Thanks for your feedback!")
+        else:
+            with st.form(key=f"feedback_{entry_id}"):
+                rating = st.slider("Rate this recipe", 1, 5, 4)
+                liked = st.checkbox("I would cook this", value=True)
+                comment = st.text_input("Comments (optional)")
+                if st.form_submit_button("Send feedback"):
+                    load_popularity_prior()  # make sure the prior is listening
+                    load_feedback_store().add(build_feedback(
+                        recipe, entry["question"], entry["ingredients"], entry["retrieved"],
+                        rating, liked, comment,
+                    ))
+                    history.update(entry_id, rated=True)
+                    st.rerun()
+
+# ── poll while any job of this session is still running ────────
+if any(jobs.get(j) is not None and jobs.get(j).status not in FINISHED_STATES for j in st.session_state.jobs):
+    time.sleep(config.JOB_POLL_SECONDS)
+    st.rerun()
@@ -0,0 +1,93 @@
+"""Regression tests for the online index layer over a Pinecone-style index without a
+local metadata store, and for id assignment shared between processes."""
+
+import zlib
+
+import numpy as np
+import pytest
+
+from src import rag
+from src.fake_services import FakeVectorIndex
+from src.online_index import open_online_index
+
+DIM = 16
+
+ROWS = [
+    {"id": 0, "title": "Tomato Soup", "ingredients": ["tomato", "onion"], "directions": ["Simmer."]},
+    {"id": 1, "title": "Rice Pudding", "ingredients": ["rice", "milk", "sugar"], "directions": ["Bake."]},
+    {"id": 2, "title": "Garlic Bread", "ingredients": ["bread", "garlic", "butter"], "directions": ["Toast."]},
+    {"id": 3, "title": "Potato Bake", "ingredients": ["potato", "cream"], "directions": ["Bake."]},
+]
+
+NEW_RECIPE = {"title": "Saffron Risotto", "ingredients": ["rice", "saffron", "stock"], "directions": ["Stir."]}
+
+
+def _embed(texts):
+    vectors = np.array([[zlib.crc32(f"{text}|{i}".encode()) % 1000 / 1000 + 0.01 for i in range(DIM)]
+                        for text in texts], dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def search(monkeypatch):
+    monkeypatch.setattr(rag, "encode_queries", _embed)
+    monkeypatch.setattr(rag, "expand_query", lambda query, ingredients, expansion=None: query)
+    monkeypatch.setattr(rag, "build_recipe_filter", lambda query: None)
+
+    def run(index, metadata_store=None, top_k=3):
+        return rag.search_recipes("something for dinner", "", index, top_k=top_k, metadata_store=metadata_store)
+    return run
+
+
+def test_pinecone_without_metadata_store_keeps_index_metadata(search, tmp_path):
+    index = FakeVectorIndex(ROWS)
+    online = open_online_index(index, None, _embed, delta_path=str(tmp_path / "delta.sqlite"))
+
+    plain = search(index)
+    through_online = search(online.index, online.metadata_store)
+
+    assert len(plain) == 3
+    assert [r["title"] for r in through_online] == [r["title"] for r in plain]
+
+
+def test_recipes_added_online_are_hydrated_from_the_delta(search, tmp_path):
+    index = FakeVectorIndex(ROWS)
+    online = open_online_index(index, None, _embed, delta_path=str(tmp_path / "delta.sqlite"))
+
+    online.add_recipe(NEW_RECIPE)
+    titles = [r["title"] for r in search(online.index, online.metadata_store, top_k=len(ROWS) + 1)]
+
+    assert sorted(titles) == sorted([r["title"] for r in ROWS] + [NEW_RECIPE["title"]])
+
+
+def test_failed_add_can_be_retried(tmp_path):
+    calls = []
+
+    def flaky_embed(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("embedding server down")
+        return _embed(texts)
+
+    online = open_online_index(FakeVectorIndex(ROWS), None, flaky_embed, delta_path=str(tmp_path / "delta.sqlite"))
+
+    with pytest.raises(RuntimeError):
+        online.add_recipe(NEW_RECIPE)
+    recipe_id = online.add_recipe(NEW_RECIPE)
+
+    assert recipe_id is not None
+    assert online.metadata_store.get(recipe_id)["title"] == NEW_RECIPE["title"]
+    assert online.add_recipe(NEW_RECIPE) is None
+
+
+def test_processes_sharing_the_delta_get_distinct_ids(tmp_path):
+    delta_path = str(tmp_path / "delta.sqlite")
+    first = open_online_index(FakeVectorIndex(ROWS), None, _embed, delta_path=delta_path)
+    second = open_online_index(FakeVectorIndex(ROWS), None, _embed, delta_path=delta_path)
+
+    first_id = first.add_recipe(NEW_RECIPE)
+    second_id = second.add_recipe({**NEW_RECIPE, "title": "Mushroom Risotto"})
+
+    assert first_id != second_id
+    assert first.metadata_store.get(first_id)["title"] == NEW_RECIPE["title"]
+    assert first.metadata_store.get(second_id)["title"] == "Mushroom Risotto"